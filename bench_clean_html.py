@@ -0,0 +1,72 @@
+"""
+Бенчмарк clean_html: поточна реалізація (скомпільовані шаблони, проходи лише за наявності їхніх
+символів) проти попередньої (6 re.sub з компіляцією через кеш re + ~20 str.replace).
+
+Запуск:
+    python bench_clean_html.py
+    python bench_clean_html.py --sizes 1000 4000 --iterations 2000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bot.utils.html_sanitizer import clean_html
+
+def legacy_clean_html(text: str) -> str:
+    """Попередня реалізація — базова лінія для порівняння."""
+    if not text: return ""
+    text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
+    text = re.sub(r'#{1,6}\s?(.*)', r'<b>\1</b>', text)
+    text = re.sub(r'<(html|head|body|meta|doctype|style|script|link).*?>', '', text, flags=re.IGNORECASE | re.DOTALL)
+    text = re.sub(r'</(html|head|body|meta|style|script|link)>', '', text, flags=re.IGNORECASE)
+    text = text.replace("<ul>", "").replace("</ul>", "")
+    text = text.replace("<ol>", "").replace("</ol>", "")
+    text = text.replace("<li>", "• ").replace("</li>", "\n")
+    text = text.replace("<div>", "").replace("</div>", "\n")
+    text = text.replace("<p>", "").replace("</p>", "\n")
+    text = text.replace("<br>", "\n").replace("<br/>", "\n")
+    text = re.sub(r'<h[1-6]>(.*?)</h[1-6]>', r'<b>\1</b>\n', text)
+    text = text.replace("```html", "").replace("```", "")
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text.strip()
+
+PARAGRAPHS = [
+    "## Огляд\nКороткий підсумок відповіді з **ключовими** словами та поясненнями.\n",
+    "Звичайний абзац тексту без розмітки, який модель пише найчастіше. Він досить довгий, щоб бути типовим.\n\n",
+    "<ul><li>Перший пункт</li><li>Другий пункт з <b>жирним</b></li></ul>\n",
+    "<p>Абзац у HTML.</p><p>Ще один <i>абзац</i>.</p>\n",
+    "```html\n<code>print('hello')</code>\n```\n",
+    "<h3>Розділ</h3>Текст розділу з <a href=\"https://example.com\">посиланням</a>.<br>\n",
+]
+
+def synthetic_answer(size: int, seed: int = 42) -> str:
+    rnd = random.Random(seed)
+    parts, total = [], 0
+    while total < size:
+        part = rnd.choice(PARAGRAPHS)
+        parts.append(part)
+        total += len(part)
+    return "".join(parts)[:size]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 4_000, 40_000])
+    parser.add_argument("--iterations", type=int, default=0, help="0 — підібрати під розмір")
+    args = parser.parse_args()
+
+    print(f"{'chars':>7} {'legacy µs':>10} {'current µs':>10} {'speedup':>8}")
+    for size in args.sizes:
+        text = synthetic_answer(size)
+        assert clean_html(text) == legacy_clean_html(text), "outputs differ"
+        iterations = args.iterations or max(20, 2_000_000 // size)
+        legacy = min(timeit.repeat(lambda: legacy_clean_html(text), number=iterations, repeat=7)) / iterations * 1e6
+        current = min(timeit.repeat(lambda: clean_html(text), number=iterations, repeat=7)) / iterations * 1e6
+        print(f"{size:>7} {legacy:>10.1f} {current:>10.1f} {legacy / current:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Бенчмарк ContextManager.get_context на різних обсягах message_cache.
+
+Запуск:
+    python bench_context.py                      # 10k, 100k, 1M рядків
+    python bench_context.py --sizes 10000 50000 --iterations 300
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from bot.database.models import Base
+import bot.utils.context as context_module
+from bot.utils.context import ContextManager
+
+CHATS = 500
+USERS_PER_CHAT = 5
+SEED_BATCH = 50_000
+
+def seed_database(path: str, rows: int):
+    """Наповнює message_cache синтетичними даними за останні 30 днів."""
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+
+    rnd = random.Random(42)
+    now = datetime.now(timezone.utc)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=OFF;")
+
+    users = []
+    for chat_idx in range(CHATS):
+        chat_id = -(1000 + chat_idx) if chat_idx % 2 else 1000 + chat_idx
+        mode = '{"context_mode": "%s"}' % ("shared" if chat_idx % 4 else "personal")
+        users.append((chat_id, mode, "Prompt"))
+    conn.executemany("INSERT INTO users (id, settings, system_prompt) VALUES (?, ?, ?)", users)
+
+    inserted = 0
+    while inserted < rows:
+        batch = []
+        for _ in range(min(SEED_BATCH, rows - inserted)):
+            chat_idx = rnd.randrange(CHATS)
+            chat_id = users[chat_idx][0]
+            user_id = abs(chat_id) * 10 + rnd.randrange(USERS_PER_CHAT)
+            role = rnd.choice(("user", "assistant", "user", "assistant", "transcription"))
+            ts = now - timedelta(seconds=rnd.randrange(30 * 24 * 3600))
+            batch.append((user_id, chat_id, role, "x" * rnd.randrange(20, 400), ts.strftime("%Y-%m-%d %H:%M:%S.%f")))
+        conn.executemany(
+            "INSERT INTO message_cache (user_id, chat_id, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+            batch
+        )
+        inserted += len(batch)
+    conn.commit()
+    conn.close()
+    return users
+
+async def measure(path: str, users, iterations: int):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", echo=False)
+    context_module.AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    manager = ContextManager()
+    rnd = random.Random(7)
+
+    # Прогрів з'єднання та кешу сторінок
+    await manager.get_context(user_id=1, chat_id=users[0][0])
+
+    samples = []
+    for _ in range(iterations):
+        chat_id = users[rnd.randrange(len(users))][0]
+        user_id = abs(chat_id) * 10 + rnd.randrange(USERS_PER_CHAT)
+        started = time.perf_counter()
+        await manager.get_context(user_id=user_id, chat_id=chat_id)
+        samples.append((time.perf_counter() - started) * 1000)
+
+    await engine.dispose()
+    samples.sort()
+    return {
+        "p50": statistics.median(samples),
+        "p95": samples[int(len(samples) * 0.95) - 1],
+        "mean": statistics.fmean(samples)
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="get_context latency benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} | {'p50 ms':>8} | {'p95 ms':>8} | {'mean ms':>8} | seed s")
+    print("-" * 52)
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            seed_started = time.perf_counter()
+            users = seed_database(path, size)
+            seed_time = time.perf_counter() - seed_started
+            res = await measure(path, users, args.iterations)
+            print(f"{size:>10} | {res['p50']:>8.2f} | {res['p95']:>8.2f} | {res['mean']:>8.2f} | {seed_time:.1f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+"""
+Бенчмарк download_media_direct на локальному HTTP-фікстурі (без мережі).
+Порівнює старий двопрохідний варіант (extract_info двічі), однопрохідний та повтор з info_cache.
+
+Запуск:
+    python bench_downloader.py                      # 5 MB файл, затримка сервера 50 мс
+    python bench_downloader.py --size-mb 20 --latency-ms 150 --iterations 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import yt_dlp
+from bot.utils import downloader
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    """Статичний файл з фіксованою затримкою відповіді (імітація RTT до YouTube/Twitter)."""
+    latency = 0.0
+    requests = 0
+
+    def _delay(self):
+        type(self).requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def do_GET(self):
+        self._delay()
+        super().do_GET()
+
+    def do_HEAD(self):
+        self._delay()
+        super().do_HEAD()
+
+    def copyfile(self, source, outputfile):
+        # Екстрактор закриває з'єднання після перших байтів (детект типу) — це не помилка
+        try:
+            super().copyfile(source, outputfile)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+def start_fixture_server(directory: str, latency: float):
+    FixtureHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(FixtureHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def legacy_two_pass(url: str, out_dir: str):
+    """Стара реалізація: посилання резолвиться двічі."""
+    with yt_dlp.YoutubeDL(downloader.build_ydl_opts(out_dir)) as ydl:
+        ydl.extract_info(url, download=False)
+        info = ydl.extract_info(url, download=True)
+        return ydl.prepare_filename(info)
+
+def run(mode: str, url: str, out_dir: str):
+    if mode == "two-pass":
+        return legacy_two_pass(url, out_dir)
+    if mode == "single-pass":
+        downloader.info_cache.clear()
+    result = downloader.download_sync(url, out_dir)
+    return result and result["path"]
+
+_build_opts = downloader.build_ydl_opts
+downloader.build_ydl_opts = lambda out_dir: {**_build_opts(out_dir), "noprogress": True}
+
+async def main():
+    parser = argparse.ArgumentParser(description="yt-dlp extraction overhead benchmark (offline)")
+    parser.add_argument("--size-mb", type=float, default=5)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as served, tempfile.TemporaryDirectory() as out_dir:
+        with open(os.path.join(served, "clip.mp4"), "wb") as f:
+            f.write(os.urandom(int(args.size_mb * 1024 * 1024)))
+        server = start_fixture_server(served, args.latency_ms / 1000)
+        url = f"http://127.0.0.1:{server.server_address[1]}/clip.mp4"
+
+        print(f"{'mode':>12} | {'p50 ms':>8} | {'mean ms':>8} | HTTP req/download")
+        print("-" * 54)
+        for mode in ("two-pass", "single-pass", "cached"):
+            downloader.info_cache.clear()
+            if mode == "cached":
+                run("single-pass", url, out_dir)  # прогрів кешу метаданих
+            samples, requests = [], []
+            for _ in range(args.iterations):
+                for name in os.listdir(out_dir):
+                    os.remove(os.path.join(out_dir, name))
+                FixtureHandler.requests = 0
+                started = time.perf_counter()
+                path = await asyncio.get_running_loop().run_in_executor(None, run, mode, url, out_dir)
+                samples.append((time.perf_counter() - started) * 1000)
+                requests.append(FixtureHandler.requests)
+                assert path and os.path.exists(path), f"{mode}: download failed"
+            print(f"{mode:>12} | {statistics.median(samples):>8.1f} | {statistics.fmean(samples):>8.1f} | {statistics.fmean(requests):.1f}")
+        server.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""
+Мікробенчмарк накопичення стрімінгової відповіді на синтетичних потоках 1k/10k/100k токенів.
+
+legacy   — full += chunk, StreamRenderer тримає посилання на попередній рядок (як update(str)),
+           тому "+=" щоразу копіює весь текст; наприкінці clean_html по всій відповіді.
+buffer   — StreamBuffer(sanitize=True): шматки в списку, завершені рядки чистяться одразу,
+           наприкінці доробляється лише хвіст.
+Обидва варіанти однаково "показують" текст кожні --render-every токенів (як правки повідомлення).
+
+Запуск:
+    python bench_stream_accumulator.py
+    python bench_stream_accumulator.py --sizes 1000 10000 --repeat 5
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bot.utils.html_sanitizer import clean_html
+from bot.utils.stream_renderer import StreamBuffer, CURSOR
+
+WORDS = ["привіт", "світ", "**жирний**", "текст", "C#", "код", "<code>x</code>", "і", "далі", "слово"]
+
+def synthetic_tokens(count: int, seed: int = 42) -> list:
+    """Токени по 1-3 слова, з переносами рядків і заголовками, як у відповіді моделі."""
+    rnd = random.Random(seed)
+    tokens = []
+    for i in range(count):
+        roll = rnd.random()
+        if roll < 0.05:
+            tokens.append("\n\n## ")
+        elif roll < 0.15:
+            tokens.append("\n")
+        else:
+            tokens.append(" " + " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(1, 3))))
+    return tokens
+
+def run_legacy(tokens: list, render_every: int) -> str:
+    full = ""
+    pending = None
+    for i, chunk in enumerate(tokens):
+        full += chunk
+        pending = full  # посилання, яке тримав рендерер
+        if i % render_every == 0:
+            _ = pending + CURSOR
+    return clean_html(full)
+
+def run_buffer(tokens: list, render_every: int) -> str:
+    buffer = StreamBuffer(sanitize=True)
+    for i, chunk in enumerate(tokens):
+        buffer.append(chunk)
+        if i % render_every == 0:
+            _ = buffer.text() + CURSOR
+    return buffer.sanitized()
+
+def timed(func, tokens, render_every, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(tokens, render_every)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--render-every", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'tokens':>8} {'chars':>9} {'legacy ms':>10} {'buffer ms':>10} {'speedup':>8}")
+    for size in args.sizes:
+        tokens = synthetic_tokens(size)
+        legacy_ms, legacy = timed(run_legacy, tokens, args.render_every, args.repeat)
+        buffer_ms, buffered = timed(run_buffer, tokens, args.render_every, args.repeat)
+        assert legacy == buffered, "sanitized output differs"
+        chars = sum(map(len, tokens))
+        print(f"{size:>8} {chars:>9} {legacy_ms:>10.2f} {buffer_ms:>10.2f} {legacy_ms / buffer_ms:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
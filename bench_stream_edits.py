@@ -0,0 +1,117 @@
+"""
+Бенчмарк правок повідомлення під час стрімінгу відповіді: стара політика (правка кожні 80 символів)
+проти StreamRenderer. Фейковий Telegram відповідає із затримкою і кидає RetryAfter, якщо в чат
+іде більше правок, ніж дозволяє ліміт (за замовчуванням 1/с з невеликим запасом).
+
+Запуск:
+    python bench_stream_edits.py                         # 2000 символів, ~400 символів/с
+    python bench_stream_edits.py --chars 3000 --rate 1500 --chat-id -100
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from telegram.error import RetryAfter
+from bot.utils.stream_renderer import ChatEditLimiter, RendererStats, StreamRenderer
+
+CHUNK = 6
+
+class FakeTelegram:
+    """Повідомлення з лімітом правок: понад limit за window секунд — RetryAfter на retry_after секунд."""
+
+    def __init__(self, chat_id: int, latency: float, limit: int, window: float, retry_after: int):
+        self.chat_id = chat_id
+        self.latency = latency
+        self.limit = limit
+        self.window = window
+        self.retry_after = retry_after
+        self.recent = deque()
+        self.blocked_until = 0.0
+        self.calls = 0
+        self.flood = 0
+        self.visible = []  # (час, довжина показаного тексту)
+
+    async def edit_text(self, text, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        now = time.monotonic()
+        while self.recent and now - self.recent[0] > self.window:
+            self.recent.popleft()
+        if now < self.blocked_until or len(self.recent) >= self.limit:
+            self.flood += 1
+            self.blocked_until = max(self.blocked_until, now + self.retry_after)
+            raise RetryAfter(self.retry_after)
+        self.recent.append(now)
+        self.visible.append((now, len(text)))
+
+async def model(chars: int, rate: float, produced: list):
+    delay = CHUNK / rate
+    for _ in range(chars // CHUNK):
+        await asyncio.sleep(delay)
+        produced.append(time.monotonic())
+        yield "x" * CHUNK
+
+async def run_legacy(message, chunks):
+    full, last = "", 0
+    async for chunk in chunks:
+        full += chunk
+        if len(full) - last > 80:
+            try:
+                await message.edit_text(full + " ▌")
+                last = len(full)
+            except Exception:
+                pass
+
+async def run_renderer(message, chunks):
+    renderer = StreamRenderer(message, limiter=ChatEditLimiter(), stats=RendererStats())
+    full = ""
+    async for chunk in chunks:
+        full += chunk
+        renderer.update(full)
+    await renderer.finish()
+
+def staleness_ms(produced: list, visible: list) -> float:
+    """Середнє відставання показаного тексту від згенерованого (по кожному шматку до кінця стріму)."""
+    end = produced[-1]
+    lags = []
+    for i, at in enumerate(produced):
+        needed = (i + 1) * CHUNK
+        shown = next((t for t, length in visible if length >= needed), end)
+        lags.append(max(0.0, min(shown, end) - at))
+    return statistics.mean(lags) * 1000
+
+async def measure(name: str, runner, args):
+    message = FakeTelegram(args.chat_id, args.latency, args.limit, args.window, args.retry_after)
+    produced = []
+    start = time.monotonic()
+    await runner(message, model(args.chars, args.rate, produced))
+    first = (message.visible[0][0] - start) * 1000 if message.visible else float("nan")
+    print(
+        f"{name:<10} calls={message.calls:<4} shown={len(message.visible):<4} flood={message.flood:<4} "
+        f"first_paint={first:7.1f} ms  staleness={staleness_ms(produced, message.visible):7.1f} ms  "
+        f"total={(time.monotonic() - start) * 1000:7.1f} ms"
+    )
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chars", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=400, help="символів/с від моделі")
+    parser.add_argument("--chat-id", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.08, help="затримка API правки, с")
+    parser.add_argument("--limit", type=int, default=3, help="правок у вікні до RetryAfter")
+    parser.add_argument("--window", type=float, default=2.0)
+    parser.add_argument("--retry-after", type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"{args.chars} chars at {args.rate:.0f} chars/s, chat {args.chat_id}, edit latency {args.latency * 1000:.0f} ms")
+    await measure("legacy", run_legacy, args)
+    await measure("renderer", run_renderer, args)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+"""
+Бенчмарк виконання інструментів одного ходу моделі: послідовні await (як було) проти run_tool_calls.
+Інструменти імітуються sleep із затримками, типовими для web_search (~1-2 с) та calculate_date (~0).
+
+Запуск:
+    python bench_tool_calls.py
+    python bench_tool_calls.py --searches 1 2 3 4 --latency 1.5
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bot.ai.tool_runner import ToolRunStats, run_tool_calls
+
+def make_turn(searches: int, latency: float, seed: int = 42) -> list:
+    rnd = random.Random(seed)
+    calls = [{"id": f"s{i}", "name": "web_search", "delay": latency * rnd.uniform(0.5, 1.5)} for i in range(searches)]
+    calls.append({"id": "d", "name": "calculate_date", "delay": 0.001})
+    return calls
+
+async def execute(call):
+    await asyncio.sleep(call["delay"])
+    return call["id"]
+
+async def sequential(calls):
+    return [await execute(call) for call in calls]
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--searches", type=int, nargs="+", default=[1, 2, 3, 5])
+    parser.add_argument("--latency", type=float, default=0.5, help="середня затримка пошуку, с")
+    args = parser.parse_args()
+
+    print(f"{'tools':>6} {'sequential s':>13} {'gather s':>9} {'saved s':>8}")
+    for searches in args.searches:
+        calls = make_turn(searches, args.latency)
+        start = time.perf_counter()
+        expected = await sequential(calls)
+        legacy = time.perf_counter() - start
+
+        stats = ToolRunStats()
+        start = time.perf_counter()
+        results = await run_tool_calls(calls, execute, lambda call, error: error, timeout=0, stats=stats)
+        current = time.perf_counter() - start
+        assert results == expected, "results out of order"
+        print(f"{len(calls):>6} {legacy:>13.2f} {current:>9.2f} {stats.stats()['saved_ms'] / 1000:>8.2f}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -6,6 +6,8 @@ import google.generativeai as genai
 from google.ai.generativelanguage import FunctionDeclaration, Tool, Schema, Type
 from bot.ai.base import LLMProvider
 from config import DEFAULT_SETTINGS, BOT_TIMEZONE
+from bot.utils.executors import media_executor
+from bot.utils.media import load_pil_image
 from bot.utils.search import perform_search, extract_source_links, format_sources_html
 from bot.utils.scheduler import scheduler_service
 from bot.utils.date_helper import calculate_future_date
@@ -178,8 +180,7 @@ class GoogleProvider(LLMProvider):
 
     async def analyze_image(self, image_path: str, prompt: str, messages: List[Dict[str, str]] = None, settings: Dict[str, Any] = None) -> AsyncGenerator[str, None]:
         try:
-            import PIL.Image
-            img = PIL.Image.open(image_path)
+            img = await media_executor.run(load_pil_image, image_path)
             model_name = settings.get('model', self.model_name) if settings else self.model_name
             model = genai.GenerativeModel(model_name)
             response = await model.generate_content_async([prompt, img], stream=True)
@@ -1,5 +1,4 @@
 import os
-import base64
 import json
 import logging
 import datetime
@@ -8,6 +7,9 @@ from datetime import timedelta
 from typing import AsyncGenerator, List, Dict, Any
 from openai import AsyncOpenAI, APIError
 from bot.ai.base import LLMProvider
+from bot.ai.tool_runner import run_tool_calls
+from bot.utils.executors import media_executor
+from bot.utils.media import read_image_base64
 from bot.utils.search import perform_search, extract_source_links, format_sources_html
 from bot.utils.scheduler import scheduler_service
 from bot.utils.date_helper import calculate_future_date
@@ -158,15 +160,14 @@ class OpenAIProvider(LLMProvider):
                 tool_calls_list = [tool_calls_buffer[i] for i in sorted(tool_calls_buffer.keys())]
                 local_messages.append({"role": "assistant", "tool_calls": [{"id": tc["id"], "type": "function", "function": {"name": tc["name"], "arguments": tc["arguments"]}} for tc in tool_calls_list]})
 
-                should_stop_stream = False
-                for tc in tool_calls_list:
+                async def execute_tool(tc):
+                    """(content для моделі, повідомлення користувачу або None, чи зупинити стрім)."""
                     name, args = tc["name"], json.loads(tc["arguments"])
-                    content = ""
                     logger.info(f"🤖 OpenAI Tool: {name} | Args: {args}")
 
                     if name == "calculate_date":
-                        content = calculate_future_date(args.get("local_datetime"), user_tz_name)
-                    elif name == "schedule_reminder":
+                        return calculate_future_date(args.get("local_datetime"), user_tz_name), None, False
+                    if name == "schedule_reminder":
                         try:
                             iso_utc = args.get("iso_time_utc")
                             text = args.get("text")
@@ -175,15 +176,29 @@ class OpenAIProvider(LLMProvider):
                             l_dt = dt_utc.astimezone(tz)
                             days = {"Monday":"Пн","Tuesday":"Вт","Wednesday":"Ср","Thursday":"Чт","Friday":"Пт","Saturday":"Сб","Sunday":"Нд"}
                             d_name = days.get(l_dt.strftime("%A"), l_dt.strftime("%a"))
-                            yield f"\n✅ <b>Встановлено:</b> {d_name}, {l_dt.strftime('%d.%m %H:%M')}\n📝 <i>{text}</i>"
-                            content, should_stop_stream = "DONE", True
-                        except Exception as e: content = f"ERROR: {e}"
-                    elif name == "delete_reminder":
+                            notice = f"\n✅ <b>Встановлено:</b> {d_name}, {l_dt.strftime('%d.%m %H:%M')}\n📝 <i>{text}</i>"
+                            return "DONE", notice, True
+                        except Exception as e: return f"ERROR: {e}", None, False
+                    if name == "delete_reminder":
                         success = await scheduler_service.delete_reminder_by_id(args.get("reminder_id"))
-                        content = "Deleted" if success else "Not found"
-                    elif name == "web_search":
-                        yield "\n🔎 <i>Шукаю...</i>\n"
-                        content = await perform_search(args.get("query"))
+                        return ("Deleted" if success else "Not found"), None, False
+                    if name == "web_search":
+                        return await perform_search(args.get("query")), None, False
+                    return "", None, False
+
+                if any(tc["name"] == "web_search" for tc in tool_calls_list):
+                    yield "\n🔎 <i>Шукаю...</i>\n"
+
+                # Незалежні виклики ходу виконуються конкурентно, результати — у порядку моделі
+                results = await run_tool_calls(
+                    tool_calls_list, execute_tool, lambda tc, error: (f"ERROR: {error}", None, False)
+                )
+
+                should_stop_stream = False
+                for tc, (content, notice, stop) in zip(tool_calls_list, results):
+                    if notice: yield notice
+                    should_stop_stream = should_stop_stream or stop
+                    if tc["name"] == "web_search":
                         for link in extract_source_links(str(content)):
                             if link not in collected_source_urls and len(collected_source_urls) < 5:
                                 collected_source_urls.append(link)
@@ -248,8 +263,7 @@ class OpenAIProvider(LLMProvider):
         if model not in ['gpt-4o-mini', 'gpt-4o', 'gpt-4-turbo']:
             model = 'gpt-4o-mini'
         try:
-            with open(image_path, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode('utf-8')
+            b64 = await media_executor.run(read_image_base64, image_path)
             msg = [{"role": "user", "content": [{"type": "text", "text": prompt}, {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{b64}"}}]}]
             stream = await self.client.chat.completions.create(model=model, messages=msg, max_tokens=1000, stream=True)
             async for chunk in stream:
@@ -1,5 +1,4 @@
 import os
-import base64
 import json
 import logging
 import datetime
@@ -8,6 +7,9 @@ from datetime import timedelta
 from typing import AsyncGenerator, List, Dict, Any, Optional
 from openai import AsyncOpenAI, APIError
 from bot.ai.base import LLMProvider
+from bot.ai.tool_runner import run_tool_calls
+from bot.utils.executors import media_executor
+from bot.utils.media import read_image_base64
 from bot.utils.search import perform_search, extract_source_links, format_sources_html
 from bot.utils.scheduler import scheduler_service
 from bot.utils.date_helper import calculate_future_date
@@ -207,41 +209,46 @@ class OpenRouterProvider(LLMProvider):
                     ]
                 })
 
-                for tc_data in tool_calls_buffer.values():
+                async def execute_tool(tc_data):
+                    """(JSON-результат для моделі, знайдені посилання на джерела)."""
                     fn_name = tc_data["name"]
                     try:
                         args = json.loads(tc_data["arguments"])
                     except Exception:
                         args = {}
 
-                    fn_result = "error"
-                    try:
-                        if fn_name == "calculate_date":
-                            iso_res = calculate_future_date(args.get("local_datetime"), user_tz_name)
-                            fn_result = json.dumps({"iso_time_utc": iso_res} if iso_res else {"error": "Invalid date"})
+                    if fn_name == "calculate_date":
+                        iso_res = calculate_future_date(args.get("local_datetime"), user_tz_name)
+                        return json.dumps({"iso_time_utc": iso_res} if iso_res else {"error": "Invalid date"}), []
 
-                        elif fn_name == "schedule_reminder":
-                            if not chat_id:
-                                fn_result = json.dumps({"error": "No chat_id"})
-                            else:
-                                dt = datetime.datetime.fromisoformat(args.get("iso_time_utc"))
-                                rem_id = await scheduler_service.add_reminder(chat_id, user_id, dt, args.get("text"))
-                                fn_result = json.dumps({"success": True, "reminder_id": rem_id})
-
-                        elif fn_name == "delete_reminder":
-                            success = await scheduler_service.delete_reminder(args.get("reminder_id"))
-                            fn_result = json.dumps({"success": success})
-
-                        elif fn_name == "web_search":
-                            q = args.get("query")
-                            raw_search_res = await perform_search(q)
-                            extracted = extract_source_links(raw_search_res)
-                            for link in extracted:
-                                if link not in collected_source_urls:
-                                    collected_source_urls.append(link)
-                            fn_result = json.dumps({"results": raw_search_res[:1500]})
-                    except Exception as err:
-                        fn_result = json.dumps({"error": str(err)})
+                    if fn_name == "schedule_reminder":
+                        if not chat_id:
+                            return json.dumps({"error": "No chat_id"}), []
+                        dt = datetime.datetime.fromisoformat(args.get("iso_time_utc"))
+                        rem_id = await scheduler_service.add_reminder(chat_id, user_id, dt, args.get("text"))
+                        return json.dumps({"success": True, "reminder_id": rem_id}), []
+
+                    if fn_name == "delete_reminder":
+                        success = await scheduler_service.delete_reminder(args.get("reminder_id"))
+                        return json.dumps({"success": success}), []
+
+                    if fn_name == "web_search":
+                        raw_search_res = await perform_search(args.get("query"))
+                        return json.dumps({"results": raw_search_res[:1500]}), extract_source_links(raw_search_res)
+
+                    return "error", []
+
+                # Незалежні виклики ходу виконуються конкурентно, результати — у порядку моделі
+                tool_calls_list = list(tool_calls_buffer.values())
+                results = await run_tool_calls(
+                    tool_calls_list, execute_tool, lambda tc_data, error: (json.dumps({"error": error}), [])
+                )
+
+                for tc_data, (fn_result, links) in zip(tool_calls_list, results):
+                    fn_name = tc_data["name"]
+                    for link in links:
+                        if link not in collected_source_urls:
+                            collected_source_urls.append(link)
 
                     local_messages.append({
                         "role": "tool",
@@ -282,8 +289,7 @@ class OpenRouterProvider(LLMProvider):
     ) -> AsyncGenerator[str, None]:
         model = (settings or {}).get('model', self.default_model)
         try:
-            with open(image_path, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode('utf-8')
+            b64 = await media_executor.run(read_image_base64, image_path)
 
             ext = os.path.splitext(image_path)[1].lower().replace(".", "")
             mime = f"image/{ext}" if ext in ["jpeg", "jpg", "png", "webp", "gif"] else "image/jpeg"
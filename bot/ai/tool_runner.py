@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from config import AI_TOOL_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Інструменти, що змінюють стан (нагадування): між собою виконуються по черзі, у порядку моделі
+SERIAL_TOOLS = frozenset({"schedule_reminder", "delete_reminder"})
+
+class ToolRunStats:
+    """Сумарні лічильники виконання інструментів (для /stats)."""
+
+    def __init__(self):
+        self.batches = 0
+        self.parallel_batches = 0
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+        # Сума тривалостей окремих викликів — стільки тривало б послідовне виконання
+        self.busy_ms_total = 0.0
+        self.wall_ms_total = 0.0
+
+    def record(self, durations: List[float], wall_ms: float):
+        self.batches += 1
+        self.calls += len(durations)
+        if len(durations) > 1:
+            self.parallel_batches += 1
+        self.busy_ms_total += sum(durations)
+        self.wall_ms_total += wall_ms
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "parallel_batches": self.parallel_batches,
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "saved_ms": round(max(0.0, self.busy_ms_total - self.wall_ms_total)),
+            "avg_batch_ms": round(self.wall_ms_total / self.batches) if self.batches else 0,
+        }
+
+tool_stats = ToolRunStats()
+
+async def run_tool_calls(
+    calls: List[Dict[str, Any]],
+    execute: Callable[[Dict[str, Any]], Awaitable[Any]],
+    on_error: Callable[[Dict[str, Any], str], Any],
+    timeout: Optional[float] = None,
+    stats: Optional[ToolRunStats] = None,
+) -> List[Any]:
+    """
+    Виконує виклики інструментів одного ходу моделі конкурентно (asyncio.gather) замість послідовних await.
+    1. Аргументи всіх викликів ходу модель сформувала одночасно, тож вони незалежні: пошук і розрахунок
+       дати стартують разом; SERIAL_TOOLS виконуються однією гілкою по черзі, паралельно з рештою.
+    2. Кожен виклик обмежений timeout (0 — без обмеження); таймаут або виняток стають результатом
+       on_error(call, причина) і не зривають інші виклики.
+    3. Результати повертаються в порядку calls — повідомлення role=tool додаються так само, як раніше.
+    """
+    timeout = AI_TOOL_TIMEOUT_SECONDS if timeout is None else timeout
+    stats = stats or tool_stats
+    results: List[Any] = [None] * len(calls)
+    durations = [0.0] * len(calls)
+
+    async def run_one(i: int):
+        call = calls[i]
+        start = time.perf_counter()
+        try:
+            if timeout > 0:
+                results[i] = await asyncio.wait_for(execute(call), timeout)
+            else:
+                results[i] = await execute(call)
+        except asyncio.TimeoutError:
+            stats.timeouts += 1
+            logger.warning(f"⏱ Tool {call['name']} timed out after {timeout}s")
+            results[i] = on_error(call, f"timeout after {timeout}s")
+        except Exception as e:
+            stats.errors += 1
+            logger.error(f"Tool {call['name']} failed: {e}")
+            results[i] = on_error(call, str(e))
+        durations[i] = (time.perf_counter() - start) * 1000
+
+    async def run_serial(indexes: List[int]):
+        for i in indexes:
+            await run_one(i)
+
+    serial = [i for i, call in enumerate(calls) if call["name"] in SERIAL_TOOLS]
+    branches = [run_one(i) for i, call in enumerate(calls) if call["name"] not in SERIAL_TOOLS]
+    if serial:
+        branches.append(run_serial(serial))
+
+    start = time.perf_counter()
+    await asyncio.gather(*branches)
+    stats.record(durations, (time.perf_counter() - start) * 1000)
+    return results
@@ -0,0 +1,68 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+from .models import Base
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Індекси, які перекриваються новими складеними (або замінені ними) і лише сповільнюють запис
+OBSOLETE_INDEXES = (
+    "ix_message_cache_chat_id",
+    # (chat_id, [user_id,] timestamp, role): role між timestamp і rowid змушував досортовувати за id
+    "ix_message_cache_chat_ts",
+    "ix_message_cache_chat_user_ts",
+)
+
+def apply_schema_migrations(sync_conn):
+    """
+    Легка міграція схеми для вже існуючої bot.db.
+    create_all() створює лише відсутні таблиці, тому колонки та індекси, додані до моделей пізніше,
+    доводиться докатувати окремо. Викликається через run_sync одразу після create_all().
+    Нові колонки мають бути nullable або мати server_default (вимога ALTER TABLE ADD COLUMN).
+    """
+    inspector = inspect(sync_conn)
+    existing_tables = set(inspector.get_table_names())
+    added_columns = set()
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {col["name"] for col in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                ddl = CreateColumn(column).compile(dialect=sync_conn.dialect)
+                sync_conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                added_columns.add(f"{table.name}.{column.name}")
+                logger.info(f"🛠 Migration: added column {table.name}.{column.name}")
+
+        existing_indexes = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(sync_conn)
+                logger.info(f"🛠 Migration: created index {index.name} on {table.name}")
+
+    for name in OBSOLETE_INDEXES:
+        sync_conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+    # Разова дата-міграція: лише коли колонка error щойно з'явилась, а не LIKE-скан на кожному старті
+    if "download_queue.error" in added_columns:
+        _split_legacy_queue_errors(sync_conn)
+
+def _split_legacy_queue_errors(sync_conn):
+    """
+    Старі записи черги зберігали помилку прямо в link: "USERBOT_ERROR:{bot}:{msg}###{link}".
+    Розкладаємо їх у колонки donor/error, повертаючи в link оригінальне посилання.
+    """
+    rows = sync_conn.execute(
+        text("SELECT id, link FROM download_queue WHERE link LIKE 'USERBOT_ERROR:%'")
+    ).all()
+    for row_id, link in rows:
+        payload, _, original = link.rpartition("###")
+        _, _, rest = payload.partition(":")
+        donor, _, error = rest.partition(":")
+        sync_conn.execute(
+            text("UPDATE download_queue SET link = :link, donor = :donor, error = :error WHERE id = :id"),
+            {"link": original, "donor": donor or None, "error": error or None, "id": row_id}
+        )
+    if rows:
+        logger.info(f"🛠 Migration: moved {len(rows)} legacy USERBOT_ERROR links into download_queue.error")
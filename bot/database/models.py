@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, JSON, BigInteger, DateTime, Date, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, JSON, BigInteger, DateTime, Date, Float, UniqueConstraint, Index, text
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql import func
 
@@ -25,9 +25,22 @@ class APIKey(Base):
 
 class MessageCache(Base):
     __tablename__ = "message_cache"
+    __table_args__ = (
+        # Історія чату (shared): chat_id + діапазон часу. Без role в кінці: за timestamp в індексі йде rowid,
+        # тож ORDER BY timestamp DESC, id DESC віддає сам індекс, без TEMP B-TREE (role перевіряється на рядку)
+        Index("ix_message_cache_chat_time", "chat_id", "timestamp"),
+        # Історія в особистому режимі (приватні чати та personal-групи)
+        Index("ix_message_cache_chat_user_time", "chat_id", "user_id", "timestamp"),
+        # get_last_transcription
+        Index("ix_message_cache_user_chat_role_ts", "user_id", "chat_id", "role", "timestamp"),
+        # Retention sweep
+        Index("ix_message_cache_timestamp", "timestamp"),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(BigInteger, ForeignKey("users.id"))
-    chat_id = Column(BigInteger, index=True)
+    # Без FK на рівні БД: у групах автор повідомлення може не мати запису в users
+    user_id = Column(BigInteger)
+    chat_id = Column(BigInteger)
     role = Column(String)
     content = Column(Text)
     media_file_id = Column(String, nullable=True)
@@ -36,13 +49,50 @@ class MessageCache(Base):
 class DownloadQueue(Base):
     """Черга завантажень для Userbot"""
     __tablename__ = "download_queue"
-    
+    __table_args__ = (
+        # Атомарний claim: pending або processing з простроченою орендою
+        Index("ix_download_queue_status_lease", "status", "lease_until"),
+        # Частковий індекс: лише активні pending-рядки, незалежно від розміру історії
+        Index(
+            "ix_download_queue_pending", "id",
+            sqlite_where=text("status = 'pending'"), postgresql_where=text("status = 'pending'")
+        ),
+    )
+
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(BigInteger) # ID чату
     message_id = Column(Integer, nullable=True)
     link = Column(String)
-    status = Column(String, default="pending")
+    status = Column(String, default="pending")  # pending | processing | done | error | timeout | failed_by_donor | dead
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Оренда (lease): хто взяв завдання і до коли; прострочена оренда повертає завдання в роботу
+    attempts = Column(Integer, default=0, server_default="0", nullable=False)
+    claimed_by = Column(String, nullable=True)
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
+    lease_until = Column(DateTime(timezone=True), nullable=True)
+    # Донор (призначається при постановці, за ним воркери userbot беруть завдання) і результат:
+    # чим закінчилось і коли. Час постановки — created_at: enqueue_download пише його з того ж
+    # годинника UTC застосунку, що й claimed_at/finished_at, тож різниця дає чесний turnaround
+    donor = Column(String, nullable=True)
+    error = Column(Text, nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    result_message_ids = Column(JSON, nullable=True)
+
+class DownloadQueueDaily(Base):
+    """Архів черги: добові лічильники завершених завдань (рядки download_queue після архівації видаляються)"""
+    __tablename__ = "download_queue_daily"
+    __table_args__ = (
+        UniqueConstraint("day", "status", "donor", name="uq_download_queue_daily"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    day = Column(Date, nullable=False)
+    status = Column(String, nullable=False)
+    donor = Column(String, nullable=False, default="")  # "" — донор невідомий (старі записи)
+    count = Column(Integer, nullable=False, default=0)
+    # Сума часу постановка -> результат (для середнього); рахується лише по рядках з обома мітками
+    turnaround_seconds = Column(Float, nullable=False, default=0.0)
+    turnaround_count = Column(Integer, nullable=False, default=0)
 
 class Reminder(Base):
     """Модель для нагадувань"""
@@ -74,7 +124,8 @@ class DailyTranscriptionUsage(Base):
     )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(BigInteger, ForeignKey("users.id"), index=True, nullable=False)
+    # Без FK на рівні БД: транскрибують і учасники груп без запису в users
+    user_id = Column(BigInteger, index=True, nullable=False)
     usage_date = Column(Date, nullable=False, index=True)
     seconds_used = Column(Integer, default=0, nullable=False)
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User", primaryjoin="foreign(DailyTranscriptionUsage.user_id) == User.id", viewonly=True)
\ No newline at end of file
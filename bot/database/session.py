@@ -1,38 +1,142 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import text
-from config import DB_PATH
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from datetime import datetime, timezone
+from config import (
+    DATABASE_URL, SQLITE_PRAGMA_PROFILE,
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+)
 from .models import Base
+from .migrations import apply_schema_migrations
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
-# URL для підключення
-DATABASE_URL = f"sqlite+aiosqlite:///{DB_PATH}"
+# Профілі PRAGMA, що застосовуються до КОЖНОГО з'єднання пулу (bot_runner і userbot пишуть в одну bot.db)
+SQLITE_PRAGMA_PROFILES = {
+    "safe": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": 10000,
+        "cache_size": -8000,          # ~8 MB
+        "temp_store": "DEFAULT",
+        "mmap_size": 0,
+    },
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -16000,         # ~16 MB
+        "temp_store": "MEMORY",
+        "mmap_size": 67108864,        # 64 MB
+    },
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -65536,         # ~64 MB
+        "temp_store": "MEMORY",
+        "mmap_size": 268435456,       # 256 MB
+    },
+}
+
+def resolve_pragma_profile(name: str) -> dict:
+    """Повертає набір PRAGMA за назвою профілю (невідомий профіль -> balanced)."""
+    profile = SQLITE_PRAGMA_PROFILES.get(name)
+    if profile is None:
+        logger.warning(f"Unknown SQLITE_PRAGMA_PROFILE '{name}', falling back to 'balanced'.")
+        profile = SQLITE_PRAGMA_PROFILES["balanced"]
+    return profile
+
+def attach_sqlite_pragmas(async_engine, pragmas: dict):
+    """Реєструє connect-хук, який виставляє PRAGMA на кожне нове з'єднання пулу."""
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for key, value in pragmas.items():
+                cursor.execute(f"PRAGMA {key}={value}")
+        finally:
+            cursor.close()
+
+def is_sqlite_url(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+def build_engine(url: str):
+    """
+    Створює async engine під бекенд з URL.
+    SQLite: PRAGMA-профіль на кожне з'єднання. PostgreSQL (asyncpg): QueuePool з явними розмірами,
+    pre_ping і recycle, щоб переживати рестарти сервера та idle-таймаути.
+    """
+    if is_sqlite_url(url):
+        sqlite_engine = create_async_engine(url, echo=False)
+        attach_sqlite_pragmas(sqlite_engine, resolve_pragma_profile(SQLITE_PRAGMA_PROFILE))
+        return sqlite_engine
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+    return create_async_engine(
+        url,
+        echo=False,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True
+    )
+
+IS_SQLITE = is_sqlite_url(DATABASE_URL)
+SQLITE_PRAGMAS = resolve_pragma_profile(SQLITE_PRAGMA_PROFILE)
+
+engine = build_engine(DATABASE_URL)
 
 # Фабрика сесій
 AsyncSessionLocal = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
+# Результат останнього обслуговування (для /stats)
+last_maintenance = None
+
 async def init_db():
-    """Ініціалізація БД та увімкнення WAL режиму для швидкодії"""
+    """Ініціалізація БД: створення таблиць та докатування індексів (PRAGMA ставить connect-хук)"""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
-        
-    # Вмикаємо Write-Ahead Logging (WAL) для роботи в кілька процесів
-    async with engine.connect() as conn:
-        await conn.execute(text("PRAGMA journal_mode=WAL;"))
-        await conn.execute(text("PRAGMA synchronous=NORMAL;"))
-        await conn.commit()
-        
-    logger.info("✅ База даних ініціалізована (WAL mode enabled).")
+        await conn.run_sync(apply_schema_migrations)
+
+    if IS_SQLITE:
+        logger.info(f"✅ База даних ініціалізована (WAL, profile={SQLITE_PRAGMA_PROFILE}).")
+    else:
+        logger.info(f"✅ База даних ініціалізована ({engine.dialect.name}, pool={DB_POOL_SIZE}+{DB_MAX_OVERFLOW}).")
+
+async def run_sqlite_maintenance() -> dict:
+    """
+    Періодичне обслуговування: wal_checkpoint(TRUNCATE) не дає WAL-файлу рости між рестартами,
+    PRAGMA optimize оновлює статистику планувальника для індексів, що реально використовуються.
+    """
+    global last_maintenance
+    started = time.perf_counter()
+    result = {"busy": None, "wal_frames": None, "checkpointed": None}
+    try:
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            row = (await conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE);"))).first()
+            if row is not None:
+                result = {"busy": row[0], "wal_frames": row[1], "checkpointed": row[2]}
+            await conn.execute(text("PRAGMA optimize;"))
+    except Exception as e:
+        logger.error(f"SQLite maintenance failed: {e}")
+
+    result["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    result["finished_at"] = datetime.now(timezone.utc)
+    last_maintenance = result
+    if result["busy"]:
+        logger.warning(f"WAL checkpoint was blocked by readers: {result}")
+    return result
 
 async def get_db():
     async with AsyncSessionLocal() as session:
         try:
             yield session
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
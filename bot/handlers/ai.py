@@ -1,59 +1,65 @@
 import logging
 from telegram import Update
 from telegram.constants import ParseMode, ChatAction
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
-from bot.utils.helpers import get_ai_provider, send_long_message, clean_html, beautify_text
+from bot.utils.helpers import get_ai_provider, send_long_message, beautify_text
 from bot.utils.context import context_manager
 from bot.utils.media import download_file, cleanup_files
+from bot.utils.html_sanitizer import split_html, strip_html
+from bot.utils.stream_renderer import StreamBuffer, StreamRenderer, render_stream
 from bot.handlers.common import get_user_model_settings, update_user_language
 from config import DEFAULT_SETTINGS
 
 logger = logging.getLogger(__name__)
 
 async def stream_response(provider, messages, status_msg, user_id, chat_id, settings, save_to_history=True, reply_to_msg_id=None):
-    full_response = ""
-    last_update_len = 0
+    buffer = StreamBuffer(sanitize=True)
     is_streaming_active = True
 
     if settings.get('show_model_name', False):
         model_name = settings.get('model', 'unknown')
-        full_response = f"[{model_name}] "
-        last_update_len = len(full_response)
+        buffer.append(f"[{model_name}] ")
 
     try:
-        async for chunk in provider.generate_stream(messages, settings):
-            if "__SET_LANGUAGE:" in chunk:
-                import re
-                match = re.search(r"__SET_LANGUAGE:(\w+)__", chunk)
-                if match:
-                    await update_user_language(user_id, match.group(1))
-                    chunk = chunk.replace(match.group(0), "")
-
-            full_response += chunk
-            if len(full_response) > 3800:
-                is_streaming_active = False
-                if last_update_len < 3800:
-                     try:
-                        await status_msg.edit_text(full_response[:3800] + "...\n(Генерується далі...)")
-                        last_update_len = 4000
-                     except: pass
-
-            if is_streaming_active and len(full_response) - last_update_len > 80:
-                try:
-                    await status_msg.edit_text(full_response + " ▌")
-                    last_update_len = len(full_response)
-                except Exception:
-                    pass
-
-        if len(full_response) <= 4000:
+        renderer = StreamRenderer(status_msg, chat_id=status_msg.chat_id)
+        try:
+            async for chunk in provider.generate_stream(messages, settings):
+                if "__SET_LANGUAGE:" in chunk:
+                    import re
+                    match = re.search(r"__SET_LANGUAGE:(\w+)__", chunk)
+                    if match:
+                        await update_user_language(user_id, match.group(1))
+                        chunk = chunk.replace(match.group(0), "")
+
+                buffer.append(chunk)
+                if not is_streaming_active:
+                    continue
+                if len(buffer) > 3800:
+                    # Далі повідомлення не влізе: показуємо обрізаний текст і чекаємо кінця генерації
+                    is_streaming_active = False
+                    renderer.update(buffer.text()[:3800] + "...\n(Генерується далі...)", cursor=False)
+                else:
+                    renderer.update(buffer)
+        finally:
+            await renderer.finish()
+
+        full_response = buffer.text()
+        safe_text = buffer.sanitized()
+        parts = split_html(safe_text)
+        if len(parts) <= 1:
+            final_text = parts[0] if parts else safe_text
             try:
-                safe_text = clean_html(full_response)
-                await status_msg.edit_text(safe_text, parse_mode=ParseMode.HTML)
-            except Exception:
-                await status_msg.edit_text(full_response)
+                await status_msg.edit_text(final_text, parse_mode=ParseMode.HTML)
+            except BadRequest as e:
+                # Як у send_long_message: лише відхилений Telegram HTML повторюємо простим текстом;
+                # "Message is not modified" означає, що стрім уже показав цей текст
+                if "not modified" not in str(e).lower():
+                    logger.warning(f"⚠️ HTML answer rejected, editing as plain text: {e}")
+                    await status_msg.edit_text(strip_html(final_text))
         else:
             await status_msg.delete()
-            await send_long_message(status_msg.chat, full_response, parse_mode=ParseMode.HTML, reply_to_msg_id=reply_to_msg_id)
+            await send_long_message(status_msg.chat, safe_text, parse_mode=ParseMode.HTML, reply_to_msg_id=reply_to_msg_id, clean=False)
 
         if save_to_history:
             await context_manager.save_message(user_id, chat_id, 'assistant', full_response)
@@ -180,14 +186,7 @@ async def process_photo_analysis(update: Update, context: ContextTypes.DEFAULT_T
         messages = await context_manager.get_context(user_id, chat_id, limit=5)
         settings = await get_user_model_settings(user_id)
 
-        full_response = ""
-        last_len = 0
-
-        async for chunk in provider.analyze_image(image_path, prompt, messages, settings):
-            full_response += chunk
-            if len(full_response) - last_len > 50:
-                try: await status_msg.edit_text(full_response + " ▌"); last_len = len(full_response)
-                except: pass
+        full_response = await render_stream(provider.analyze_image(image_path, prompt, messages, settings), status_msg)
 
         await status_msg.delete()
 
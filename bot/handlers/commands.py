@@ -6,11 +6,21 @@ from telegram.ext import ContextTypes
 from sqlalchemy.future import select
 from sqlalchemy import desc, and_
 from bot.database.session import AsyncSessionLocal
+from bot.database import session as db_session
 from bot.database.models import User, UserMemory
 from bot.utils.helpers import get_or_create_user
 from bot.handlers.settings import get_main_menu_keyboard, check_group_admin
 from bot.utils.scheduler import scheduler_service
-from bot.utils.queue_manager import get_queue_stats, clear_pending_tasks, clear_all_tasks
+from bot.utils import queue_manager
+from bot.utils.queue_manager import get_queue_stats, clear_pending_tasks, clear_all_tasks, format_turnaround
+from bot.utils.settings_cache import settings_cache
+from bot.utils.provider_pool import provider_pool
+from bot.utils.media_cache import media_cache
+from bot.utils.executors import executors
+from bot.utils.stream_renderer import renderer_stats
+from bot.ai.tool_runner import tool_stats
+from bot.utils.context import context_manager
+from bot.utils.limits import quota_counter
 from config import ADMIN_IDS, DEFAULT_SETTINGS, DEFAULT_GROUP_SETTINGS
 
 logger = logging.getLogger(__name__)
@@ -257,6 +267,7 @@ async def terms_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 settings['transcription_keywords'] = []
                 obj.settings = settings
                 await session.commit()
+        settings_cache.invalidate(chat_id)
         await update.message.reply_text("🗑 Словник термінів транскрибації очищено.")
         return
 
@@ -272,6 +283,7 @@ async def terms_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
             settings['transcription_keywords'] = terms
             obj.settings = settings
             await session.commit()
+    settings_cache.invalidate(chat_id)
 
     terms_str = ", ".join(f"<code>{html.escape(t)}</code>" for t in terms)
     await update.message.reply_text(
@@ -320,7 +332,10 @@ async def queue_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"• ⚙️ В обробці (processing): <b>{processing}</b>\n"
         f"• ✅ Виконано (done): <b>{done}</b>\n"
         f"• ❌ Помилки / Timeout: <b>{error}</b>\n"
+        f"• ☠️ Вичерпали спроби (dead): <b>{stats['dead']}</b>\n"
         f"• 📊 Всього записів: <b>{total}</b>\n"
+        f"• 🗄 В архіві за 7 днів: <b>{stats['archived']}</b>\n"
+        f"{format_turnaround(stats['turnaround'])}"
     )
 
     keyboard = [
@@ -382,6 +397,7 @@ async def video_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 g.settings = settings
                 count += 1
             await session.commit()
+        settings_cache.clear()
 
         await update.message.reply_text(
             f"✅ <b>Масове налаштування застосовано!</b>\n"
@@ -429,6 +445,7 @@ async def video_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 settings['video_repost'] = new_state
                 u.settings = settings
                 await session.commit()
+        settings_cache.invalidate(chat_id)
 
         st_text = "увімкнено ✅" if new_state else "вимкнено ❌"
         await update.message.reply_text(f"🎥 Репост відео для цього чату <b>{st_text}</b>.", parse_mode='HTML')
@@ -450,4 +467,119 @@ async def video_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"Змінити стан можна кнопкою нижче або командами <code>/video on</code> / <code>/video off</code>.",
         reply_markup=InlineKeyboardMarkup(keyboard),
         parse_mode='HTML'
-    )
\ No newline at end of file
+    )
+
+def _cache_stats_lines() -> List[str]:
+    """Кеш налаштувань, пул AI клієнтів і кеш медіа."""
+    sc = settings_cache.stats()
+    pp = provider_pool.stats()
+    mc = media_cache.stats()
+    return [
+        "<b>Кеш налаштувань:</b>",
+        f"• Hits / Misses: <b>{sc['hits']}</b> / <b>{sc['misses']}</b> (hit rate {sc['hit_rate']:.0%})",
+        f"• Записів: <b>{sc['size']}</b>, інвалідацій: <b>{sc['invalidations']}</b>",
+        "\n<b>Пул AI клієнтів:</b>",
+        f"• Reuse / New: <b>{pp['hits']}</b> / <b>{pp['misses']}</b>",
+        f"• Активних: <b>{pp['size']}</b>, витіснено: <b>{pp['evicted']}</b>",
+        "\n<b>Кеш медіа (file_id):</b>",
+        f"• Hits / Misses: <b>{mc['hits']}</b> / <b>{mc['misses']}</b> (hit rate {mc['hit_rate']:.0%})",
+        f"• Посилань: <b>{mc['size']}</b>, витіснено: <b>{mc['evicted']}</b>",
+    ]
+
+def _executor_stats_lines() -> List[str]:
+    """Пули потоків: зайнятість, черга та відмови."""
+    lines = ["\n<b>Пули потоків:</b>"]
+    for name, executor in executors.items():
+        es = executor.stats()
+        lines.append(
+            f"• {name}: <b>{es['active']}</b>/{es['workers']} активних, черга <b>{es['waiting']}</b> "
+            f"(макс {es['max_waiting']}, ще {es['chat_waiting']} за лімітом чатів), очікування ~{es['avg_wait_ms']} мс, відмов <b>{es['rejected']}</b>"
+        )
+    return lines
+
+def _ai_stats_lines() -> List[str]:
+    """Стрімінг відповідей та виконання інструментів AI."""
+    rs = renderer_stats.stats()
+    ts = tool_stats.stats()
+    return [
+        "\n<b>Стрімінг відповідей:</b>",
+        f"• Відповідей: <b>{rs['responses']}</b>, правок: <b>{rs['edits']}</b> (~{rs['edits_per_response']} на відповідь)",
+        f"• Злито шматків: <b>{rs['coalesced']}</b>, FloodWait: <b>{rs['flood_waits']}</b>, "
+        f"перша правка ~{rs['avg_first_edit_ms']} мс",
+        "\n<b>Інструменти AI:</b>",
+        f"• Викликів: <b>{ts['calls']}</b> у <b>{ts['batches']}</b> ходах (паралельних: {ts['parallel_batches']}), "
+        f"~{ts['avg_batch_ms']} мс на хід",
+        f"• Заощаджено паралельністю: <b>{ts['saved_ms']}</b> мс, таймаутів: <b>{ts['timeouts']}</b>, "
+        f"помилок: <b>{ts['errors']}</b>",
+    ]
+
+def _background_stats_lines() -> List[str]:
+    """Фонові задачі: retention, write-behind історії, лічильник квот і архівація черги."""
+    lines = ["\n<b>Retention (message_cache):</b>"]
+    sweep = context_manager.last_sweep
+    if sweep:
+        lines.append(
+            f"• Останній запуск: <b>{sweep['removed']}</b> рядків за <b>{sweep['duration_ms']}</b> мс "
+            f"({sweep['finished_at'].strftime('%d.%m %H:%M UTC')})"
+        )
+    else:
+        lines.append("• Ще не запускався.")
+
+    ws = context_manager.write_stats
+    avg_batch = round(ws['rows'] / ws['flushes'], 1) if ws['flushes'] else 0
+    lines.append("\n<b>Запис історії (write-behind):</b>")
+    lines.append(
+        f"• Порцій: <b>{ws['flushes']}</b>, рядків: <b>{ws['rows']}</b> (в середньому {avg_batch}), "
+        f"втрачено: <b>{ws['failed_rows']}</b>"
+    )
+
+    qc = quota_counter.stats()
+    lines.append("\n<b>Ліміт транскрибації (in-memory):</b>")
+    lines.append(
+        f"• Користувачів сьогодні: <b>{qc['users']}</b>, гідрацій з БД: <b>{qc['hydrations']}</b>, "
+        f"нескинутих дельт: <b>{qc['pending']}</b>, flush: <b>{qc['flushes']}</b>"
+    )
+
+    arch = queue_manager.last_archive
+    lines.append("\n<b>Архівація черги:</b>")
+    if arch:
+        lines.append(
+            f"• Останній запуск: <b>{arch['archived']}</b> завдань за <b>{arch['duration_ms']}</b> мс "
+            f"({arch['finished_at'].strftime('%d.%m %H:%M UTC')})"
+        )
+    else:
+        lines.append("• Ще не запускалась.")
+    return lines
+
+def _database_stats_lines() -> List[str]:
+    """SQLite: останнє обслуговування WAL; інші БД: стан пулу з'єднань."""
+    if not db_session.IS_SQLITE:
+        return [
+            f"\n<b>БД ({db_session.engine.dialect.name}):</b>",
+            f"• Пул: {html.escape(db_session.engine.pool.status())}",
+        ]
+    lines = [f"\n<b>SQLite ({db_session.SQLITE_PRAGMA_PROFILE}):</b>"]
+    maint = db_session.last_maintenance
+    if maint:
+        lines.append(
+            f"• Checkpoint: <b>{maint['checkpointed']}</b>/<b>{maint['wal_frames']}</b> кадрів WAL, "
+            f"busy={maint['busy']}, {maint['duration_ms']} мс ({maint['finished_at'].strftime('%d.%m %H:%M UTC')})"
+        )
+    else:
+        lines.append("• Обслуговування ще не запускалось.")
+    return lines
+
+async def stats_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /stats (тільки ADMIN_IDS): внутрішні лічильники кешів та фонових задач."""
+    if not update.message: return
+    if update.effective_user.id not in ADMIN_IDS:
+        await update.message.reply_text("🔒 Статистика доступна лише адміністраторам бота.")
+        return
+
+    lines = ["📈 <b>Внутрішня статистика:</b>\n"]
+    lines += _cache_stats_lines()
+    lines += _executor_stats_lines()
+    lines += _ai_stats_lines()
+    lines += _background_stats_lines()
+    lines += _database_stats_lines()
+    await update.message.reply_text("\n".join(lines), parse_mode='HTML')
@@ -5,6 +5,7 @@ from telegram.ext import ContextTypes
 from sqlalchemy.future import select
 from bot.database.session import AsyncSessionLocal
 from bot.database.models import User, APIKey
+from bot.utils.settings_cache import settings_cache
 from config import DEFAULT_SETTINGS, DEFAULT_GROUP_SETTINGS, BOT_TRIGGERS, ADMIN_IDS
 
 logger = logging.getLogger(__name__)
@@ -14,7 +15,12 @@ MEDIA_GROUP_CACHE = {}
 async def get_user_model_settings(user_id: int):
     """
     Отримує налаштування. user_id може бути ID користувача АБО ID групи.
+    Результат кешується в settings_cache (TTL/LRU), тому зміни налаштувань мають його інвалідувати.
     """
+    cached = settings_cache.get(user_id)
+    if cached is not None:
+        return cached
+
     async with AsyncSessionLocal() as session:
         user = await session.get(User, user_id)
 
@@ -39,7 +45,8 @@ async def get_user_model_settings(user_id: int):
         if 'trigger_mode' not in settings: settings['trigger_mode'] = default.get('trigger_mode', 'keywords')
         if 'video_repost' not in settings: settings['video_repost'] = default.get('video_repost', True)
 
-        return settings
+    settings_cache.set(user_id, settings)
+    return dict(settings)
 
 async def update_user_language(user_id: int, lang_code: str):
     async with AsyncSessionLocal() as session:
@@ -49,6 +56,7 @@ async def update_user_language(user_id: int, lang_code: str):
             settings['language'] = lang_code
             user.settings = settings
             await session.commit()
+    settings_cache.invalidate(user_id)
 
 def should_respond(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     """Визначає, чи відповідати на повідомлення в групах."""
@@ -6,7 +6,8 @@ from telegram.ext import ContextTypes
 from bot.utils.helpers import get_ai_provider, send_long_message, beautify_text
 from bot.utils.context import context_manager
 from bot.utils.media import download_file, extract_audio, cleanup_files, validate_audio_size
-from bot.utils.limits import check_transcription_limit, record_transcription_usage
+from bot.utils.stream_renderer import render_stream
+from bot.utils.limits import reserve_transcription_quota, commit_transcription_quota, release_transcription_quota
 from bot.handlers.common import should_respond, get_user_model_settings, MEDIA_GROUP_CACHE
 
 logger = logging.getLogger(__name__)
@@ -56,18 +57,8 @@ async def process_vision_request_from_text_handler(update: Update, context: Cont
         messages = await context_manager.get_context(user_id, chat_id, limit=5)
         settings = await get_user_model_settings(user_id)
 
-        full_response = ""
-        last_len = 0
-
-        # 5. Виклик Vision API
-        async for chunk in provider.analyze_image(image_path, prompt_text, messages, settings):
-            full_response += chunk
-            # Оновлюємо статус не надто часто
-            if len(full_response) - last_len > 50:
-                try:
-                    await status_msg.edit_text(full_response + " ▌")
-                    last_len = len(full_response)
-                except: pass
+        # 5. Виклик Vision API (прогрес показується правками з обмеженням частоти)
+        full_response = await render_stream(provider.analyze_image(image_path, prompt_text, messages, settings), status_msg)
 
         await status_msg.delete()
 
@@ -135,16 +126,7 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
             messages = await context_manager.get_context(user_id, chat_id, limit=5)
             settings = await get_user_model_settings(user_id)
 
-            full_response = ""
-            last_len = 0
-
-            async for chunk in provider.analyze_image(image_path, final_prompt, messages, settings):
-                full_response += chunk
-                if len(full_response) - last_len > 50:
-                    try:
-                        await status_msg.edit_text(full_response + " ▌")
-                        last_len = len(full_response)
-                    except: pass
+            full_response = await render_stream(provider.analyze_image(image_path, final_prompt, messages, settings), status_msg)
 
             await status_msg.delete()
 
@@ -190,10 +172,10 @@ async def handle_voice_video(update: Update, context: ContextTypes.DEFAULT_TYPE)
     elif update.message.video: file_obj = update.message.video; is_video = True; media_type = "Video File"
     else: return
 
-    # Перевірка щоденного ліміту транскрибації перед завантаженням/викликом API
+    # Атомарно резервуємо денний ліміт транскрибації перед завантаженням/викликом API
     duration = getattr(file_obj, 'duration', 0) or 0
-    can_transcribe, limit_msg = await check_transcription_limit(user.id, duration)
-    if not can_transcribe:
+    reservation, limit_msg = await reserve_transcription_quota(user.id, duration)
+    if not reservation:
         if update.effective_chat.type == 'private' or should_respond(update, context):
             await update.message.reply_text(limit_msg)
         return
@@ -202,12 +184,14 @@ async def handle_voice_video(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     provider = await get_ai_provider(user.id, for_transcription=True)
     if not provider:
+        await release_transcription_quota(reservation)
         if update.effective_chat.type == 'private': await update.message.reply_text("⚠️ Немає ключа API.")
         return
 
-    status = await update.message.reply_text("📥 Завантажую...", reply_to_message_id=update.message.message_id)
+    status = None
     temp_files = []
     try:
+        status = await update.message.reply_text("📥 Завантажую...", reply_to_message_id=update.message.message_id)
         tg_file = await context.bot.get_file(file_obj.file_id)
         input_path = await download_file(tg_file, file_obj.file_id)
         temp_files.append(input_path)
@@ -236,8 +220,8 @@ async def handle_voice_video(update: Update, context: ContextTypes.DEFAULT_TYPE)
             if status: await status.edit_text("⚠️ Не вдалося розпізнати мову або аудіо порожнє.")
             return
 
-        # Фіксуємо використання ліміту тільки після успішного розпізнавання
-        await record_transcription_usage(user.id, duration)
+        # Резерв стає використанням тільки після успішного розпізнавання
+        await commit_transcription_quota(reservation)
 
         # Debug вивід raw тексту
         if settings.get('show_model_name', False):
@@ -278,4 +262,7 @@ async def handle_voice_video(update: Update, context: ContextTypes.DEFAULT_TYPE)
     except Exception as e:
         logger.error(f"❌ {user_log} Media error: {e}")
         if status: await status.edit_text(f"❌ {e}")
-    finally: cleanup_files(temp_files)
\ No newline at end of file
+    finally:
+        # Невдале розпізнавання (порожнє аудіо чи помилка) не списує ліміт
+        await release_transcription_quota(reservation)
+        cleanup_files(temp_files)
\ No newline at end of file
@@ -10,7 +10,9 @@ from bot.database.models import User, APIKey
 from bot.utils.helpers import get_or_create_user
 from bot.utils.security import key_manager
 from bot.utils.context import context_manager
-from bot.utils.queue_manager import get_queue_stats, clear_pending_tasks, clear_all_tasks
+from bot.utils.queue_manager import get_queue_stats, clear_pending_tasks, clear_all_tasks, format_turnaround
+from bot.utils.settings_cache import settings_cache
+from bot.utils.provider_pool import provider_pool
 from config import PERSONAS, DEFAULT_SETTINGS, DEFAULT_GROUP_SETTINGS, ADMIN_IDS, AVAILABLE_MODELS
 
 logger = logging.getLogger(__name__)
@@ -55,6 +57,9 @@ async def update_setting(chat_id, key, value):
             settings[key] = value
             obj.settings = settings
             await session.commit()
+    settings_cache.invalidate(chat_id)
+    if key == 'model':
+        provider_pool.invalidate_user(chat_id)
 
 def get_main_menu_keyboard():
     keyboard = [
@@ -161,7 +166,10 @@ async def queue_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
         f"• ⚙️ В обробці (processing): <b>{processing}</b>\n"
         f"• ✅ Виконано (done): <b>{done}</b>\n"
         f"• ❌ Помилки / Timeout: <b>{error}</b>\n"
+        f"• ☠️ Вичерпали спроби (dead): <b>{stats['dead']}</b>\n"
         f"• 📊 Всього записів: <b>{total}</b>\n"
+        f"• 🗄 В архіві за 7 днів: <b>{stats['archived']}</b>\n"
+        f"{format_turnaround(stats['turnaround'])}"
     )
 
     keyboard = [
@@ -216,6 +224,7 @@ async def toggle_context_mode(update: Update, context: ContextTypes.DEFAULT_TYPE
             settings['context_mode'] = new_mode
             user.settings = settings
             await session.commit()
+    settings_cache.invalidate(target_id)
 
     await query.answer(f"Режим контексту: {'Спільний' if new_mode == 'shared' else 'Особистий'}")
     await settings_menu(update, context)
@@ -238,6 +247,7 @@ async def toggle_video_repost(update: Update, context: ContextTypes.DEFAULT_TYPE
             settings['video_repost'] = new_state
             user.settings = settings
             await session.commit()
+    settings_cache.invalidate(target_id)
 
     await query.answer(f"Репост відео: {'Увімкнено' if new_state else 'Вимкнено'}")
     await settings_menu(update, context)
@@ -259,6 +269,7 @@ async def toggle_debug(update: Update, context: ContextTypes.DEFAULT_TYPE):
             settings['show_model_name'] = new_state
             user.settings = settings
             await session.commit()
+    settings_cache.invalidate(target_id)
 
     await query.answer(f"Дебаг: {'Ввімкнено' if new_state else 'Вимкнено'}")
     await settings_menu(update, context)
@@ -498,6 +509,8 @@ async def save_key(update: Update, context: ContextTypes.DEFAULT_TYPE):
         for k in old_keys.scalars().all(): await session.delete(k)
         session.add(APIKey(user_id=user_id, provider=provider, encrypted_key=encrypted, is_active=True))
         await session.commit()
+    settings_cache.invalidate(user_id)
+    provider_pool.invalidate_user(user_id)
     await update.message.reply_text(f"✅ Ключ <b>{provider.upper()}</b> успішно збережено!", parse_mode='HTML')
     return ConversationHandler.END
 
@@ -509,6 +522,8 @@ async def delete_key(update: Update, context: ContextTypes.DEFAULT_TYPE):
         old_keys = await session.execute(select(APIKey).where(APIKey.user_id==user_id, APIKey.provider==provider))
         for k in old_keys.scalars().all(): await session.delete(k)
         await session.commit()
+    settings_cache.invalidate(user_id)
+    provider_pool.invalidate_user(user_id)
     await query.answer("Ключ видалено!")
     await keys_menu(update, context)
 
@@ -1,4 +1,5 @@
 import logging
+import html
 import re
 import os
 import zoneinfo
@@ -10,6 +11,10 @@ from bot.database.session import AsyncSessionLocal
 from bot.database.models import DownloadQueue
 from bot.utils.context import context_manager
 from bot.utils.downloader import download_media_direct
+from bot.utils.executors import ExecutorBusy
+from bot.utils.media import staged_upload
+from bot.utils.queue_manager import enqueue_download
+from bot.utils.media_cache import media_cache, send_cached_media
 from bot.handlers.settings import get_main_menu_keyboard
 from bot.handlers.common import should_respond, get_user_model_settings
 from bot.handlers.ai import process_gpt_request
@@ -64,20 +69,20 @@ async def handle_internal_task(update: Update, context: ContextTypes.DEFAULT_TYP
     if not caption.startswith("task_id:"): return
 
     try:
-        task_id = int(caption.split(":")[1])
+        # "task_id:<id>:<файлів у відповіді>" (кількість — щоб кешувати альбом лише цілим)
+        parts = caption.split(":")
+        task_id = int(parts[1])
+        total = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else None
         logger.info(f"📥 [MainBot] Received Internal Task Result. ID: {task_id}")
 
         async with AsyncSessionLocal() as session:
             task = await session.get(DownloadQueue, task_id)
 
             if task and task.status in ["failed_by_donor", "timeout", "error"]:
-                link_to_download = task.link.split("###")[-1] if "USERBOT_ERROR:" in task.link else task.link
+                link_to_download = task.link
                 error_prefix = f"⚠️ <b>Userbot Failed</b>: "
-                if "USERBOT_ERROR:" in task.link:
-                    parts = task.link.split(":")
-                    bot_name = parts[1]
-                    error_msg = parts[2].split("###")[0]
-                    error_prefix += f"@{bot_name} Error: {error_msg}\n"
+                if task.status == "failed_by_donor" and task.error:
+                    error_prefix += f"@{task.donor} Error: {html.escape(task.error[:200])}\n"
                 else:
                     error_prefix += f"Timeout/General Error with {link_to_download}\n"
 
@@ -85,19 +90,23 @@ async def handle_internal_task(update: Update, context: ContextTypes.DEFAULT_TYP
                 status_msg = await context.bot.send_message(task.user_id, f"{error_prefix}⏳ Завантажую через yt-dlp...", reply_to_message_id=task.message_id, parse_mode="HTML")
 
                 try:
-                    media_info = await download_media_direct(link_to_download)
+                    media_info = await download_media_direct(link_to_download, chat_id=task.user_id)
                     if media_info and os.path.exists(media_info['path']):
                         await status_msg.edit_text("📤 Відправляю через yt-dlp...")
-                        if media_info['type'] == 'video':
-                            await context.bot.send_video(task.user_id, video=open(media_info['path'], 'rb'), reply_to_message_id=task.message_id)
-                        else:
-                            await context.bot.send_document(task.user_id, document=open(media_info['path'], 'rb'), reply_to_message_id=task.message_id)
+                        async with staged_upload(media_info['path']) as upload:
+                            if media_info['type'] == 'video':
+                                sent = await context.bot.send_video(task.user_id, video=upload, reply_to_message_id=task.message_id)
+                            else:
+                                sent = await context.bot.send_document(task.user_id, document=upload, reply_to_message_id=task.message_id)
+                        media_cache.remember(link_to_download, sent)
                         await status_msg.delete()
-                        os.remove(media_info['path'])
                         logger.info(f"✅ [MainBot] yt-dlp fallback success for Task {task_id}.")
                     else:
                         await status_msg.edit_text(f"{error_prefix}❌ yt-dlp також не зміг завантажити.")
                         logger.warning(f"❌ [MainBot] yt-dlp also failed for {link_to_download}.")
+                except ExecutorBusy:
+                    logger.warning(f"⏳ [MainBot] Download executor is full, fallback for Task {task_id} skipped.")
+                    await status_msg.edit_text(f"{error_prefix}⏳ Забагато завантажень, спробуйте пізніше.")
                 except Exception as dl_err:
                     logger.error(f"❌ [MainBot] yt-dlp fatal error: {dl_err}")
                     await status_msg.edit_text(f"{error_prefix}❌ Невідома помилка yt-dlp.")
@@ -108,6 +117,10 @@ async def handle_internal_task(update: Update, context: ContextTypes.DEFAULT_TYP
             if task:
                 logger.info(f"   -> Delivering to User {task.user_id} (Reply to {task.message_id})...")
                 await context.bot.copy_message(chat_id=task.user_id, from_chat_id=message.chat_id, message_id=message.message_id, caption="", reply_to_message_id=task.message_id)
+                # file_id отриманого від userbot файлу — для повторних запитів того ж посилання
+                # (запис з'являється, коли надійшли всі total файлів завдання)
+                if total:
+                    media_cache.remember(task.link, message, source=task.id, total=total)
                 logger.info(f"✅ [MainBot] Delivery Success.")
             else:
                 logger.warning(f"⚠️ [MainBot] Task {task_id} not found.")
@@ -219,12 +232,12 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if chat_settings.get('video_repost', True):
             link = userbot_match.group(0)
             logger.info(f"🔗 {user_log} Userbot Link: {link}")
+            if await send_cached_media(context.bot, chat_id, link, reply_to_message_id=update.message.message_id):
+                logger.info(f"♻️ {user_log} Served from media cache (file_id).")
+                return
             try:
-                async with AsyncSessionLocal() as session:
-                    queue_item = DownloadQueue(user_id=chat_id, message_id=update.message.message_id, link=link, status="pending")
-                    session.add(queue_item)
-                    await session.commit()
-                    logger.info(f"💾 {user_log} Task Saved (ID: {queue_item.id})")
+                task_id = await enqueue_download(chat_id, update.message.message_id, link)
+                logger.info(f"💾 {user_log} Task Saved (ID: {task_id})")
                 if is_private: await update.message.reply_text(f"🔗 Передав юзерботу...", quote=True)
             except Exception as db_err:
                 logger.error(f"❌ {user_log} DB Error: {db_err}")
@@ -240,20 +253,27 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if chat_settings.get('video_repost', True):
             url = direct_match.group(0)
             logger.info(f"🔗 {user_log} Direct DL Link: {url}")
+            if await send_cached_media(context.bot, chat_id, url, reply_to_message_id=update.message.message_id):
+                logger.info(f"♻️ {user_log} Served from media cache (file_id).")
+                return
             status_msg = await update.message.reply_text("⏳ Завантажую...", quote=True) if is_private else None
             try:
-                media_info = await download_media_direct(url)
+                media_info = await download_media_direct(url, chat_id=chat_id)
                 if media_info and os.path.exists(media_info['path']):
                     logger.info(f"✅ {user_log} Download OK. Sending...")
                     if status_msg: await status_msg.edit_text("📤 Відправляю...")
-                    if media_info['type'] == 'video':
-                        await update.message.reply_video(video=open(media_info['path'], 'rb'), reply_to_message_id=update.message.message_id)
-                    else:
-                        await update.message.reply_document(document=open(media_info['path'], 'rb'), reply_to_message_id=update.message.message_id)
+                    async with staged_upload(media_info['path']) as upload:
+                        if media_info['type'] == 'video':
+                            sent = await update.message.reply_video(video=upload, reply_to_message_id=update.message.message_id)
+                        else:
+                            sent = await update.message.reply_document(document=upload, reply_to_message_id=update.message.message_id)
+                    media_cache.remember(url, sent)
                     if status_msg: await status_msg.delete()
-                    os.remove(media_info['path'])
                 else:
                     if status_msg: await status_msg.edit_text("❌ Не вдалося.")
+            except ExecutorBusy:
+                logger.warning(f"⏳ {user_log} Download executor is full, link skipped.")
+                if status_msg: await status_msg.edit_text("⏳ Забагато завантажень, спробуйте за хвилину.")
             except Exception as e:
                 logger.error(f"❌ {user_log} DL Error: {e}")
                 if status_msg: await status_msg.edit_text("❌ Помилка.")
@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Боти-донори та маршрутизація посилань: спільні для бота (ставить завдання) і userbot (виконує)
+BOT_SAVEAS = "SaveAsBot"
+BOT_MONKETT = "monkettbot"
+MONKETT_DOMAINS = ("twitter.com", "x.com", "9gag.com", "bsky.app")
+
+def route_donor(link: str) -> str:
+    """Визначає, кому відправити посилання: SaveAsBot чи Monkettbot."""
+    link = (link or "").lower()
+    if any(d in link for d in MONKETT_DOMAINS):
+        return BOT_MONKETT
+    return BOT_SAVEAS
+
+def parse_donor_concurrency(raw: str, defaults: Dict[str, int]) -> Dict[str, int]:
+    """
+    Розбирає рядок виду "SaveAsBot=2,monkettbot=1" поверх значень за замовчуванням.
+    Некоректні пари ігноруються, мінімальна паралельність — 1.
+    """
+    result = dict(defaults)
+    for pair in (raw or "").split(","):
+        name, _, value = pair.partition("=")
+        name = name.strip().lstrip("@")
+        if not name or not value.strip():
+            continue
+        try:
+            result[name] = max(1, int(value))
+        except ValueError:
+            logger.warning(f"Ignoring invalid donor concurrency '{pair}'")
+    return result
+
+class DonorChannel:
+    """
+    Стан одного бота-донора, спільний для всіх воркерів userbot.
+    1. Слоти: не більше concurrency одночасних запитів до донора.
+    2. Темп: мінімальний інтервал між відправками та спільна пауза після FloodWait.
+    3. Кореляція: відповіді донора прив'язуються до конкретного запиту (message id посилання).
+       Поки донор не відповідав reply на наш запит, прив'язка можлива лише за порядком (FIFO), і вона
+       надійна тільки для одного запиту в роботі — тоді slot() пропускає запити по одному, незалежно від concurrency.
+    4. Push-доставка: вхідні повідомлення донора (update handler) резолвлять future запиту,
+       щойно classify() повертає для повідомлення результат (медіа або текст помилки); collect()
+       добирає решту результатів того ж запиту (кілька окремих файлів).
+    """
+
+    def __init__(self, name: str, concurrency: int = 1, min_interval: float = 0.0,
+                 classify: Optional[Callable[[Any], Any]] = None):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.min_interval = min_interval
+        self.paused_until = 0.0
+        self._slots = asyncio.Semaphore(self.concurrency)
+        # Донор без reply: паралельні відповіді не розрізнити, тож запити йдуть по одному
+        self._fifo = asyncio.Lock()
+        self.replies_to_requests = False
+        self._send_lock = asyncio.Lock()
+        self._last_send = 0.0
+        # request_id (id нашого повідомлення з посиланням) -> task_id
+        self.inflight: Dict[int, int] = {}
+        self._answered = set()
+        self._owners: Dict[int, int] = {}
+        self._groups: Dict[str, int] = {}
+        self.classify = classify
+        self._waiters: Dict[int, asyncio.Future] = {}
+        # request_id -> усі результати classify() для запиту, у порядку надходження
+        self._results: Dict[int, List[Any]] = {}
+        # Подія "донор щось надіслав" для запитів, що добирають результати в collect()
+        self._activity: Dict[int, asyncio.Event] = {}
+        self._latest_owner = 0
+        # Відповіді, що прийшли раніше, ніж ми встигли зареєструвати запит (update випередив send_message)
+        self._orphans = deque(maxlen=32)
+        self.sent = 0
+        self.flood_waits = 0
+
+    @property
+    def effective_concurrency(self) -> int:
+        return self.concurrency if self.replies_to_requests else 1
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._slots:
+            if self.replies_to_requests:
+                yield
+            else:
+                async with self._fifo:
+                    yield
+
+    async def before_send(self):
+        """Чекає на кінець FloodWait-паузи та мінімальний інтервал між відправками цьому донору."""
+        async with self._send_lock:
+            now = time.monotonic()
+            delay = max(self.paused_until - now, self._last_send + self.min_interval - now, 0)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._last_send = time.monotonic()
+            self.sent += 1
+
+    async def wait_pause(self):
+        """Чекає кінця FloodWait-паузи донора (до того, як брати нове завдання з орендою)."""
+        delay = self.paused_until - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.paused_until - time.monotonic()
+
+    def flood_wait(self, seconds: float):
+        """Ставить на паузу всі відправки цьому донору (інші донори працюють далі)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.flood_waits += 1
+        logger.warning(f"⏸ Donor @{self.name} paused for {seconds}s (FloodWait).")
+
+    def register(self, request_id: int, task_id: int):
+        self.inflight[request_id] = task_id
+
+    def expect(self, request_id: int, task_id: int) -> asyncio.Future:
+        """
+        Реєструє запит і повертає future з першим результатом classify() для його відповідей.
+        Повідомлення, що прийшли до реєстрації, доставляються повторно.
+        """
+        self.register(request_id, task_id)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[request_id] = future
+        orphans = [m for m in self._orphans if m.id > request_id]
+        for message in orphans:
+            self._orphans.remove(message)
+        for message in sorted(orphans, key=lambda m: m.id):
+            self.deliver(message)
+        return future
+
+    def deliver(self, message) -> Optional[int]:
+        """
+        Обробляє вхідне повідомлення донора. Повертає request_id, якому воно належить.
+        Проміжні повідомлення (classify() -> None) не резолвлять future і не потрапляють у результати.
+        """
+        owner = self.attribute(message)
+        if owner is None:
+            self._orphans.append(message)
+            return None
+        future = self._waiters.get(owner)
+        if future is not None:
+            result = self.classify(message) if self.classify else message
+            if result is not None:
+                self._results.setdefault(owner, []).append(result)
+                if not future.done():
+                    future.set_result(result)
+        for event in self._activity.values():
+            event.set()
+        return owner
+
+    def _moved_on(self, request_id: int) -> bool:
+        """Донор без reply (FIFO) вже відповідає на пізніший запит — відповідь на цей завершена."""
+        return not self.replies_to_requests and self._latest_owner > request_id
+
+    async def collect(self, request_id: int, settle: float) -> List[Any]:
+        """
+        Усі результати запиту після першого: донор може надіслати кілька окремих файлів (відео й аудіо,
+        фото не альбомом). Чекає, доки settle секунд не прийде нічого нового або донор не перейде
+        до наступного запиту, і повертає результати в порядку надходження.
+        """
+        event = self._activity.setdefault(request_id, asyncio.Event())
+        while not self._moved_on(request_id):
+            event.clear()
+            try:
+                await asyncio.wait_for(event.wait(), settle)
+            except asyncio.TimeoutError:
+                break
+        return list(self._results.get(request_id, []))
+
+    def unregister(self, request_id: int):
+        future = self._waiters.pop(request_id, None)
+        if future is not None and not future.done():
+            future.cancel()
+        self.inflight.pop(request_id, None)
+        self._answered.discard(request_id)
+        self._results.pop(request_id, None)
+        self._activity.pop(request_id, None)
+        self._owners = {mid: rid for mid, rid in self._owners.items() if rid != request_id}
+        self._groups = {gid: rid for gid, rid in self._groups.items() if rid != request_id}
+
+    def attribute(self, message) -> Optional[int]:
+        """
+        Повертає request_id, якому належить повідомлення донора (або None).
+        Порядок правил: reply на наш запит -> вже відомий media_group -> найстаріший запит без відповіді,
+        надісланий раніше за повідомлення (донори відповідають FIFO) -> останній запит з відповіддю
+        (додаткові файли тієї ж відповіді). Відповіддю запит позначає лише повідомлення, для якого
+        classify() дає результат (медіа або помилка): проміжні тексти на кшталт "Downloading..." не
+        зсувають черговість. Результат кешується за id повідомлення, тож усі воркери бачать однакову прив'язку.
+        """
+        if message.id in self._owners:
+            return self._owners[message.id]
+
+        owner = None
+        reply_to = getattr(message, "reply_to_message_id", None)
+        group_id = getattr(message, "media_group_id", None)
+        earlier = sorted(rid for rid in self.inflight if rid < message.id)
+
+        if reply_to in self.inflight:
+            owner = reply_to
+            self.replies_to_requests = True
+        elif group_id and group_id in self._groups:
+            owner = self._groups[group_id]
+        elif earlier:
+            unanswered = [rid for rid in earlier if rid not in self._answered]
+            owner = unanswered[0] if unanswered else earlier[-1]
+
+        if owner is None:
+            return None
+        self._owners[message.id] = owner
+        self._latest_owner = max(self._latest_owner, owner)
+        if self.classify is None or self.classify(message) is not None:
+            self._answered.add(owner)
+        if group_id:
+            self._groups.setdefault(group_id, owner)
+        return owner
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "concurrency": self.effective_concurrency,
+            "inflight": len(self.inflight),
+            "sent": self.sent,
+            "flood_waits": self.flood_waits,
+            "paused_for": round(max(0.0, self.paused_until - time.monotonic()), 1)
+        }
+
+class WorkerStats:
+    """Облік зайнятості воркера: частка часу, проведеного в обробці завдань."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.monotonic()
+        self.busy_seconds = 0.0
+        self.tasks = 0
+        self._busy_since: Optional[float] = None
+
+    def begin(self):
+        self._busy_since = time.monotonic()
+
+    def end(self):
+        if self._busy_since is not None:
+            self.busy_seconds += time.monotonic() - self._busy_since
+            self._busy_since = None
+            self.tasks += 1
+
+    def utilization(self) -> float:
+        now = time.monotonic()
+        busy = self.busy_seconds + (now - self._busy_since if self._busy_since is not None else 0.0)
+        elapsed = now - self.started
+        return round(busy / elapsed, 3) if elapsed > 0 else 0.0
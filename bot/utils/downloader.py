@@ -1,18 +1,68 @@
 import os
+import copy
 import logging
-import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
 import yt_dlp
-from config import TEMP_DIR
+from bot.utils.executors import download_executor
+from bot.utils.media_cache import normalize_url
+from config import TEMP_DIR, YTDLP_INFO_CACHE_TTL_SECONDS
 
 logger = logging.getLogger(__name__)
 
-async def download_media_direct(url: str) -> dict:
-    loop = asyncio.get_running_loop()
-    
-    logger.info(f"📥 [Downloader] Starting download for: {url}")
-    
-    ydl_opts = {
-        'outtmpl': os.path.join(TEMP_DIR, '%(id)s.%(ext)s'),
+class InfoCache:
+    """
+    Короткоживучий кеш метаданих yt-dlp (info dict після extract_info) за нормалізованим посиланням.
+    Повторне завантаження того ж посилання (fallback після userbot, кілька чатів одночасно) не резолвить
+    його заново. TTL короткий: прямі посилання на формати (googlevideo, twimg) підписані й швидко спливають.
+    Викликається з потоків executor'а, тому під threading.Lock.
+    """
+
+    def __init__(self, ttl_seconds: float = YTDLP_INFO_CACHE_TTL_SECONDS, max_size: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._data: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        key = normalize_url(url)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self._data.pop(key, None)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            # process_ie_result змінює dict, тому віддаємо копію
+            return copy.deepcopy(entry[1])
+
+    def set(self, url: str, info: Dict[str, Any]):
+        if self.ttl_seconds <= 0 or self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[normalize_url(url)] = (time.monotonic() + self.ttl_seconds, info)
+            self._data.move_to_end(normalize_url(url))
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, url: str):
+        with self._lock:
+            self._data.pop(normalize_url(url), None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+info_cache = InfoCache()
+
+def build_ydl_opts(out_dir: str) -> Dict[str, Any]:
+    return {
+        'outtmpl': os.path.join(out_dir, '%(id)s.%(ext)s'),
         'format': 'best[filesize<50M]/best',
         'max_filesize': 50 * 1024 * 1024,
         'quiet': True,
@@ -32,31 +82,50 @@ async def download_media_direct(url: str) -> dict:
         }
     }
 
-    def _download():
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            try:
+def download_sync(url: str, out_dir: str) -> Optional[dict]:
+    """
+    Одне резолвлення посилання на завантаження: info з extract_info(download=False) (або з info_cache)
+    передається прямо в process_ie_result(download=True), як у yt-dlp --load-info-json.
+    """
+    with yt_dlp.YoutubeDL(build_ydl_opts(out_dir)) as ydl:
+        try:
+            info = info_cache.get(url)
+            if info is None:
                 info = ydl.extract_info(url, download=False)
                 if not info:
                     logger.warning(f"⚠️ [Downloader] No info extracted for {url}")
                     return None
-                
-                info = ydl.extract_info(url, download=True)
-                if not info: return None
+                info = ydl.sanitize_info(info)
+                info_cache.set(url, copy.deepcopy(info))
+            else:
+                logger.info(f"♻️ [Downloader] Reusing cached metadata for {url}")
 
-                filename = ydl.prepare_filename(info)
-                if not os.path.exists(filename):
-                    logger.error(f"❌ [Downloader] File not found after download: {filename}")
-                    return None
+            info = ydl.process_ie_result(info, download=True)
+            if not info: return None
 
-                return {
-                    'path': filename,
-                    'type': 'video', 
-                    'title': info.get('title', ''),
-                    'caption': None 
-                }
-            except Exception as e:
-                # ЛОГУЄМО КОНКРЕТНУ ПОМИЛКУ ЗАВАНТАЖЕННЯ (Twitter/YouTube)
-                logger.error(f"❌ [Downloader] yt-dlp failed for {url}: {e}")
+            filename = ydl.prepare_filename(info)
+            if not os.path.exists(filename):
+                logger.error(f"❌ [Downloader] File not found after download: {filename}")
                 return None
 
-    return await loop.run_in_executor(None, _download)
\ No newline at end of file
+            return {
+                'path': filename,
+                'type': 'video',
+                'title': info.get('title', ''),
+                'caption': None
+            }
+        except Exception as e:
+            # ЛОГУЄМО КОНКРЕТНУ ПОМИЛКУ ЗАВАНТАЖЕННЯ (Twitter/YouTube)
+            logger.error(f"❌ [Downloader] yt-dlp failed for {url}: {e}")
+            # Можливо, спливли підписані посилання — наступна спроба резолвить заново
+            info_cache.invalidate(url)
+            return None
+
+async def download_media_direct(url: str, chat_id: Optional[int] = None) -> dict:
+    """
+    Завантажує медіа в окремому пулі download_executor (ліміт на чат і на весь бот).
+    Якщо черга завантажень переповнена — ExecutorBusy.
+    """
+    logger.info(f"📥 [Downloader] Starting download for: {url}")
+
+    return await download_executor.run(download_sync, url, TEMP_DIR, chat_id=chat_id)
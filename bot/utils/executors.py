@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from config import (
+    DOWNLOAD_EXECUTOR_WORKERS, DOWNLOAD_PER_CHAT_LIMIT, DOWNLOAD_QUEUE_LIMIT, DOWNLOAD_PER_CHAT_QUEUE_LIMIT,
+    SEARCH_EXECUTOR_WORKERS, MEDIA_EXECUTOR_WORKERS
+)
+
+logger = logging.getLogger(__name__)
+
+class ExecutorBusy(Exception):
+    """Черга виконавця переповнена: запит відхилено одразу, замість того щоб чекати невизначено довго."""
+
+class BoundedExecutor:
+    """
+    Іменований пул потоків для одного типу блокуючої роботи (завантаження, пошук, обробка зображень).
+    1. Потоків рівно max_workers, і стільки ж одночасних задач (глобальний семафор) — черга живе
+       в event loop, де її глибину видно й обмежено max_queue.
+    2. per_chat обмежує, скільки задач одного чату виконуються одночасно: флуд з одного чату
+       не забирає всі потоки в інших.
+    3. Понад max_queue очікуючих на спільний пул — ExecutorBusy (деградуємо відмовою, а не зависанням бота).
+       Задачі, що чекають на ліміт свого чату, в max_queue не рахуються: для них окремий ліміт
+       per_chat_queue, тож флуд одного чату отримує відмову сам і не забирає чергу в інших.
+    """
+
+    def __init__(self, name: str, max_workers: int, per_chat: int = 0, max_queue: int = 0, per_chat_queue: int = 0):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.per_chat = per_chat
+        self.max_queue = max_queue
+        self.per_chat_queue = per_chat_queue
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"{name}-worker")
+        self._slots = asyncio.Semaphore(self.max_workers)
+        # chat_id -> [semaphore, кількість задач чату в черзі та в роботі]
+        self._chat_slots: Dict[int, list] = {}
+        self.active = 0
+        # waiting — чекають на спільний пул, chat_waiting — на ліміт свого чату
+        self.waiting = 0
+        self.chat_waiting = 0
+        self.max_waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_ms_total = 0.0
+
+    def _chat_slot(self, chat_id: int) -> asyncio.Semaphore:
+        entry = self._chat_slots.get(chat_id)
+        if entry is None:
+            entry = self._chat_slots[chat_id] = [asyncio.Semaphore(self.per_chat), 0]
+        entry[1] += 1
+        return entry[0]
+
+    def _release_chat(self, chat_id: int):
+        entry = self._chat_slots.get(chat_id)
+        if entry is not None:
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._chat_slots[chat_id]
+
+    def _chat_backlog(self, chat_id: int) -> int:
+        """Скільки задач чату чекає на його ліміт (понад per_chat, що вже в пулі або чекають на нього)."""
+        entry = self._chat_slots.get(chat_id)
+        return max(0, entry[1] - self.per_chat) if entry else 0
+
+    async def run(self, func: Callable[..., Any], *args, chat_id: Optional[int] = None) -> Any:
+        """Виконує func(*args) у пулі з урахуванням лімітів. Може кинути ExecutorBusy."""
+        use_chat = chat_id is not None and self.per_chat > 0
+        if use_chat and self.per_chat_queue and self._chat_backlog(chat_id) >= self.per_chat_queue:
+            self.rejected += 1
+            raise ExecutorBusy(f"{self.name}: chat {chat_id} already has {self.per_chat_queue} tasks waiting")
+        if self.max_queue and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise ExecutorBusy(f"{self.name}: {self.waiting} tasks already waiting")
+
+        chat_slot = self._chat_slot(chat_id) if use_chat else None
+        queued_at = time.perf_counter()
+        acquired_chat = False
+        try:
+            if chat_slot is not None:
+                self.chat_waiting += 1
+                try:
+                    await chat_slot.acquire()
+                finally:
+                    self.chat_waiting -= 1
+                acquired_chat = True
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            try:
+                await self._slots.acquire()
+            finally:
+                self.waiting -= 1
+        except BaseException:
+            if acquired_chat:
+                chat_slot.release()
+            if use_chat:
+                self._release_chat(chat_id)
+            raise
+
+        self.wait_ms_total += (time.perf_counter() - queued_at) * 1000
+        self.active += 1
+
+        def release(fut: asyncio.Future):
+            # Слоти звільняються, коли потік справді завершив роботу, а не коли скасували очікування:
+            # інакше після wait_for-таймауту нові задачі накопичувались би у внутрішній черзі пулу
+            if not fut.cancelled():
+                fut.exception()  # результат міг нікому не знадобитись — позначаємо виняток отриманим
+            self.active -= 1
+            self.completed += 1
+            self._slots.release()
+            if chat_slot is not None:
+                chat_slot.release()
+                self._release_chat(chat_id)
+
+        fut = asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+        fut.add_done_callback(release)
+        return await asyncio.shield(fut)
+
+    def stats(self) -> Dict[str, Any]:
+        started = self.completed + self.active
+        return {
+            "workers": self.max_workers,
+            "active": self.active,
+            "waiting": self.waiting,
+            "chat_waiting": self.chat_waiting,
+            "max_waiting": self.max_waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.wait_ms_total / started, 1) if started else 0.0
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+# Окремі пули: сплеск великих відео не блокує пошук і навпаки
+download_executor = BoundedExecutor(
+    "downloads", DOWNLOAD_EXECUTOR_WORKERS, per_chat=DOWNLOAD_PER_CHAT_LIMIT, max_queue=DOWNLOAD_QUEUE_LIMIT,
+    per_chat_queue=DOWNLOAD_PER_CHAT_QUEUE_LIMIT
+)
+search_executor = BoundedExecutor("search", SEARCH_EXECUTOR_WORKERS)
+media_executor = BoundedExecutor("media", MEDIA_EXECUTOR_WORKERS)
+
+executors = {e.name: e for e in (download_executor, search_executor, media_executor)}
+
+def shutdown_executors():
+    for executor in executors.values():
+        executor.shutdown()
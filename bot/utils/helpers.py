@@ -1,15 +1,19 @@
+import asyncio
 import logging
 import os
-import re
 from sqlalchemy.future import select
 from bot.database.session import AsyncSessionLocal
 from bot.database.models import User, APIKey
 from bot.utils.security import key_manager
+from bot.utils.settings_cache import settings_cache
+from bot.utils.provider_pool import provider_pool
+from bot.utils.html_sanitizer import clean_html, split_html, strip_html
 from bot.ai.openai_provider import OpenAIProvider
 from bot.ai.google_provider import GoogleProvider
 from bot.ai.openrouter_provider import OpenRouterProvider
 from config import DEFAULT_SETTINGS, DEFAULT_GROUP_SETTINGS, OPENROUTER_API_KEY # <--- ДОДАНО ІМПОРТ
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter
 
 logger = logging.getLogger(__name__)
 
@@ -47,104 +51,105 @@ async def get_or_create_user(telegram_entity) -> User:
             session.add(user)
             await session.commit()
             await session.refresh(user)
+            settings_cache.invalidate(entity_id)
         return user
 
-async def get_ai_provider(user_id: int, for_transcription: bool = False):
+async def _get_user_api_key(session, user_id: int, provider_type: str, fallback_key: str):
+    result = await session.execute(
+        select(APIKey).where(APIKey.user_id == user_id, APIKey.provider == provider_type, APIKey.is_active == True)
+    )
+    user_key_obj = result.scalar_one_or_none()
+    return key_manager.decrypt(user_key_obj.encrypted_key) if user_key_obj else fallback_key
+
+async def _resolve_provider(user_id: int, for_transcription: bool):
+    """Визначає (тип провайдера, API ключ, модель) для користувача. Звертається до БД."""
     async with AsyncSessionLocal() as session:
-        user = await session.get(User, user_id)
         if for_transcription:
-            provider_type = 'openai'
-            result = await session.execute(
-                select(APIKey).where(APIKey.user_id == user_id, APIKey.provider == provider_type, APIKey.is_active == True)
-            )
-            user_key_obj = result.scalar_one_or_none()
-            api_key = key_manager.decrypt(user_key_obj.encrypted_key) if user_key_obj else SYSTEM_OPENAI_KEY
-            if not api_key:
-                return None
-            return OpenAIProvider(api_key=api_key)
-        else:
-            model = user.settings.get('model', 'openai/gpt-5.6-luna') if user and user.settings else 'openai/gpt-5.6-luna'
-            
-            # 1. OpenRouter моделі (містять '/')
-            if '/' in model or model.startswith(('deepseek', 'qwen', 'mistral', 'openai/', 'google/')):
-                provider_type = 'openrouter'
-                result = await session.execute(
-                    select(APIKey).where(APIKey.user_id == user_id, APIKey.provider == provider_type, APIKey.is_active == True)
-                )
-                user_key_obj = result.scalar_one_or_none()
-                api_key = key_manager.decrypt(user_key_obj.encrypted_key) if user_key_obj else SYSTEM_OPENROUTER_KEY
-                if not api_key:
-                    return None
-                return OpenRouterProvider(api_key=api_key, model_name=model)
-            
-            # 2. Прямий Google Gemini (якщо без префіксу google/)
-            elif 'gemini' in model.lower():
-                provider_type = 'google'
-                result = await session.execute(
-                    select(APIKey).where(APIKey.user_id == user_id, APIKey.provider == provider_type, APIKey.is_active == True)
-                )
-                user_key_obj = result.scalar_one_or_none()
-                api_key = key_manager.decrypt(user_key_obj.encrypted_key) if user_key_obj else SYSTEM_GOOGLE_KEY
-                if not api_key:
-                    return None
-                return GoogleProvider(api_key=api_key, model_name=model)
-            
-            # 3. Прямий OpenAI
-            else:
-                provider_type = 'openai'
-                result = await session.execute(
-                    select(APIKey).where(APIKey.user_id == user_id, APIKey.provider == provider_type, APIKey.is_active == True)
-                )
-                user_key_obj = result.scalar_one_or_none()
-                api_key = key_manager.decrypt(user_key_obj.encrypted_key) if user_key_obj else SYSTEM_OPENAI_KEY
-                if not api_key:
-                    return None
-                return OpenAIProvider(api_key=api_key)
-
-def clean_html(text: str) -> str:
-    if not text: return ""
-    text = re.sub(r'\*\*(.*?)\*\*', r'<b>\1</b>', text)
-    text = re.sub(r'#{1,6}\s?(.*)', r'<b>\1</b>', text)
-    text = re.sub(r'<(html|head|body|meta|doctype|style|script|link).*?>', '', text, flags=re.IGNORECASE | re.DOTALL)
-    text = re.sub(r'</(html|head|body|meta|style|script|link)>', '', text, flags=re.IGNORECASE)
-    text = text.replace("<ul>", "").replace("</ul>", "")
-    text = text.replace("<ol>", "").replace("</ol>", "")
-    text = text.replace("<li>", "• ").replace("</li>", "\n")
-    text = text.replace("<div>", "").replace("</div>", "\n")
-    text = text.replace("<p>", "").replace("</p>", "\n")
-    text = text.replace("<br>", "\n").replace("<br/>", "\n")
-    text = re.sub(r'<h[1-6]>(.*?)</h[1-6]>', r'<b>\1</b>\n', text)
-    text = text.replace("```html", "").replace("```", "")
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    return text.strip()
-
-async def send_long_message(target, text: str, reply_markup=None, parse_mode=ParseMode.HTML, reply_to_msg_id=None):
-    text = clean_html(text)
+            api_key = await _get_user_api_key(session, user_id, 'openai', SYSTEM_OPENAI_KEY)
+            return 'openai', api_key, None
+
+        user = await session.get(User, user_id)
+        model = user.settings.get('model', 'openai/gpt-5.6-luna') if user and user.settings else 'openai/gpt-5.6-luna'
+
+        # 1. OpenRouter моделі (містять '/')
+        if '/' in model or model.startswith(('deepseek', 'qwen', 'mistral', 'openai/', 'google/')):
+            api_key = await _get_user_api_key(session, user_id, 'openrouter', SYSTEM_OPENROUTER_KEY)
+            return 'openrouter', api_key, model
+
+        # 2. Прямий Google Gemini (якщо без префіксу google/)
+        if 'gemini' in model.lower():
+            api_key = await _get_user_api_key(session, user_id, 'google', SYSTEM_GOOGLE_KEY)
+            return 'google', api_key, model
+
+        # 3. Прямий OpenAI
+        api_key = await _get_user_api_key(session, user_id, 'openai', SYSTEM_OPENAI_KEY)
+        return 'openai', api_key, None
+
+async def get_ai_provider(user_id: int, for_transcription: bool = False):
+    """
+    Повертає провайдера для користувача.
+    Резолвінг ключа/моделі кешується, а OpenAI-сумісні клієнти беруться з provider_pool.
+    """
+    resolved = provider_pool.get_resolved(user_id, for_transcription)
+    if resolved is None:
+        resolved = await _resolve_provider(user_id, for_transcription)
+        provider_pool.set_resolved(user_id, for_transcription, resolved)
+
+    provider_type, api_key, model = resolved
+    if not api_key:
+        return None
+
+    if provider_type == 'openrouter':
+        return provider_pool.acquire('openrouter', api_key, model, lambda: OpenRouterProvider(api_key=api_key, model_name=model))
+    if provider_type == 'google':
+        # GoogleProvider конфігурує глобальний genai (без власного connection pool), тому не пулиться
+        return GoogleProvider(api_key=api_key, model_name=model)
+    return provider_pool.acquire('openai', api_key, None, lambda: OpenAIProvider(api_key=api_key))
+
+async def _send_part(send_func, kwargs: dict):
+    """Одна частина повідомлення; на FloodWait чекає і повторює, а не переходить на plain text."""
+    try:
+        return await send_func(**kwargs)
+    except RetryAfter as e:
+        await asyncio.sleep(e.retry_after)
+        return await send_func(**kwargs)
+
+async def send_long_message(target, text: str, reply_markup=None, parse_mode=ParseMode.HTML, reply_to_msg_id=None, clean=True):
+    # clean=False — текст уже очищено (наприклад, IncrementalSanitizer під час стрімінгу)
+    if clean: text = clean_html(text)
     if hasattr(target, 'reply_text'): send_func = target.reply_text; reply_id = target.message_id
     else: send_func = target.send_message; reply_id = None
     if reply_to_msg_id: reply_id = reply_to_msg_id
 
     LIMIT = 4000
-    parts = []
-    inner_text = text
-    while inner_text:
-        if len(inner_text) <= LIMIT: parts.append(inner_text); break
-        pos = inner_text.rfind('\n', 0, LIMIT)
-        if pos == -1: pos = LIMIT
-        parts.append(inner_text[:pos])
-        inner_text = inner_text[pos:].strip()
-
+    is_html = parse_mode == ParseMode.HTML
+    if is_html:
+        # Теги, відкриті на межі частин, закриваються й відкриваються знову; сирі <, >, & екрануються
+        parts = split_html(text, LIMIT)
+    else:
+        parts = []
+        inner_text = text
+        while inner_text:
+            if len(inner_text) <= LIMIT: parts.append(inner_text); break
+            pos = inner_text.rfind('\n', 0, LIMIT)
+            if pos == -1: pos = LIMIT
+            parts.append(inner_text[:pos])
+            inner_text = inner_text[pos:].strip()
+
+    # Частини йдуть строго по черзі: паралельні запити Telegram може доставити не в тому порядку
     for i, part in enumerate(parts):
         kb = reply_markup if i == len(parts) - 1 else None
         kwargs = {'text': part, 'reply_markup': kb, 'parse_mode': parse_mode}
         if reply_id and i == 0: kwargs['reply_to_message_id'] = reply_id
+        if hasattr(target, 'reply_text'): kwargs['quote'] = True
         try:
-            if hasattr(target, 'reply_text'): await send_func(**kwargs, quote=True)
-            else: await send_func(**kwargs)
-        except:
+            await _send_part(send_func, kwargs)
+        except BadRequest as e:
+            if not is_html: raise
+            logger.warning(f"⚠️ HTML part {i + 1}/{len(parts)} rejected, sending as plain text: {e}")
             kwargs['parse_mode'] = None
-            if hasattr(target, 'reply_text'): await send_func(**kwargs)
-            else: await send_func(**kwargs)
+            kwargs['text'] = strip_html(part)
+            await _send_part(send_func, kwargs)
 
 async def beautify_text(user_id: int, text: str) -> tuple[str, str]:
     """Повертає (текст, назва_моделі)."""
@@ -0,0 +1,258 @@
+import html
+import re
+from typing import List
+
+# Завершені рядки обробляються порціями не менше цього розміру (менше викликів regex на коротких рядках)
+MIN_BATCH_CHARS = 512
+
+# Початок тегу, який clean_html видаляє разом з атрибутами (до першого ">", навіть через кілька рядків)
+_REMOVABLE_TAG_START = re.compile(r'<(html|head|body|meta|doctype|style|script|link)', re.IGNORECASE)
+
+# Шаблони clean_html компілюються один раз. Порядок проходів важливий і збігається з історичним:
+# markdown -> <b>, видалення службових тегів, списки/абзаци -> текст, <hN> -> <b>, ```.
+_BOLD = re.compile(r'\*\*(.*?)\*\*')
+# "##{0,5}" еквівалентне "#{1,6}", але з літеральним префіксом, який re шукає швидко
+_HEADING = re.compile(r'##{0,5}\s?(.*)')
+_DROP_OPEN = re.compile(r'<(html|head|body|meta|doctype|style|script|link).*?>', re.IGNORECASE | re.DOTALL)
+_DROP_CLOSE = re.compile(r'</(html|head|body|meta|style|script|link)>', re.IGNORECASE)
+_H_TAG = re.compile(r'<h[1-6]>(.*?)</h[1-6]>')
+# "\n\n\n+" замість "\n{3,}" — той самий збіг, але з літеральним префіксом
+_EXTRA_NEWLINES = re.compile(r'\n\n\n+')
+_TAG_REPLACEMENTS = (
+    ("<ul>", ""), ("</ul>", ""), ("<ol>", ""), ("</ol>", ""),
+    ("<li>", "• "), ("</li>", "\n"),
+    ("<div>", ""), ("</div>", "\n"),
+    ("<p>", ""), ("</p>", "\n"),
+    ("<br>", "\n"), ("<br/>", "\n"),
+)
+
+def _clean_lines(text: str) -> str:
+    """
+    Перетворення clean_html без фінального стиснення порожніх рядків: markdown (**жирний**, # заголовок)
+    та <hN> -> <b>, службові теги, списки, div/p/br та ``` прибираються; b/i/code/pre/a лишаються.
+    Прохід пропускається, якщо в тексті немає його символів.
+    """
+    if "**" in text:
+        text = _BOLD.sub(r'<b>\1</b>', text)
+    if "#" in text:
+        text = _HEADING.sub(r'<b>\1</b>', text)
+    if "<" in text:
+        text = _DROP_OPEN.sub('', text)
+        if "</" in text:
+            text = _DROP_CLOSE.sub('', text)
+        for old, new in _TAG_REPLACEMENTS:
+            text = text.replace(old, new)
+        if "<h" in text:
+            text = _H_TAG.sub(r'<b>\1</b>\n', text)
+    if "```" in text:
+        text = text.replace("```html", "").replace("```", "")
+    return text
+
+def clean_html(text: str) -> str:
+    if not text: return ""
+    text = _clean_lines(text)
+    if "\n\n\n" in text:
+        text = _EXTRA_NEWLINES.sub("\n\n", text)
+    return text.strip()
+
+class IncrementalSanitizer:
+    """
+    clean_html для тексту, що надходить шматками: кожен завершений рядок обробляється один раз,
+    порціями від MIN_BATCH_CHARS, а finish() доробляє лише незавершений хвіст.
+    Результат збігається з clean_html("".join(chunks)). Рядок притримується, доки правило може
+    зачепити наступний: він закінчується на "#" (заголовок з "\\s?" з'їдає перенос) або в ньому
+    відкритий тег <html ...>/<script ...> без ">".
+    """
+
+    def __init__(self):
+        self._pending: List[str] = []
+        self._pending_len = 0
+        self._out: List[str] = []
+        # Пробіли в кінці виходу: або зникнуть при strip(), або злипнуться з наступними \n
+        self._ws_tail = ""
+
+    def feed(self, chunk: str):
+        if not chunk:
+            return
+        self._pending.append(chunk)
+        self._pending_len += len(chunk)
+        if self._pending_len < MIN_BATCH_CHARS or "\n" not in chunk:
+            return
+        text = "".join(self._pending)
+        cut = self._safe_cut(text)
+        if cut <= 0:
+            self._pending = [text]
+            return
+        self._pending = [text[cut:]] if cut < len(text) else []
+        self._pending_len = len(text) - cut
+        self._emit(_clean_lines(text[:cut]))
+
+    @staticmethod
+    def _safe_cut(text: str) -> int:
+        """Позиція одразу після останнього \\n, на якій текст можна розрізати без зміни результату."""
+        pos = text.rfind("\n")
+        while pos >= 0:
+            last_close = text.rfind(">", 0, pos)
+            opened = None
+            for opened in _REMOVABLE_TAG_START.finditer(text, last_close + 1, pos):
+                pass
+            if opened is not None:
+                pos = text.rfind("\n", 0, opened.start())
+                continue
+            if pos > 0 and text[pos - 1] == "#":
+                pos = text.rfind("\n", 0, pos)
+                continue
+            return pos + 1
+        return 0
+
+    def _emit(self, cleaned: str):
+        text = self._ws_tail + cleaned
+        if not self._out:
+            text = text.lstrip()
+        text = _EXTRA_NEWLINES.sub('\n\n', text)
+        body = text.rstrip()
+        self._ws_tail = text[len(body):]
+        if body:
+            self._out.append(body)
+
+    def finish(self) -> str:
+        """Обробляє залишок і повертає повний очищений текст."""
+        if self._pending:
+            self._emit(_clean_lines("".join(self._pending)))
+            self._pending = []
+            self._pending_len = 0
+        self._ws_tail = ""
+        return "".join(self._out)
+
+# Теги, які приймає Telegram (parse_mode=HTML); решта екранується як текст
+TELEGRAM_TAGS = {
+    "b", "strong", "i", "em", "u", "ins", "s", "strike", "del", "a", "code", "pre",
+    "span", "tg-spoiler", "tg-emoji", "blockquote",
+}
+_TAG_CANDIDATE = re.compile(r'<(/?)([a-zA-Z][\w-]*)([^<>]*)>')
+# Telegram приймає числові сутності та лише чотири іменовані
+_ENTITY = re.compile(r'&(?:#\d+|#x[0-9a-fA-F]+|lt|gt|amp|quot);')
+
+def _escape_text(text: str) -> str:
+    """Екранує <, > та & поза тегами (підтримувані Telegram сутності на кшталт &amp; лишаються як є)."""
+    if "&" in text:
+        out, pos = [], 0
+        for m in _ENTITY.finditer(text):
+            out.append(text[pos:m.start()].replace("&", "&amp;"))
+            out.append(m.group())
+            pos = m.end()
+        out.append(text[pos:].replace("&", "&amp;"))
+        text = "".join(out)
+    return text.replace("<", "&lt;").replace(">", "&gt;")
+
+def _is_telegram_tag(name: str, attrs: str) -> bool:
+    if name not in TELEGRAM_TAGS:
+        return False
+    # <span> Telegram приймає лише як спойлер
+    return name != "span" or "tg-spoiler" in attrs
+
+def _html_tokens(text: str) -> list:
+    """
+    Розбір на (kind, value, name): text | open | close. Невідомі теги та зайві закриваючі теги стають
+    текстом/відкидаються, вкладеність вирівнюється, незакриті теги закриваються в кінці —
+    кожен токен можна надсилати з parse_mode=HTML без помилки розбору.
+    """
+    tokens, stack, pos = [], [], 0
+    for m in _TAG_CANDIDATE.finditer(text):
+        closing, name, attrs = m.group(1), m.group(2).lower(), m.group(3)
+        if not _is_telegram_tag(name, attrs):
+            continue
+        if m.start() > pos:
+            tokens.append(("text", _escape_text(text[pos:m.start()]), None))
+        pos = m.end()
+        if not closing:
+            tokens.append(("open", m.group(), name))
+            stack.append(name)
+        elif name in stack:
+            while stack:
+                top = stack.pop()
+                tokens.append(("close", f"</{top}>", top))
+                if top == name:
+                    break
+        # закриваючий тег без відкритого відкидається
+    if pos < len(text):
+        tokens.append(("text", _escape_text(text[pos:]), None))
+    while stack:
+        top = stack.pop()
+        tokens.append(("close", f"</{top}>", top))
+    return tokens
+
+def _text_cut(text: str, limit: int) -> int:
+    """Де розрізати текстовий токен у межах limit: на переносі, пробілі, інакше жорстко (не всередині &...;)."""
+    cut = text.rfind("\n", 0, limit + 1)
+    if cut <= 0:
+        cut = text.rfind(" ", 0, limit + 1)
+    if cut <= 0:
+        cut = limit
+    amp = text.rfind("&", max(0, cut - 10), cut)
+    if amp >= 0 and ";" not in text[amp:cut]:
+        cut = amp
+    return cut
+
+def _skip_separator(text: str) -> str:
+    """Прибирає лише один роздільник на межі частин (перенос або пробіл) — відступи в <pre>/<code> лишаються."""
+    return text[1:] if text[:1] in ("\n", " ") else text
+
+def split_html(text: str, limit: int = 4000) -> List[str]:
+    """
+    Ділить HTML для Telegram на частини до limit символів (разом з тегами). Ріже на переносах рядків,
+    не всередині тегу чи сутності; відкриті на межі теги закриваються в кінці частини і
+    відкриваються знову на початку наступної, тож кожна частина — валідний HTML.
+    """
+    parts: List[str] = []
+    stack: List[tuple] = []  # (name, відкриваючий тег)
+    current: List[str] = []
+    length = 0
+    closers = 0  # довжина закриваючих тегів, які треба дописати до поточної частини
+    has_text = False
+
+    def flush():
+        nonlocal current, length, has_text
+        if has_text:
+            parts.append("".join(current) + "".join(f"</{name}>" for name, _ in reversed(stack)))
+        reopen = "".join(tag for _, tag in stack)
+        current, length, has_text = [reopen], len(reopen), False
+
+    for kind, value, name in _html_tokens(text):
+        if kind == "open":
+            if has_text and length + len(value) + closers + len(name) + 3 > limit:
+                flush()
+            current.append(value)
+            length += len(value)
+            stack.append((name, value))
+            closers += len(name) + 3
+        elif kind == "close":
+            current.append(value)
+            length += len(value)
+            stack.pop()
+            closers -= len(name) + 3
+        else:
+            while value:
+                room = limit - length - closers
+                if len(value) <= room:
+                    current.append(value)
+                    length += len(value)
+                    has_text = has_text or bool(value.strip())
+                    break
+                cut = _text_cut(value, room) if room > 0 else 0
+                if cut <= 0 and has_text:
+                    flush()
+                    value = value[1:] if value.startswith("\n") else value
+                    continue
+                cut = max(cut, 1)
+                current.append(value[:cut])
+                length += cut
+                has_text = has_text or bool(value[:cut].strip())
+                flush()
+                value = _skip_separator(value[cut:])
+    flush()
+    return parts
+
+def strip_html(text: str) -> str:
+    """Текст частини без розмітки (запасний варіант, якщо Telegram все ж відхилив HTML)."""
+    return html.unescape(_TAG_CANDIDATE.sub("", text))
@@ -1,95 +1,218 @@
+import asyncio
 import logging
-from datetime import datetime, timezone
-from typing import Tuple
+from datetime import datetime, date, timezone
+from typing import Dict, Optional, Tuple
 from sqlalchemy.future import select
-from sqlalchemy import and_
-from sqlalchemy.exc import IntegrityError
+from sqlalchemy import and_, func
+from sqlalchemy.dialects import sqlite, postgresql
 from bot.database.session import AsyncSessionLocal
 from bot.database.models import DailyTranscriptionUsage
-from config import DAILY_TRANSCRIPTION_LIMIT_SECONDS
+from config import DAILY_TRANSCRIPTION_LIMIT_SECONDS, QUOTA_FLUSH_INTERVAL_SECONDS
 
 logger = logging.getLogger(__name__)
 
-# ponytail: Concurrent uploads can slightly overshoot; atomic reservation is the upgrade path if abuse becomes a real issue.
+class QuotaReservation:
+    """
+    Зарезервовані секунди транскрибації.
+    Секунди вже враховані в daily_transcription_usage; при невдачі їх повертає release_transcription_quota.
+    """
 
-async def get_daily_transcription_used_seconds(user_id: int) -> int:
+    def __init__(self, user_id: int, seconds: int, usage_date: date):
+        self.user_id = user_id
+        self.seconds = seconds
+        self.usage_date = usage_date
+        self.settled = False
+
+def _upsert_usage_stmt(dialect_name: str, user_id: int, usage_date: date, seconds: int):
+    """
+    INSERT ... ON CONFLICT DO UPDATE: одна атомарна інкрементація рядка (user_id, usage_date).
+    Ліміт тут не перевіряється — це робить DailyQuotaCounter.try_add у пам'яті до запису дельти.
+    """
+    dialect_insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    # Скалярний max() у SQLite == greatest() у PostgreSQL: від'ємна дельта (повернення) не опускає нижче 0
+    clamp = func.greatest if dialect_name == "postgresql" else func.max
+    stmt = dialect_insert(DailyTranscriptionUsage).values(user_id=user_id, usage_date=usage_date, seconds_used=max(seconds, 0))
+    current = DailyTranscriptionUsage.seconds_used
+    return stmt.on_conflict_do_update(
+        index_elements=[DailyTranscriptionUsage.user_id, DailyTranscriptionUsage.usage_date],
+        set_={"seconds_used": clamp(current + seconds, 0)}
+    )
+
+def _limit_message(used: int) -> str:
+    if used >= DAILY_TRANSCRIPTION_LIMIT_SECONDS:
+        return "⚠️ Ліміт транскрибації на сьогодні вичерпано (60 хв)."
+    remaining_seconds = max(0, DAILY_TRANSCRIPTION_LIMIT_SECONDS - used)
+    remaining_mins = max(1, remaining_seconds // 60)
+    return f"⚠️ Перевищено денний ліміт транскрибації (60 хв). Залишилось: ~{remaining_mins} хв."
+
+class DailyQuotaCounter:
     """
-    Повертає кількість секунд медіа, успішно транскрибованих користувачем за поточний календарний день (UTC).
+    In-process лічильник денного використання транскрибації, авторитетний для поточного дня UTC.
+    1. Лінива гідрація: при першому зверненні за користувачем читаємо daily_transcription_usage один раз.
+    2. Усі зміни йдуть у пам'ять (перевірка ліміту — без запиту до БД) і накопичуються як дельти.
+    3. flush() пише дельти порцією UPSERT-ів у одній транзакції (інтервальна задача + post_shutdown).
+    4. Зі зміною дня UTC лічильники скидаються; дельти попереднього дня ще дописуються.
+    Після рестарту посеред дня гідрація з БД відновлює все, що встигло бути скинуте.
     """
-    today_utc = datetime.now(timezone.utc).date()
-    async with AsyncSessionLocal() as session:
-        stmt = select(DailyTranscriptionUsage).where(
-            and_(
-                DailyTranscriptionUsage.user_id == user_id,
-                DailyTranscriptionUsage.usage_date == today_utc
+
+    def __init__(self):
+        self._day: Optional[date] = None
+        self._used: Dict[int, int] = {}
+        self._pending: Dict[Tuple[int, date], int] = {}
+        self._flush_lock = asyncio.Lock()
+        self.hydrations = 0
+        self.flushes = 0
+
+    @staticmethod
+    def _today() -> date:
+        return datetime.now(timezone.utc).date()
+
+    def _roll_day(self) -> date:
+        today = self._today()
+        if self._day != today:
+            self._day = today
+            self._used = {}
+        return today
+
+    async def _load(self, user_id: int, usage_date: date) -> int:
+        async with AsyncSessionLocal() as session:
+            stmt = select(DailyTranscriptionUsage.seconds_used).where(
+                and_(
+                    DailyTranscriptionUsage.user_id == user_id,
+                    DailyTranscriptionUsage.usage_date == usage_date
+                )
             )
-        )
-        res = await session.execute(stmt)
-        usage = res.scalar_one_or_none()
-        return usage.seconds_used if usage else 0
+            return (await session.execute(stmt)).scalar_one_or_none() or 0
+
+    async def get_used(self, user_id: int) -> int:
+        """Використані секунди за сьогодні (UTC). БД читається лише при першому зверненні за день."""
+        today = self._roll_day()
+        if user_id not in self._used:
+            stored = await self._load(user_id, today)
+            self.hydrations += 1
+            # Поки йшло читання, інша корутина могла вже гідрувати й змінити значення
+            if self._roll_day() == today:
+                self._used.setdefault(user_id, stored)
+        return self._used.get(user_id, 0)
+
+    async def try_add(self, user_id: int, seconds: int, cap: Optional[int] = None) -> Tuple[Optional[date], int]:
+        """
+        Додає seconds до сьогоднішнього лічильника, якщо не перевищено cap.
+        Перевірка й інкремент виконуються без await між ними, тому атомарні в межах event loop.
+        Повертає (usage_date, used) при успіху або (None, used) при відмові.
+        """
+        while True:
+            await self.get_used(user_id)
+            today = self._roll_day()
+            # Якщо під час гідрації настала північ UTC — гідруємо вже новий день
+            if user_id in self._used:
+                break
+        used = self._used[user_id]
+        if cap is not None and (used >= cap or used + seconds > cap):
+            return None, used
+        self._used[user_id] = used + seconds
+        if seconds:
+            key = (user_id, today)
+            self._pending[key] = self._pending.get(key, 0) + seconds
+        return today, used + seconds
+
+    def refund(self, user_id: int, seconds: int, usage_date: date):
+        """Повертає секунди резерву (без await: повернення не може загубитися між перевірками)."""
+        if seconds <= 0:
+            return
+        if usage_date == self._roll_day() and user_id in self._used:
+            self._used[user_id] = max(0, self._used[user_id] - seconds)
+        key = (user_id, usage_date)
+        self._pending[key] = self._pending.get(key, 0) - seconds
+
+    async def flush(self) -> int:
+        """Скидає накопичені дельти в daily_transcription_usage. Повертає кількість записаних рядків."""
+        self._roll_day()
+        async with self._flush_lock:
+            batch = {key: delta for key, delta in self._pending.items() if delta}
+            self._pending = {}
+            if not batch:
+                return 0
+            try:
+                async with AsyncSessionLocal() as session:
+                    dialect_name = session.bind.dialect.name
+                    for (user_id, usage_date), delta in batch.items():
+                        await session.execute(_upsert_usage_stmt(dialect_name, user_id, usage_date, delta))
+                    await session.commit()
+                self.flushes += 1
+                return len(batch)
+            except Exception as e:
+                # Повертаємо дельти в буфер, щоб дописати наступного разу
+                for key, delta in batch.items():
+                    self._pending[key] = self._pending.get(key, 0) + delta
+                logger.error(f"Failed to flush transcription usage ({len(batch)} rows): {e}")
+                return 0
+
+    def reset(self):
+        """Повністю скидає стан (тести, ручне обслуговування). Непоскидані дельти губляться."""
+        self._day = None
+        self._used = {}
+        self._pending = {}
+        self.hydrations = 0
+        self.flushes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self._used),
+            "pending": sum(1 for delta in self._pending.values() if delta),
+            "hydrations": self.hydrations,
+            "flushes": self.flushes
+        }
+
+quota_counter = DailyQuotaCounter()
+
+async def get_daily_transcription_used_seconds(user_id: int) -> int:
+    """
+    Повертає кількість секунд медіа, врахованих користувачу за поточний календарний день (UTC).
+    """
+    return await quota_counter.get_used(user_id)
 
 async def check_transcription_limit(user_id: int, duration_seconds: int = 0) -> Tuple[bool, str]:
     """
     Перевіряє, чи не вичерпано денний ліміт транскрибації для користувача (60 хв/добу UTC).
-    Повертає (True, "") якщо ліміт дозволяє транскрибацію, або (False, error_msg) якщо ліміт вичерпано.
+    Лише читання: для обробки медіа використовуйте reserve_transcription_quota, яка не має гонки.
     """
     used = await get_daily_transcription_used_seconds(user_id)
     if used >= DAILY_TRANSCRIPTION_LIMIT_SECONDS:
-        return False, "⚠️ Ліміт транскрибації на сьогодні вичерпано (60 хв)."
+        return False, _limit_message(used)
 
     if duration_seconds > 0 and (used + duration_seconds > DAILY_TRANSCRIPTION_LIMIT_SECONDS):
-        remaining_seconds = max(0, DAILY_TRANSCRIPTION_LIMIT_SECONDS - used)
-        remaining_mins = max(1, remaining_seconds // 60)
-        return False, f"⚠️ Перевищено денний ліміт транскрибації (60 хв). Залишилось: ~{remaining_mins} хв."
+        return False, _limit_message(used)
 
     return True, ""
 
+async def reserve_transcription_quota(user_id: int, duration_seconds: int) -> Tuple[Optional[QuotaReservation], str]:
+    """
+    Атомарно резервує duration_seconds з денного ліміту в лічильнику quota_counter.
+    Повертає (reservation, "") або (None, error_msg). Паралельні завантаження не можуть перебрати ліміт.
+    """
+    duration_seconds = max(0, int(duration_seconds or 0))
+    usage_date, used = await quota_counter.try_add(user_id, duration_seconds, DAILY_TRANSCRIPTION_LIMIT_SECONDS)
+    if usage_date is None:
+        return None, _limit_message(used)
+    return QuotaReservation(user_id, duration_seconds, usage_date), ""
+
+async def commit_transcription_quota(reservation: Optional[QuotaReservation]):
+    """Підтверджує резерв після успішного розпізнавання (секунди лишаються врахованими)."""
+    if reservation is not None:
+        reservation.settled = True
+
+async def release_transcription_quota(reservation: Optional[QuotaReservation]):
+    """Повертає зарезервовані секунди, якщо транскрибація не вдалася. Повторний виклик ігнорується."""
+    if reservation is None or reservation.settled:
+        return
+    reservation.settled = True
+    quota_counter.refund(reservation.user_id, reservation.seconds, reservation.usage_date)
+
 async def record_transcription_usage(user_id: int, duration_seconds: int):
     """
-    Фіксує використані секунди транскрибації в базі даних після успішного розпізнавання.
+    Фіксує використані секунди транскрибації без перевірки ліміту.
     """
     if duration_seconds <= 0:
         return
-
-    today_utc = datetime.now(timezone.utc).date()
-    async with AsyncSessionLocal() as session:
-        try:
-            stmt = select(DailyTranscriptionUsage).where(
-                and_(
-                    DailyTranscriptionUsage.user_id == user_id,
-                    DailyTranscriptionUsage.usage_date == today_utc
-                )
-            )
-            res = await session.execute(stmt)
-            usage = res.scalar_one_or_none()
-            if usage:
-                usage.seconds_used += duration_seconds
-            else:
-                usage = DailyTranscriptionUsage(
-                    user_id=user_id,
-                    usage_date=today_utc,
-                    seconds_used=duration_seconds
-                )
-                session.add(usage)
-            await session.commit()
-        except IntegrityError:
-            # Обробка конфлікту паралельних вставок для одного користувача та дати UTC
-            try:
-                await session.rollback()
-                stmt = select(DailyTranscriptionUsage).where(
-                    and_(
-                        DailyTranscriptionUsage.user_id == user_id,
-                        DailyTranscriptionUsage.usage_date == today_utc
-                    )
-                )
-                res = await session.execute(stmt)
-                usage = res.scalar_one_or_none()
-                if usage:
-                    usage.seconds_used += duration_seconds
-                    await session.commit()
-                else:
-                    logger.error(f"Failed to recover concurrent transcription usage for user {user_id}: row not found after rollback.")
-            except Exception as e:
-                logger.error(f"Failed to recover concurrent transcription usage for user {user_id}: {e}")
-        except Exception as e:
-            logger.error(f"Failed to record transcription usage for user {user_id}: {e}")
+    await quota_counter.try_add(user_id, duration_seconds)
@@ -1,9 +1,13 @@
 
 import os
+import base64
 import shutil
 import logging
 import asyncio
+from contextlib import asynccontextmanager
 from typing import List, Optional
+from telegram import InputFile
+from bot.utils.executors import media_executor
 from config import TEMP_DIR
 
 logger = logging.getLogger(__name__)
@@ -106,6 +110,40 @@ async def download_file(telegram_file, file_id: str) -> str:
     await telegram_file.download_to_drive(file_path)
     return file_path
 
+def read_image_base64(image_path: str) -> str:
+    """Читає зображення і кодує в base64 (блокуюче; викликати через media_executor)."""
+    with open(image_path, "rb") as f:
+        return base64.b64encode(f.read()).decode('utf-8')
+
+def load_pil_image(image_path: str):
+    """Відкриває і декодує зображення PIL (блокуюче; викликати через media_executor)."""
+    import PIL.Image
+    img = PIL.Image.open(image_path)
+    img.load()
+    return img
+
+def _close_and_remove(handle, path: str, remove: bool):
+    try:
+        handle.close()
+    finally:
+        if remove:
+            cleanup_files([path])
+
+@asynccontextmanager
+async def staged_upload(path: str, remove: bool = True):
+    """
+    Готує файл з диска до відправки в Telegram без читання в пам'ять.
+    1. open() виконується в media_executor, а не в event loop.
+    2. InputFile(read_file_handle=False) передає дескриптор у httpx, який стрімить multipart порціями по 64 КБ —
+       пам'ять не залежить від розміру файлу.
+    3. На виході (успіх чи виняток) файл закривається і, якщо remove, видаляється.
+    """
+    handle = await media_executor.run(open, path, "rb")
+    try:
+        yield InputFile(handle, filename=os.path.basename(path), read_file_handle=False)
+    finally:
+        await media_executor.run(_close_and_remove, handle, path, remove)
+
 def cleanup_files(paths: list):
     """Видаляє тимчасові файли"""
     for path in paths:
@@ -0,0 +1,199 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from telegram import InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo
+from config import MEDIA_CACHE_TTL_SECONDS, MEDIA_CACHE_MAX_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Параметри, що не впливають на вміст (трекінг, шеринг)
+TRACKING_PARAMS = {
+    "igshid", "igsh", "si", "feature", "ref", "ref_src", "ref_url", "s", "t", "_r", "_t",
+    "is_from_webapp", "sender_device", "share_app_id", "share_link_id", "embeds_referring_euri"
+}
+HOST_ALIASES = {
+    "x.com": "twitter.com",
+    "mobile.twitter.com": "twitter.com",
+    "m.youtube.com": "youtube.com",
+    "music.youtube.com": "youtube.com",
+}
+# Типи медіа, які можна переслати за file_id: (атрибут повідомлення, метод Bot)
+MEDIA_KINDS = (
+    ("video", "send_video"),
+    ("animation", "send_animation"),
+    ("photo", "send_photo"),
+    ("audio", "send_audio"),
+    ("document", "send_document"),
+)
+SEND_METHODS = dict(MEDIA_KINDS)
+# Альбом (send_media_group): 2-10 файлів; фото й відео змішуються, аудіо та документи — лише з такими ж
+ALBUM_MAX_SIZE = 10
+ALBUM_INPUT_MEDIA = {
+    "photo": InputMediaPhoto, "video": InputMediaVideo, "audio": InputMediaAudio, "document": InputMediaDocument
+}
+
+def normalize_url(url: str) -> str:
+    """
+    Канонічний ключ посилання: без схеми/www, з аліасами доменів, без трекінгових параметрів і фрагмента.
+    youtu.be/ID та youtube.com/watch?v=ID дають однаковий ключ.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    host = HOST_ALIASES.get(host, host)
+    path = parts.path.rstrip("/") or "/"
+    query = [
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=False)
+        if k.lower() not in TRACKING_PARAMS and not k.lower().startswith("utm_")
+    ]
+
+    if host == "youtu.be" and path != "/":
+        host, query = "youtube.com", [("v", path.lstrip("/"))] + [(k, v) for k, v in query if k != "v"]
+        path = "/watch"
+
+    return urlunsplit(("", host, path, urlencode(sorted(query)), "")).lstrip("/")
+
+def extract_file_ref(message) -> Optional[Tuple[str, str]]:
+    """(kind, file_id) медіа повідомлення Telegram або None."""
+    if message is None:
+        return None
+    for kind, _ in MEDIA_KINDS:
+        media = getattr(message, kind, None)
+        if not media:
+            continue
+        if kind == "photo":
+            media = media[-1]  # найбільший розмір
+        file_id = getattr(media, "file_id", None)
+        if isinstance(file_id, str):
+            return kind, file_id
+    return None
+
+class MediaCache:
+    """
+    In-process TTL/LRU кеш завантажених медіа: нормалізоване посилання -> file_id у Telegram.
+    Повторне посилання (інший чат, репост) відправляється за file_id без yt-dlp та без userbot.
+    Для альбомів зберігається кілька файлів; новий результат для того ж посилання замінює старий.
+    Файли альбому, що надходять по одному, збираються окремо і потрапляють у кеш лише всі разом.
+    """
+
+    def __init__(self, ttl_seconds: float = MEDIA_CACHE_TTL_SECONDS, max_size: int = MEDIA_CACHE_MAX_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        # key -> (expires_at, [(kind, file_id), ...])
+        self._data: "OrderedDict[str, tuple[float, List[Tuple[str, str]]]]" = OrderedDict()
+        # (key, source) -> файли незавершеного альбому; source — хто його наповнює (id завдання)
+        self._staging: "OrderedDict[tuple, List[Tuple[str, str]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def get(self, url: str) -> Optional[List[Tuple[str, str]]]:
+        """Список (kind, file_id) для посилання або None."""
+        key = normalize_url(url)
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, files = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return list(files)
+
+    def add(self, url: str, kind: str, file_id: str, source: Any = None, total: int = 1):
+        """
+        Додає файл посилання. total > 1 — файл альбому з total файлів від source (одне завдання):
+        файли збираються окремо, і запис з'являється (замінюючи старий) лише коли надійшли всі —
+        get() ніколи не поверне частковий альбом.
+        """
+        if self.max_size <= 0 or kind not in SEND_METHODS:
+            return
+        key = normalize_url(url)
+        files = [(kind, file_id)]
+        if total > 1:
+            files = self._staging.setdefault((key, source), [])
+            self._staging.move_to_end((key, source))
+            if (kind, file_id) not in files:
+                files.append((kind, file_id))
+            while len(self._staging) > self.max_size:
+                self._staging.popitem(last=False)
+            if len(files) < total:
+                return
+            self._staging.pop((key, source), None)
+
+        self._data[key] = (time.monotonic() + self.ttl_seconds, files)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evicted += 1
+
+    def remember(self, url: str, message, source: Any = None, total: int = 1) -> bool:
+        """Кешує медіа з надісланого/отриманого повідомлення. True, якщо медіа знайдено."""
+        ref = extract_file_ref(message)
+        if ref is None:
+            return False
+        self.add(url, *ref, source=source, total=total)
+        return True
+
+    def invalidate(self, url: str):
+        self._data.pop(normalize_url(url), None)
+
+    def clear(self):
+        self._data.clear()
+        self._staging.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+            "size": len(self._data),
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+media_cache = MediaCache()
+
+def _album_batches(files: List[Tuple[str, str]]) -> Optional[List[list]]:
+    """Файли як альбоми по 2-10 (рівні частини, без одиночного хвоста) або None, якщо типи не поєднуються."""
+    kinds = {kind for kind, _ in files}
+    if not (kinds <= {"photo", "video"} or kinds == {"audio"} or kinds == {"document"}):
+        return None
+    chunks = -(-len(files) // ALBUM_MAX_SIZE)
+    size = -(-len(files) // chunks)
+    return [
+        [ALBUM_INPUT_MEDIA[kind](file_id) for kind, file_id in files[i:i + size]]
+        for i in range(0, len(files), size)
+    ]
+
+async def send_cached_media(bot, chat_id: int, url: str, reply_to_message_id: Optional[int] = None) -> bool:
+    """
+    Відправляє закешовані файли за file_id (без повторного завантаження); кілька файлів — альбомом.
+    False — кешу немає або Telegram відхилив перший же запит (запис скидається, далі звичайний шлях).
+    Якщо частину вже надіслано, повертає True: звичайний шлях надіслав би все повторно.
+    """
+    files = media_cache.get(url)
+    if not files:
+        return False
+
+    albums = _album_batches(files) if len(files) > 1 else None
+    for sent, batch in enumerate(albums or files):
+        try:
+            if albums:
+                await bot.send_media_group(chat_id, batch, reply_to_message_id=reply_to_message_id)
+            else:
+                kind, file_id = batch
+                await getattr(bot, SEND_METHODS[kind])(chat_id, file_id, reply_to_message_id=reply_to_message_id)
+        except Exception as e:
+            logger.warning(f"⚠️ Cached file_id rejected for {url} after {sent} sends: {e}")
+            media_cache.invalidate(url)
+            return sent > 0
+    return True
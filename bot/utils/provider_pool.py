@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+from config import PROVIDER_POOL_MAX_SIZE, PROVIDER_POOL_IDLE_SECONDS, SETTINGS_CACHE_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# (provider_type, api_key, model)
+ResolvedProvider = Tuple[str, Optional[str], Optional[str]]
+
+class ProviderPool:
+    """
+    Пул довгоживучих AI провайдерів.
+    1. Інстанси (AsyncOpenAI всередині) ключуються як (тип провайдера, відбиток ключа, модель),
+       тому httpx connection pool і TLS-сесія переживають окремі запити.
+    2. Результат резолвінгу користувача (тип, розшифрований ключ, модель) кешується з TTL,
+       щоб не ходити в БД і не викликати Fernet на кожне повідомлення. Записи впорядковані за
+       часом закінчення і обмежені max_size: розшифровані ключі давно неактивних користувачів
+       не лишаються в пам'яті.
+    Зміна ключів або моделі має викликати invalidate_user().
+    """
+
+    def __init__(self, max_size: int = PROVIDER_POOL_MAX_SIZE, idle_seconds: float = PROVIDER_POOL_IDLE_SECONDS,
+                 resolve_ttl_seconds: float = SETTINGS_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.resolve_ttl_seconds = resolve_ttl_seconds
+        self._providers: "OrderedDict[tuple, list]" = OrderedDict()
+        # (user_id, for_transcription) -> (expires_at, resolved); порядок вставки == порядок закінчення TTL
+        self._resolved: "OrderedDict[Tuple[int, bool], Tuple[float, ResolvedProvider]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    @staticmethod
+    def fingerprint(api_key: str) -> str:
+        """Короткий відбиток ключа: сам ключ не використовується як ключ словника."""
+        return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+    def get_resolved(self, user_id: int, for_transcription: bool) -> Optional[ResolvedProvider]:
+        entry = self._resolved.get((user_id, for_transcription))
+        if entry is None:
+            return None
+        expires_at, resolved = entry
+        if expires_at <= time.monotonic():
+            del self._resolved[(user_id, for_transcription)]
+            return None
+        return resolved
+
+    def set_resolved(self, user_id: int, for_transcription: bool, resolved: ResolvedProvider):
+        key = (user_id, for_transcription)
+        self._resolved[key] = (time.monotonic() + self.resolve_ttl_seconds, resolved)
+        self._resolved.move_to_end(key)
+        while len(self._resolved) > self.max_size:
+            self._resolved.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        """Скидає резолвінг користувача (після додавання/видалення ключа або зміни моделі)."""
+        self._resolved.pop((user_id, False), None)
+        self._resolved.pop((user_id, True), None)
+
+    def acquire(self, provider_type: str, api_key: str, model: Optional[str], factory: Callable[[], Any]):
+        """Повертає існуючий провайдер з пулу або створює новий через factory()."""
+        now = time.monotonic()
+        self._evict_idle(now)
+
+        key = (provider_type, self.fingerprint(api_key), model)
+        entry = self._providers.get(key)
+        if entry is not None:
+            entry[1] = now
+            self._providers.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+        self.misses += 1
+        provider = factory()
+        self._providers[key] = [provider, now]
+        while len(self._providers) > self.max_size:
+            # LRU-витіснення: клієнт може ще стрімити відповідь, тому просто відпускаємо посилання
+            self._providers.popitem(last=False)
+            self.evicted += 1
+        return provider
+
+    def _evict_idle(self, now: float):
+        while self._resolved:
+            key, (expires_at, _) = next(iter(self._resolved.items()))
+            if expires_at > now:
+                break
+            del self._resolved[key]
+        while self._providers:
+            key, (provider, last_used) = next(iter(self._providers.items()))
+            if now - last_used < self.idle_seconds:
+                break
+            del self._providers[key]
+            self.evicted += 1
+            self._close_provider(provider)
+
+    @staticmethod
+    def _close_provider(provider):
+        """Закриває httpx-пул простоюючого клієнта у фоні."""
+        client = getattr(provider, 'client', None)
+        close = getattr(client, 'close', None)
+        if close is None:
+            return
+        try:
+            asyncio.get_running_loop().create_task(close())
+        except Exception as e:
+            logger.debug(f"Provider close skipped: {e}")
+
+    def clear(self):
+        self._providers.clear()
+        self._resolved.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+            "size": len(self._providers),
+            "resolved": len(self._resolved)
+        }
+
+provider_pool = ProviderPool()
@@ -1,12 +1,308 @@
+import asyncio
 import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
 from sqlalchemy.future import select
-from sqlalchemy import func, delete
+from sqlalchemy import func, delete, update, and_, union_all
+from sqlalchemy.dialects import sqlite, postgresql
 from bot.database.session import AsyncSessionLocal
-from bot.database.models import DownloadQueue
+from bot.database.models import DownloadQueue, DownloadQueueDaily
+from bot.utils.queue_notify import queue_notifier
+from bot.utils.donor_pool import route_donor
+from config import QUEUE_LEASE_SECONDS, QUEUE_MAX_ATTEMPTS, QUEUE_ARCHIVE_AFTER_HOURS
+
+# Скільки останніх завершених завдань враховувати для p50/p95
+TURNAROUND_SAMPLE_SIZE = 1000
+# Статуси, після яких завдання більше не змінюється і може бути заархівоване
+TERMINAL_STATUSES = ("done", "error", "timeout", "failed_by_donor", "dead")
+ARCHIVE_BATCH_SIZE = 500
+
+# Статистика останньої архівації (для /stats)
+last_archive: Optional[dict] = None
 
 logger = logging.getLogger(__name__)
 
-async def get_queue_stats() -> dict[str, int]:
+async def enqueue_download(chat_id: int, message_id: int, link: str) -> int:
+    """
+    Додає посилання в чергу userbot і одразу будить його (без очікування циклу опитування).
+    Донор визначається одразу: воркери userbot беруть лише завдання свого донора.
+    Повертає ID завдання.
+    """
+    async with AsyncSessionLocal() as session:
+        queue_item = DownloadQueue(
+            user_id=chat_id, message_id=message_id, link=link, status="pending",
+            donor=route_donor(link), created_at=datetime.now(timezone.utc)
+        )
+        session.add(queue_item)
+        await session.commit()
+    queue_notifier.notify()
+    return queue_item.id
+
+async def claim_next_task(worker_id: str, lease_seconds: int = QUEUE_LEASE_SECONDS,
+                          max_attempts: int = QUEUE_MAX_ATTEMPTS, donor: Optional[str] = None) -> Optional[DownloadQueue]:
+    """
+    Атомарно бере найстаріше доступне завдання одним UPDATE ... RETURNING.
+    Доступне = pending або processing з простроченою орендою (consumer впав посеред роботи).
+    donor — лише завдання, призначені цьому донору (воркер userbot обслуговує одного донора).
+    На PostgreSQL підзапит бере рядок FOR UPDATE SKIP LOCKED, тому кілька consumer'ів не отримають те саме завдання.
+    """
+    now = datetime.now(timezone.utc)
+    routed = [DownloadQueue.donor == donor] if donor is not None else []
+    # Дві індексовані гілки замість OR (з OR SQLite сканує всю таблицю разом з історією):
+    # pending — частковий індекс, прострочені processing — ix_download_queue_status_lease
+    pending = (
+        select(DownloadQueue.id)
+        .where(and_(DownloadQueue.status == "pending", DownloadQueue.attempts < max_attempts, *routed))
+        .order_by(DownloadQueue.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .subquery()
+    )
+    expired = (
+        select(DownloadQueue.id)
+        .where(and_(
+            DownloadQueue.status == "processing",
+            DownloadQueue.lease_until < now,
+            DownloadQueue.attempts < max_attempts,
+            *routed
+        ))
+        .order_by(DownloadQueue.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .subquery()
+    )
+    available = union_all(select(pending.c.id), select(expired.c.id)).subquery()
+    candidate = select(func.min(available.c.id)).scalar_subquery()
+    stmt = (
+        update(DownloadQueue)
+        .where(DownloadQueue.id == candidate)
+        .values(
+            status="processing",
+            claimed_by=worker_id,
+            claimed_at=now,
+            lease_until=now + timedelta(seconds=lease_seconds),
+            attempts=DownloadQueue.attempts + 1
+        )
+        .returning(DownloadQueue)
+        .execution_options(synchronize_session=False)
+    )
+    async with AsyncSessionLocal() as session:
+        task = (await session.execute(stmt)).scalar_one_or_none()
+        await session.commit()
+        return task
+
+async def route_unassigned_tasks() -> int:
+    """
+    Призначає донора активним завданням без нього (поставлені до маршрутизації при enqueue),
+    інакше жоден воркер userbot їх не візьме. Викликається userbot при старті.
+    """
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(
+            select(DownloadQueue.id, DownloadQueue.link)
+            .where(and_(DownloadQueue.donor.is_(None), DownloadQueue.status.in_(("pending", "processing"))))
+        )).all()
+        by_donor: Dict[str, List[int]] = {}
+        for task_id, link in rows:
+            by_donor.setdefault(route_donor(link), []).append(task_id)
+        for donor, ids in by_donor.items():
+            await session.execute(update(DownloadQueue).where(DownloadQueue.id.in_(ids)).values(donor=donor))
+        await session.commit()
+    if rows:
+        logger.info(f"🧭 Routed {len(rows)} queued tasks without a donor.")
+    return len(rows)
+
+async def finish_task(task_id: int, worker_id: str, status: str, donor: Optional[str] = None,
+                      error: Optional[str] = None, result_message_ids: Optional[List[int]] = None) -> bool:
+    """
+    Фіналізує завдання, лише якщо оренда досі належить worker_id.
+    Результат пишеться в окремі колонки (donor, error, result_message_ids, finished_at), link не змінюється.
+    False — оренду вже перехопив інший consumer (наш результат застарів і не перезаписує його).
+    """
+    values = {"status": status, "lease_until": None, "finished_at": datetime.now(timezone.utc)}
+    if donor is not None:
+        values["donor"] = donor
+    if error is not None:
+        values["error"] = error
+    if result_message_ids is not None:
+        values["result_message_ids"] = result_message_ids
+    async with AsyncSessionLocal() as session:
+        res = await session.execute(
+            update(DownloadQueue)
+            .where(and_(
+                DownloadQueue.id == task_id,
+                DownloadQueue.claimed_by == worker_id,
+                DownloadQueue.status == "processing"
+            ))
+            .values(**values)
+        )
+        await session.commit()
+        return (res.rowcount or 0) > 0
+
+async def release_task(task_id: int, worker_id: str) -> bool:
+    """
+    Повертає завдання в pending без списання спроби (FloodWait — не провина завдання).
+    """
+    async with AsyncSessionLocal() as session:
+        res = await session.execute(
+            update(DownloadQueue)
+            .where(and_(
+                DownloadQueue.id == task_id,
+                DownloadQueue.claimed_by == worker_id,
+                DownloadQueue.status == "processing"
+            ))
+            .values(
+                status="pending",
+                claimed_by=None,
+                lease_until=None,
+                # processing-рядок завжди має attempts >= 1 (claim його інкрементував)
+                attempts=DownloadQueue.attempts - 1
+            )
+        )
+        await session.commit()
+        return (res.rowcount or 0) > 0
+
+async def dead_letter_expired_tasks(max_attempts: int = QUEUE_MAX_ATTEMPTS) -> int:
+    """
+    Переводить у 'dead' завдання з простроченою орендою, що вичерпали спроби.
+    Викликається періодично; решту прострочених заново бере claim_next_task.
+    """
+    async with AsyncSessionLocal() as session:
+        res = await session.execute(
+            update(DownloadQueue)
+            .where(and_(
+                DownloadQueue.status == "processing",
+                DownloadQueue.lease_until < datetime.now(timezone.utc),
+                DownloadQueue.attempts >= max_attempts
+            ))
+            .values(status="dead", lease_until=None, finished_at=datetime.now(timezone.utc))
+        )
+        await session.commit()
+        dead = res.rowcount or 0
+        if dead:
+            logger.warning(f"☠️ {dead} завдань черги переведено в dead-letter після {max_attempts} спроб.")
+        return dead
+
+def _upsert_daily_stmt(dialect_name: str, rows: List[dict]):
+    """INSERT ... ON CONFLICT DO UPDATE: додає лічильники порції до вже існуючих добових рядків."""
+    dialect_insert = postgresql.insert if dialect_name == "postgresql" else sqlite.insert
+    stmt = dialect_insert(DownloadQueueDaily).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[DownloadQueueDaily.day, DownloadQueueDaily.status, DownloadQueueDaily.donor],
+        set_={
+            "count": DownloadQueueDaily.count + stmt.excluded.count,
+            "turnaround_seconds": DownloadQueueDaily.turnaround_seconds + stmt.excluded.turnaround_seconds,
+            "turnaround_count": DownloadQueueDaily.turnaround_count + stmt.excluded.turnaround_count
+        }
+    )
+
+async def archive_finished_tasks(older_than_hours: int = QUEUE_ARCHIVE_AFTER_HOURS,
+                                 batch_size: int = ARCHIVE_BATCH_SIZE) -> dict:
+    """
+    Згортає завершені завдання, старші за older_than_hours, у добові лічильники download_queue_daily
+    (день x статус x донор) і видаляє їх з download_queue. Так черга містить лише активні та свіжі рядки.
+    Кожна порція — одна транзакція (upsert лічильників + delete), тож рядок не може бути врахований двічі.
+    """
+    global last_archive
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=older_than_hours)
+    finished = func.coalesce(DownloadQueue.finished_at, DownloadQueue.created_at)
+    started = time.perf_counter()
+    archived = 0
+    try:
+        while True:
+            async with AsyncSessionLocal() as session:
+                rows = (await session.execute(
+                    select(
+                        DownloadQueue.id, DownloadQueue.status, DownloadQueue.donor,
+                        DownloadQueue.finished_at, DownloadQueue.created_at
+                    )
+                    .where(and_(DownloadQueue.status.in_(TERMINAL_STATUSES), finished < cutoff))
+                    .order_by(DownloadQueue.id)
+                    .limit(batch_size)
+                )).all()
+                if not rows:
+                    break
+
+                buckets: Dict[tuple, dict] = {}
+                for row in rows:
+                    moment = row.finished_at or row.created_at or cutoff
+                    key = (moment.date(), row.status, row.donor or "")
+                    bucket = buckets.setdefault(key, {
+                        "day": key[0], "status": key[1], "donor": key[2],
+                        "count": 0, "turnaround_seconds": 0.0, "turnaround_count": 0
+                    })
+                    bucket["count"] += 1
+                    if row.created_at and row.finished_at:
+                        bucket["turnaround_seconds"] += max(0.0, (row.finished_at - row.created_at).total_seconds())
+                        bucket["turnaround_count"] += 1
+
+                await session.execute(_upsert_daily_stmt(session.bind.dialect.name, list(buckets.values())))
+                await session.execute(delete(DownloadQueue).where(DownloadQueue.id.in_([row.id for row in rows])))
+                await session.commit()
+
+            archived += len(rows)
+            if len(rows) < batch_size:
+                break
+            await asyncio.sleep(0)
+    except Exception as e:
+        logger.error(f"Queue archive failed after {archived} rows: {e}")
+
+    last_archive = {
+        "archived": archived,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        "finished_at": datetime.now(timezone.utc)
+    }
+    if archived:
+        logger.info(f"🗄 Queue archive: rolled up {archived} finished tasks ({last_archive['duration_ms']} ms).")
+    return last_archive
+
+async def get_archive_summary(days: int = 7) -> Dict[str, int]:
+    """Сума заархівованих завдань за статусами за останні days днів."""
+    since = datetime.now(timezone.utc).date() - timedelta(days=days)
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(DownloadQueueDaily.status, func.sum(DownloadQueueDaily.count))
+            .where(DownloadQueueDaily.day >= since)
+            .group_by(DownloadQueueDaily.status)
+        )
+        return {status: int(total or 0) for status, total in result.all()}
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    """Перцентиль за методом nearest-rank для вже відсортованого списку."""
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+async def get_turnaround_stats(limit: int = TURNAROUND_SAMPLE_SIZE) -> Dict[str, Dict[str, float]]:
+    """
+    p50/p95 часу від постановки в чергу до фіналізації (секунди) по кожному донору.
+    Рахується за останніми limit завершеними завданнями.
+    """
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(DownloadQueue.donor, DownloadQueue.created_at, DownloadQueue.finished_at)
+            .where(and_(
+                DownloadQueue.donor.is_not(None),
+                DownloadQueue.created_at.is_not(None),
+                DownloadQueue.finished_at.is_not(None)
+            ))
+            .order_by(DownloadQueue.finished_at.desc())
+            .limit(limit)
+        )
+        samples: Dict[str, List[float]] = {}
+        for donor, created_at, finished_at in result.all():
+            samples.setdefault(donor, []).append(max(0.0, (finished_at - created_at).total_seconds()))
+
+    turnaround = {}
+    for donor, values in samples.items():
+        values.sort()
+        turnaround[donor] = {
+            "count": len(values),
+            "p50": round(_percentile(values, 50), 1),
+            "p95": round(_percentile(values, 95), 1)
+        }
+    return turnaround
+
+async def get_queue_stats() -> dict:
     """
     Повертає статистику черги завантажень:
     {
@@ -14,7 +310,10 @@ async def get_queue_stats() -> dict[str, int]:
         'processing': int,
         'done': int,
         'error': int,
-        'total': int
+        'dead': int,
+        'total': int,
+        'archived': int,  # заархівовано за останні 7 днів
+        'turnaround': {donor: {'count': int, 'p50': float, 'p95': float}}
     }
     """
     async with AsyncSessionLocal() as session:
@@ -22,18 +321,32 @@ async def get_queue_stats() -> dict[str, int]:
             select(DownloadQueue.status, func.count(DownloadQueue.id)).group_by(DownloadQueue.status)
         )
         counts = dict(result.all())
-        pending = counts.get("pending", 0)
-        processing = counts.get("processing", 0)
-        done = counts.get("done", 0)
-        error = counts.get("error", 0) + counts.get("timeout", 0) + counts.get("failed_by_donor", 0)
-        total = sum(counts.values())
-        return {
-            "pending": pending,
-            "processing": processing,
-            "done": done,
-            "error": error,
-            "total": total
-        }
+    pending = counts.get("pending", 0)
+    processing = counts.get("processing", 0)
+    done = counts.get("done", 0)
+    error = counts.get("error", 0) + counts.get("timeout", 0) + counts.get("failed_by_donor", 0)
+    dead = counts.get("dead", 0)
+    total = sum(counts.values())
+    return {
+        "pending": pending,
+        "processing": processing,
+        "done": done,
+        "error": error,
+        "dead": dead,
+        "total": total,
+        "archived": sum((await get_archive_summary()).values()),
+        "turnaround": await get_turnaround_stats()
+    }
+
+def format_turnaround(turnaround: Dict[str, Dict[str, float]]) -> str:
+    """Рядки HTML для /queue та меню черги."""
+    if not turnaround:
+        return ""
+    lines = "".join(
+        f"• @{donor}: p50 <b>{t['p50']}s</b>, p95 <b>{t['p95']}s</b> (n={t['count']})\n"
+        for donor, t in sorted(turnaround.items())
+    )
+    return f"\n⏱ <b>Час обробки (постановка → результат):</b>\n{lines}"
 
 async def clear_pending_tasks() -> int:
     """
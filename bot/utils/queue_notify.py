@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import socket
+from typing import Optional
+from config import QUEUE_NOTIFY_HOST, QUEUE_NOTIFY_PORT
+
+logger = logging.getLogger(__name__)
+
+class _WakeupProtocol(asyncio.DatagramProtocol):
+    def __init__(self, notifier: "QueueNotifier"):
+        self.notifier = notifier
+
+    def datagram_received(self, data, addr):
+        self.notifier.received += 1
+        self.notifier._signal()
+
+class QueueNotifier:
+    """
+    "Дзвінок" між bot_runner (producer) та userbot (consumer) для download_queue.
+    Producer після commit шле UDP-датаграму на localhost; consumer чекає на неї замість опитування БД.
+    Втрачена датаграма (userbot ще не запущений) не страшна: черга все одно перевіряється при старті
+    та з повільним fallback-інтервалом. Порт 0 вимикає механізм (лише fallback-опитування).
+    Спільного clear() немає: кожне сповіщення збільшує generation, і воркер порівнює його зі значенням,
+    прочитаним до перевірки черги, — один воркер не може "з'їсти" сповіщення іншого.
+    """
+
+    def __init__(self, host: str = QUEUE_NOTIFY_HOST, port: int = QUEUE_NOTIFY_PORT):
+        self.host = host
+        self.port = port
+        self._sock: Optional[socket.socket] = None
+        self._transport = None
+        self._event = asyncio.Event()
+        self.generation = 0
+        self.sent = 0
+        self.received = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.port > 0
+
+    def notify(self):
+        """Неблокуюче сповіщення consumer'а (producer-сторона). Помилки лише логуються."""
+        if not self.enabled:
+            return
+        try:
+            if self._sock is None:
+                self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self._sock.setblocking(False)
+            self._sock.sendto(b"q", (self.host, self.port))
+            self.sent += 1
+        except OSError as e:
+            logger.debug(f"Queue notify skipped: {e}")
+
+    async def start_listener(self) -> bool:
+        """Слухає датаграми (consumer-сторона). Повертає False, якщо порт недоступний — тоді працює fallback."""
+        if not self.enabled or self._transport is not None:
+            return self._transport is not None
+        try:
+            loop = asyncio.get_running_loop()
+            self._transport, _ = await loop.create_datagram_endpoint(
+                lambda: _WakeupProtocol(self), local_addr=(self.host, self.port)
+            )
+            logger.info(f"🔔 Queue wakeup listener on udp://{self.host}:{self.port}")
+            return True
+        except OSError as e:
+            logger.warning(f"⚠️ Queue wakeup listener unavailable ({e}), falling back to polling.")
+            return False
+
+    def _signal(self):
+        """Нове покоління: будимо всіх, хто чекає, і даємо наступним очікувачам свіжу подію."""
+        self.generation += 1
+        event, self._event = self._event, asyncio.Event()
+        event.set()
+
+    def mark(self) -> int:
+        """Поточне покоління — читається ПЕРЕД перевіркою черги і передається у wait()."""
+        return self.generation
+
+    async def wait(self, timeout: float, since: Optional[int] = None) -> bool:
+        """
+        Чекає на сповіщення не довше timeout. True — розбудили, False — спрацював fallback.
+        Якщо since задано і з того часу вже було сповіщення — повертає True одразу.
+        """
+        if since is not None and self.generation != since:
+            return True
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+queue_notifier = QueueNotifier()
@@ -1,8 +1,9 @@
 import logging
 import zoneinfo
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from sqlalchemy.future import select
 from bot.database.session import AsyncSessionLocal
 from bot.database.models import Reminder
@@ -22,6 +23,22 @@ class SchedulerService:
             self.scheduler.start()
             logger.info("🕒 Scheduler started (UTC).")
 
+    def add_interval_job(self, func, seconds: int, job_id: str, first_run_delay: int = 60):
+        """
+        Реєструє періодичну службову задачу (retention, обслуговування БД тощо).
+        Один екземпляр одночасно, пропущені запуски зливаються в один.
+        """
+        self.scheduler.add_job(
+            func,
+            trigger=IntervalTrigger(seconds=seconds, timezone=timezone.utc),
+            id=job_id,
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True,
+            next_run_time=datetime.now(timezone.utc) + timedelta(seconds=first_run_delay)
+        )
+        logger.info(f"🔁 Interval job '{job_id}' registered (every {seconds}s).")
+
     async def restore_reminders(self):
         """Loads pending reminders from DB on startup"""
         logger.info("🔄 Restoring reminders from DB...")
@@ -1,10 +1,10 @@
 import logging
-import asyncio
 import re
 import html
 from typing import List
 from urllib.parse import urlparse
 from duckduckgo_search import DDGS
+from bot.utils.executors import search_executor
 
 logger = logging.getLogger(__name__)
 
@@ -56,14 +56,12 @@ def format_sources_html(urls: List[str]) -> str:
 async def perform_search(query: str, max_results: int = 5) -> str:
     """Виконує пошук і повертає результати з посиланнями"""
     try:
-        loop = asyncio.get_running_loop()
-        
         def _search():
             with DDGS() as ddgs:
                 # Отримуємо результати текстом
                 return list(ddgs.text(query, region="ua-uk", max_results=max_results))
 
-        results = await loop.run_in_executor(None, _search)
+        results = await search_executor.run(_search)
 
         if not results:
             return "Search returned no results."
@@ -0,0 +1,72 @@
+import copy
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from config import SETTINGS_CACHE_TTL_SECONDS, SETTINGS_CACHE_MAX_SIZE
+
+logger = logging.getLogger(__name__)
+
+class SettingsCache:
+    """
+    In-process TTL/LRU кеш налаштувань чату/користувача (ключ — user_id або chat_id).
+    Зберігає вже обчислений результат get_user_model_settings, щоб не ходити в SQLite на кожне повідомлення.
+    Будь-який код, що змінює User.settings або ключі API, має викликати invalidate().
+    """
+
+    def __init__(self, ttl_seconds: float = SETTINGS_CACHE_TTL_SECONDS, max_size: int = SETTINGS_CACHE_MAX_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self._data: "OrderedDict[int, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: int) -> Optional[Dict[str, Any]]:
+        """Повертає глибоку копію налаштувань (вкладені списки теж) або None, якщо запису немає чи він застарів."""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(value)
+
+    def set(self, key: int, value: Dict[str, Any]):
+        """Кладе глибоку копію налаштувань у кеш, витісняючи найдавніше використані записи."""
+        if self.max_size <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl_seconds, copy.deepcopy(value))
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: int):
+        """Скидає кеш для конкретного чату/користувача."""
+        if self._data.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        """Повністю очищує кеш (наприклад, після масових змін налаштувань)."""
+        self.invalidations += len(self._data)
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Лічильники для моніторингу: скільки звернень до БД заощаджено."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "size": len(self._data),
+            "hit_rate": round(self.hits / total, 3) if total else 0.0
+        }
+
+settings_cache = SettingsCache()
@@ -0,0 +1,286 @@
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+from telegram.error import BadRequest, RetryAfter
+from bot.utils.html_sanitizer import IncrementalSanitizer, clean_html
+from config import (
+    STREAM_EDIT_MIN_INTERVAL_MS, STREAM_PRIVATE_EDITS_PER_MINUTE, STREAM_GROUP_EDITS_PER_MINUTE,
+    STREAM_FLOOD_WAIT_MAX_SECONDS
+)
+
+logger = logging.getLogger(__name__)
+
+CURSOR = " ▌"
+# Скільки правок поспіль дозволено без очікування (token bucket)
+EDIT_BURST = 3
+# Межа адаптивного інтервалу після FloodWait
+MAX_EDIT_INTERVAL_SECONDS = 10.0
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    value = getattr(error, "retry_after", 1)
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value or 1)
+
+class StreamBuffer:
+    """
+    Накопичувач відповіді, що генерується: шматки складаються в список (O(1) на шматок замість
+    копіювання всього рядка на кожен "+="), а рядок збирається лише при показі/в кінці.
+    З sanitize=True кожен завершений рядок одразу проходить IncrementalSanitizer, тож наприкінці
+    clean_html не переробляє всю відповідь.
+    """
+
+    def __init__(self, initial: str = "", sanitize: bool = False):
+        self._text = ""
+        self._parts: List[str] = []
+        self._len = 0
+        self._sanitizer = IncrementalSanitizer() if sanitize else None
+        self._sanitized: Optional[str] = None
+        if initial:
+            self.append(initial)
+
+    def append(self, chunk: str):
+        if not chunk:
+            return
+        self._parts.append(chunk)
+        self._len += len(chunk)
+        if self._sanitizer is not None:
+            self._sanitizer.feed(chunk)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def text(self) -> str:
+        """Повний текст; склеюються лише шматки, що прийшли після попереднього виклику."""
+        if self._parts:
+            self._text = "".join([self._text, *self._parts])
+            self._parts = []
+        return self._text
+
+    __str__ = text
+
+    def sanitized(self) -> str:
+        """Результат clean_html для всього тексту (для буфера з sanitize=True — без повторного проходу)."""
+        if self._sanitizer is None:
+            return clean_html(self.text())
+        if self._sanitized is None:
+            self._sanitized = self._sanitizer.finish()
+        return self._sanitized
+
+class ChatEditLimiter:
+    """
+    Бюджет правок повідомлень на чат (token bucket), спільний для всіх одночасних стрімів у чаті.
+    Telegram допускає ~1 повідомлення/с у приватному чаті та ~20/хв у групі; після RetryAfter
+    чат блокується на вказаний час.
+    """
+
+    def __init__(self, private_per_minute: float = STREAM_PRIVATE_EDITS_PER_MINUTE,
+                 group_per_minute: float = STREAM_GROUP_EDITS_PER_MINUTE,
+                 burst: int = EDIT_BURST, max_size: int = 4096):
+        self.private_per_minute = private_per_minute
+        self.group_per_minute = group_per_minute
+        self.burst = max(1, burst)
+        self.max_size = max_size
+        # chat_id -> [tokens, updated_at, blocked_until]
+        self._buckets: Dict[int, list] = {}
+
+    def per_minute(self, chat_id: int) -> float:
+        return self.group_per_minute if chat_id < 0 else self.private_per_minute
+
+    def _bucket(self, chat_id: int) -> list:
+        now = time.monotonic()
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= self.max_size:
+                self._prune(now)
+            bucket = self._buckets[chat_id] = [float(self.burst), now, 0.0]
+        else:
+            rate = self.per_minute(chat_id) / 60
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        return bucket
+
+    def _prune(self, now: float):
+        """Прибирає чати, чий бюджет уже повністю відновився (стан не відрізняється від нового)."""
+        for chat_id, (tokens, updated_at, blocked_until) in list(self._buckets.items()):
+            refill = (now - updated_at) * self.per_minute(chat_id) / 60
+            if tokens + refill >= self.burst and blocked_until <= now:
+                del self._buckets[chat_id]
+
+    def delay(self, chat_id: int) -> float:
+        """Скільки секунд чекати до наступної дозволеної правки (0 — можна зараз)."""
+        tokens, now, blocked_until = self._bucket(chat_id)
+        wait = max(0.0, blocked_until - now)
+        if tokens < 1:
+            rate = self.per_minute(chat_id) / 60
+            wait = max(wait, (1 - tokens) / rate if rate > 0 else MAX_EDIT_INTERVAL_SECONDS)
+        return wait
+
+    def blocked_for(self, chat_id: int) -> float:
+        bucket = self._buckets.get(chat_id)
+        return max(0.0, bucket[2] - time.monotonic()) if bucket else 0.0
+
+    def consume(self, chat_id: int):
+        bucket = self._bucket(chat_id)
+        bucket[0] -= 1
+
+    def block(self, chat_id: int, seconds: float):
+        bucket = self._bucket(chat_id)
+        bucket[2] = max(bucket[2], time.monotonic() + seconds)
+        bucket[0] = min(bucket[0], 0.0)
+
+class RendererStats:
+    """Сумарні лічильники всіх стрімів (для /stats)."""
+
+    def __init__(self):
+        self.responses = 0
+        self.edits = 0
+        self.updates = 0
+        self.flood_waits = 0
+        self.first_edit_ms_total = 0.0
+        self.first_edit_count = 0
+
+    def record(self, renderer: "StreamRenderer"):
+        self.responses += 1
+        self.edits += renderer.edits
+        self.updates += renderer.updates
+        self.flood_waits += renderer.flood_waits
+        if renderer.first_edit_ms is not None:
+            self.first_edit_ms_total += renderer.first_edit_ms
+            self.first_edit_count += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "responses": self.responses,
+            "edits": self.edits,
+            "coalesced": self.updates - self.edits,
+            "flood_waits": self.flood_waits,
+            "edits_per_response": round(self.edits / self.responses, 1) if self.responses else 0.0,
+            "avg_first_edit_ms": round(self.first_edit_ms_total / self.first_edit_count) if self.first_edit_count else 0,
+        }
+
+edit_limiter = ChatEditLimiter()
+renderer_stats = RendererStats()
+
+class StreamRenderer:
+    """
+    Показ відповіді, що генерується, правками одного повідомлення.
+    1. update() лише запам'ятовує останній текст і не блокує генерацію; правки робить фонова задача.
+    2. Правка — не частіше ніж раз на interval і в межах бюджету чату (edit_limiter); усі шматки,
+       що прийшли між правками, зливаються в одну.
+    3. RetryAfter блокує чат на вказаний час і подвоює інтервал (далі він поступово повертається до базового).
+    4. finish() зупиняє правки перед фінальним повідомленням, яке викликач відправляє сам.
+    """
+
+    def __init__(self, message, chat_id: Optional[int] = None, limiter: ChatEditLimiter = None,
+                 min_interval: float = STREAM_EDIT_MIN_INTERVAL_MS / 1000, stats: RendererStats = None):
+        self.message = message
+        self.chat_id = chat_id if chat_id is not None else getattr(message, "chat_id", 0)
+        self.limiter = limiter or edit_limiter
+        self.stats = stats or renderer_stats
+        per_minute = self.limiter.per_minute(self.chat_id)
+        self.base_interval = max(min_interval, 60 / per_minute if per_minute > 0 else min_interval)
+        self.interval = self.base_interval
+        self.started_at = time.monotonic()
+        self.edits = 0
+        self.updates = 0
+        self.flood_waits = 0
+        self.first_edit_ms: Optional[float] = None
+        # Що показати наступною правкою: рядок або StreamBuffer (рендериться лише в момент правки)
+        self._pending: Union[str, StreamBuffer, None] = None
+        self._cursor = True
+        self._dirty = False
+        self._next_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._editing = False
+        self._closed = False
+
+    def update(self, content: Union[str, StreamBuffer], cursor: bool = True):
+        """
+        Новий стан відповіді; показується з наступною дозволеною правкою.
+        StreamBuffer можна передавати на кожен шматок: текст з нього збирається лише перед правкою.
+        """
+        if self._closed:
+            return
+        self._pending = content
+        self._cursor = cursor
+        self._dirty = True
+        self.updates += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    def _render(self) -> str:
+        text = str(self._pending)
+        return text + CURSOR if self._cursor else text
+
+    async def _flush_loop(self):
+        while not self._closed and self._dirty:
+            now = time.monotonic()
+            wait = max(self._next_at - now, self.limiter.delay(self.chat_id))
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            text = self._render()
+            self._dirty = False
+            self.limiter.consume(self.chat_id)
+            self._editing = True
+            try:
+                await self.message.edit_text(text)
+                self.edits += 1
+                if self.first_edit_ms is None:
+                    self.first_edit_ms = (time.monotonic() - self.started_at) * 1000
+                self.interval = max(self.base_interval, self.interval * 0.8)
+            except RetryAfter as e:
+                seconds = _retry_after_seconds(e)
+                self.flood_waits += 1
+                self.limiter.block(self.chat_id, seconds)
+                self.interval = min(MAX_EDIT_INTERVAL_SECONDS, self.interval * 2)
+                self._dirty = True
+                logger.warning(f"⚠️ Stream edit flood wait {seconds}s in chat {self.chat_id}")
+            except BadRequest as e:
+                # "Message is not modified" та подібне — текст уже показано або правка неможлива
+                logger.debug(f"Stream edit rejected: {e}")
+            except Exception as e:
+                logger.debug(f"Stream edit failed: {e}")
+            finally:
+                self._editing = False
+                self._next_at = time.monotonic() + self.interval
+
+    async def finish(self):
+        """
+        Зупиняє проміжні правки: правка, що вже в дорозі, завершується, очікування скасовується.
+        Якщо чат під FloodWait — чекає його закінчення (до STREAM_FLOOD_WAIT_MAX_SECONDS),
+        щоб фінальне повідомлення не впало з тією ж помилкою.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        task = self._task
+        if task is not None and not task.done():
+            if not self._editing:
+                task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        blocked = self.limiter.blocked_for(self.chat_id)
+        if 0 < blocked <= STREAM_FLOOD_WAIT_MAX_SECONDS:
+            await asyncio.sleep(blocked)
+        self.limiter.consume(self.chat_id)
+        self.stats.record(self)
+
+async def render_stream(chunks: AsyncIterator[str], message, prefix: str = "") -> str:
+    """Збирає відповідь з асинхронного потоку шматків, показуючи прогрес через StreamRenderer."""
+    renderer = StreamRenderer(message)
+    buffer = StreamBuffer(prefix)
+    try:
+        async for chunk in chunks:
+            buffer.append(chunk)
+            renderer.update(buffer)
+    finally:
+        await renderer.finish()
+    return buffer.text()
@@ -6,9 +6,13 @@ from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, Cal
 from telegram.request import HTTPXRequest
 from telegram.warnings import PTBUserWarning
 
-from bot.database.session import init_db
-from bot.handlers.commands import start, remember_cmd, memories_cmd, forget_cmd, terms_cmd, queue_cmd, video_cmd
+from bot.database.session import init_db, run_sqlite_maintenance, IS_SQLITE
+from bot.handlers.commands import start, remember_cmd, memories_cmd, forget_cmd, terms_cmd, queue_cmd, video_cmd, stats_cmd
 from bot.utils.scheduler import scheduler_service
+from bot.utils.context import context_manager
+from bot.utils.limits import quota_counter
+from bot.utils.queue_manager import archive_finished_tasks
+from bot.utils.executors import shutdown_executors
 
 # Handlers
 from bot.handlers.text import handle_text, handle_internal_task
@@ -27,7 +31,10 @@ from bot.handlers.settings import (
     queue_menu, queue_clear_pending, queue_clear_all,
     WAITING_FOR_KEY, WAITING_FOR_CUSTOM_MODEL, WAITING_FOR_CUSTOM_PROMPT, WAITING_FOR_TIMEZONE, WAITING_FOR_PHOTO_PROMPT
 )
-from config import TOKEN
+from config import (
+    TOKEN, RETENTION_SWEEP_INTERVAL_MINUTES, SQLITE_MAINTENANCE_INTERVAL_MINUTES, QUOTA_FLUSH_INTERVAL_SECONDS,
+    QUEUE_ARCHIVE_INTERVAL_MINUTES
+)
 
 warnings.filterwarnings("ignore", category=PTBUserWarning)
 
@@ -45,8 +52,37 @@ async def post_init(application: Application):
     logger.info("📦 [MainBot] DB initialized (WAL mode).")
     scheduler_service.start(application)
     await scheduler_service.restore_reminders()
+    scheduler_service.add_interval_job(
+        context_manager.sweep_expired_cache,
+        seconds=RETENTION_SWEEP_INTERVAL_MINUTES * 60,
+        job_id="retention_sweep"
+    )
+    scheduler_service.add_interval_job(
+        quota_counter.flush,
+        seconds=QUOTA_FLUSH_INTERVAL_SECONDS,
+        job_id="quota_flush",
+        first_run_delay=QUOTA_FLUSH_INTERVAL_SECONDS
+    )
+    scheduler_service.add_interval_job(
+        archive_finished_tasks,
+        seconds=QUEUE_ARCHIVE_INTERVAL_MINUTES * 60,
+        job_id="queue_archive"
+    )
+    if IS_SQLITE:
+        scheduler_service.add_interval_job(
+            run_sqlite_maintenance,
+            seconds=SQLITE_MAINTENANCE_INTERVAL_MINUTES * 60,
+            job_id="sqlite_maintenance"
+        )
     logger.info("⏰ [MainBot] Scheduler started.")
 
+async def post_shutdown(application: Application):
+    # Дописуємо буфер історії, щоб не втратити останні репліки при зупинці
+    await context_manager.close()
+    await quota_counter.flush()
+    shutdown_executors()
+    logger.info("💾 [MainBot] Message buffer and quota counters flushed.")
+
 def main():
     if not TOKEN:
         logger.error("❌ Помилка: Не задано BOT_TOKEN в .env!")
@@ -63,6 +99,7 @@ def main():
         ApplicationBuilder()
         .token(TOKEN)
         .post_init(post_init)
+        .post_shutdown(post_shutdown)
         .request(req)
         .build()
     )
@@ -116,6 +153,7 @@ def main():
     app.add_handler(CommandHandler("terms", terms_cmd))
     app.add_handler(CommandHandler("queue", queue_cmd))
     app.add_handler(CommandHandler("video", video_cmd))
+    app.add_handler(CommandHandler("stats", stats_cmd))
 
     # Callbacks
     app.add_handler(CallbackQueryHandler(settings_menu, pattern="^settings_menu$"))
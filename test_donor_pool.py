@@ -0,0 +1,198 @@
+import unittest
+import asyncio
+import time
+from types import SimpleNamespace
+
+from bot.utils.donor_pool import DonorChannel, WorkerStats, parse_donor_concurrency
+
+def _msg(mid, reply_to=None, group=None, media=False, text=None):
+    return SimpleNamespace(id=mid, reply_to_message_id=reply_to, media_group_id=group, media=media, text=text)
+
+def _classify(m):
+    if m.media:
+        return "media", m.id
+    if m.text and "error" in m.text:
+        return "error", m.text
+    return None
+
+class TestDonorConcurrency(unittest.TestCase):
+    def test_parse_overrides_defaults(self):
+        """Verify env overrides merge over defaults and invalid pairs are ignored."""
+        parsed = parse_donor_concurrency("SaveAsBot=3, @extrabot=2,broken=x,monkettbot=0", {"SaveAsBot": 1, "monkettbot": 1})
+        self.assertEqual(parsed, {"SaveAsBot": 3, "monkettbot": 1, "extrabot": 2})
+        self.assertEqual(parse_donor_concurrency("", {"SaveAsBot": 1}), {"SaveAsBot": 1})
+
+class TestResponseAttribution(unittest.TestCase):
+    def setUp(self):
+        self.donor = DonorChannel("SaveAsBot", concurrency=2)
+        self.donor.register(100, task_id=1)
+        self.donor.register(102, task_id=2)
+
+    def test_reply_wins_over_order(self):
+        """Verify a reply to the second request is attributed to it even if the first is unanswered."""
+        self.assertEqual(self.donor.attribute(_msg(103, reply_to=102)), 102)
+
+    def test_fifo_for_plain_answers(self):
+        """Verify plain donor answers go to the oldest unanswered request, then to the next one."""
+        self.assertEqual(self.donor.attribute(_msg(101)), 100)
+        self.assertEqual(self.donor.attribute(_msg(103)), 102)
+        # Повторне читання історії іншим воркером дає ту саму прив'язку
+        self.assertEqual(self.donor.attribute(_msg(101)), 100)
+
+    def test_album_stays_with_its_request(self):
+        """Verify all files of a media group follow the request that got the first file."""
+        self.assertEqual(self.donor.attribute(_msg(103, group="g1")), 100)
+        self.assertEqual(self.donor.attribute(_msg(104, group="g1")), 100)
+        self.assertEqual(self.donor.attribute(_msg(105)), 102)
+
+    def test_progress_text_does_not_shift_fifo(self):
+        """Verify progress texts do not mark a request answered, so each video goes to its own request."""
+        donor = DonorChannel("SaveAsBot", concurrency=2, classify=_classify)
+        donor.register(100, task_id=1)
+        donor.register(101, task_id=2)
+        owners = [
+            donor.attribute(_msg(102, text="Downloading...")),
+            donor.attribute(_msg(103, media=True)),
+            donor.attribute(_msg(104, text="Downloading...")),
+            donor.attribute(_msg(105, media=True)),
+        ]
+        self.assertEqual(owners, [100, 100, 101, 101])
+
+    def test_messages_before_any_request_are_ignored(self):
+        """Verify history older than every in-flight request is not attributed."""
+        self.assertIsNone(self.donor.attribute(_msg(99)))
+
+    def test_unregister_forgets_request(self):
+        """Verify a finished request no longer claims new messages."""
+        self.donor.attribute(_msg(101))
+        self.donor.unregister(100)
+        self.assertEqual(self.donor.attribute(_msg(103)), 102)
+        self.assertEqual(self.donor.stats()["inflight"], 1)
+
+class TestPushDelivery(unittest.IsolatedAsyncioTestCase):
+    async def test_media_resolves_future_immediately(self):
+        """Verify a media update resolves the request future without polling; progress texts are skipped."""
+        donor = DonorChannel("SaveAsBot", classify=_classify)
+        future = donor.expect(100, task_id=1)
+        donor.deliver(_msg(101, reply_to=100, text="Downloading..."))
+        self.assertFalse(future.done())
+        donor.deliver(_msg(102, reply_to=100, media=True, group="album"))
+        self.assertEqual(await asyncio.wait_for(future, 0.1), ("media", 102))
+
+    async def test_parallel_requests_get_own_answers(self):
+        """Verify two in-flight requests are resolved by their own replies regardless of arrival order."""
+        donor = DonorChannel("SaveAsBot", concurrency=2, classify=_classify)
+        first = donor.expect(100, task_id=1)
+        second = donor.expect(101, task_id=2)
+        donor.deliver(_msg(102, reply_to=101, text="error: private video"))
+        donor.deliver(_msg(103, reply_to=100, media=True))
+        self.assertEqual(await first, ("media", 103))
+        self.assertEqual(await second, ("error", "error: private video"))
+
+    async def test_separate_media_replies_are_collected(self):
+        """Verify a video and a separate audio answer are both returned, progress text excluded."""
+        donor = DonorChannel("SaveAsBot", classify=_classify)
+        future = donor.expect(100, task_id=1)
+        donor.deliver(_msg(101, text="Downloading..."))
+        donor.deliver(_msg(102, media=True))
+        self.assertEqual(await future, ("media", 102))
+
+        async def audio_later():
+            await asyncio.sleep(0.05)
+            donor.deliver(_msg(103, media=True))
+
+        asyncio.create_task(audio_later())
+        started = time.monotonic()
+        results = await donor.collect(100, settle=0.2)
+        self.assertEqual(results, [("media", 102), ("media", 103)])
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+    async def test_collect_stops_when_fifo_donor_moves_on(self):
+        """Verify collection ends as soon as a FIFO donor starts answering the next request."""
+        donor = DonorChannel("SaveAsBot", concurrency=2, classify=_classify)
+        donor.expect(100, task_id=1)
+        donor.expect(101, task_id=2)
+        donor.deliver(_msg(102, media=True))
+        donor.deliver(_msg(103, text="Downloading..."))
+        started = time.monotonic()
+        self.assertEqual(await donor.collect(100, settle=1.0), [("media", 102)])
+        self.assertLess(time.monotonic() - started, 0.1)
+
+    async def test_update_before_registration_is_replayed(self):
+        """Verify an answer that arrives before expect() (update raced send_message) is not lost."""
+        donor = DonorChannel("SaveAsBot", classify=_classify)
+        self.assertIsNone(donor.deliver(_msg(101, reply_to=100, media=True)))
+        future = donor.expect(100, task_id=1)
+        self.assertTrue(future.done())
+        self.assertEqual(future.result(), ("media", 101))
+
+    async def test_unregister_cancels_waiter(self):
+        """Verify finishing a request cancels its pending future and stops routing to it."""
+        donor = DonorChannel("SaveAsBot", classify=_classify)
+        future = donor.expect(100, task_id=1)
+        donor.unregister(100)
+        self.assertTrue(future.cancelled())
+        self.assertIsNone(donor.deliver(_msg(101, media=True)))
+
+class TestDonorPacing(unittest.IsolatedAsyncioTestCase):
+    async def test_min_interval_between_sends(self):
+        """Verify consecutive sends to one donor are spaced by min_interval."""
+        donor = DonorChannel("SaveAsBot", concurrency=3, min_interval=0.05)
+        started = time.monotonic()
+        await asyncio.gather(*(donor.before_send() for _ in range(3)))
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+        self.assertEqual(donor.sent, 3)
+
+    async def test_flood_wait_pauses_only_that_donor(self):
+        """Verify FloodWait delays sends to the affected donor while another donor is unaffected."""
+        slow = DonorChannel("SaveAsBot")
+        fast = DonorChannel("monkettbot")
+        slow.flood_wait(0.1)
+        started = time.monotonic()
+        await fast.before_send()
+        self.assertLess(time.monotonic() - started, 0.05)
+        await slow.before_send()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+        self.assertEqual(slow.flood_waits, 1)
+
+    async def _peak(self, donor):
+        active = peak = 0
+
+        async def job():
+            nonlocal active, peak
+            async with donor.slot():
+                active += 1
+                peak = max(peak, active)
+                await asyncio.sleep(0.01)
+                active -= 1
+
+        await asyncio.gather(*(job() for _ in range(6)))
+        return peak
+
+    async def test_slots_limit_parallel_requests(self):
+        """Verify no more than concurrency requests run against a donor that replies to requests."""
+        donor = DonorChannel("SaveAsBot", concurrency=2)
+        donor.register(100, task_id=1)
+        donor.attribute(_msg(101, reply_to=100))
+        self.assertTrue(donor.replies_to_requests)
+        self.assertEqual(await self._peak(donor), 2)
+
+    async def test_donor_without_replies_gets_one_request_at_a_time(self):
+        """Verify FIFO-only attribution forces concurrency 1 whatever the configured value."""
+        donor = DonorChannel("SaveAsBot", concurrency=2)
+        self.assertEqual(await self._peak(donor), 1)
+        self.assertEqual(donor.stats()["concurrency"], 1)
+
+class TestWorkerStats(unittest.TestCase):
+    def test_utilization_counts_busy_share(self):
+        """Verify utilization reflects time spent inside tasks."""
+        stats = WorkerStats("w0")
+        stats.started = time.monotonic() - 1.0
+        stats.begin()
+        stats._busy_since -= 0.5
+        stats.end()
+        self.assertEqual(stats.tasks, 1)
+        self.assertAlmostEqual(stats.utilization(), 0.5, delta=0.05)
+
+if __name__ == '__main__':
+    unittest.main()
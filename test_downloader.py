@@ -0,0 +1,74 @@
+import unittest
+import os
+import tempfile
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+os.environ["BOT_TOKEN"] = "123456:TEST_TOKEN"
+os.environ["ENCRYPTION_KEY"] = "8Z6wY6uP04B4uE6_7V8M3aQ1bC2dE3fG4hI5jK6lM7o="
+
+from bot.utils import downloader
+
+class _CountingHandler(SimpleHTTPRequestHandler):
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        try:
+            super().do_GET()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+class TestSinglePassDownload(unittest.TestCase):
+    """Локальний HTTP-фікстур замість YouTube/Twitter: рахуємо, скільки разів посилання резолвиться."""
+
+    def setUp(self):
+        self.served = tempfile.TemporaryDirectory()
+        self.out_dir = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.served.name, "clip.mp4"), "wb") as f:
+            f.write(os.urandom(256 * 1024))
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_CountingHandler, directory=self.served.name))
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/clip.mp4"
+        _CountingHandler.requests = 0
+        downloader.info_cache.clear()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.served.cleanup()
+        self.out_dir.cleanup()
+        downloader.info_cache.clear()
+
+    def _clean_out(self):
+        for name in os.listdir(self.out_dir.name):
+            os.remove(os.path.join(self.out_dir.name, name))
+
+    def test_link_is_resolved_once_and_metadata_reused(self):
+        """Verify one extraction request per fresh download and none on a cached repeat."""
+        result = downloader.download_sync(self.url, self.out_dir.name)
+        self.assertTrue(result and os.path.getsize(result["path"]) == 256 * 1024)
+        # 1 запит екстрактора + 1 на сам файл (раніше екстрактор ходив двічі)
+        self.assertEqual(_CountingHandler.requests, 2)
+
+        self._clean_out()
+        _CountingHandler.requests = 0
+        hits = downloader.info_cache.hits
+        self.assertTrue(downloader.download_sync(self.url, self.out_dir.name))
+        self.assertEqual(_CountingHandler.requests, 1)
+        self.assertEqual(downloader.info_cache.hits, hits + 1)
+
+    def test_failed_download_drops_cached_metadata(self):
+        """Verify metadata is re-extracted after a failure (e.g. expired signed format URLs)."""
+        self.assertTrue(downloader.download_sync(self.url, self.out_dir.name))
+        self._clean_out()
+        os.remove(os.path.join(self.served.name, "clip.mp4"))
+        self.assertIsNone(downloader.download_sync(self.url, self.out_dir.name))
+        self.assertIsNone(downloader.info_cache.get(self.url))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+import asyncio
+import os
+import threading
+import time
+
+os.environ["BOT_TOKEN"] = "123456:TEST_TOKEN"
+os.environ["ENCRYPTION_KEY"] = "8Z6wY6uP04B4uE6_7V8M3aQ1bC2dE3fG4hI5jK6lM7o="
+
+from bot.utils.executors import BoundedExecutor, ExecutorBusy
+
+class TestBoundedExecutor(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.executor = BoundedExecutor("test", max_workers=2, per_chat=1, max_queue=4)
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    async def asyncTearDown(self):
+        self.release.set()
+        self.executor.shutdown()
+
+    def _job(self, tag=None):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        self.release.wait(5)
+        with self.lock:
+            self.running -= 1
+        return tag
+
+    async def _settle(self):
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+
+    async def test_flood_from_one_chat_does_not_block_others(self):
+        """Verify per-chat limit keeps a second chat's download running during a flood."""
+        flood = [asyncio.create_task(self.executor.run(self._job, "a", chat_id=1)) for _ in range(3)]
+        await self._settle()
+        other = asyncio.create_task(self.executor.run(self._job, "b", chat_id=2))
+        await self._settle()
+
+        stats = self.executor.stats()
+        self.assertEqual((stats["active"], stats["waiting"], stats["chat_waiting"]), (2, 0, 2))
+        self.release.set()
+        self.assertEqual(await other, "b")
+        self.assertEqual(await asyncio.gather(*flood), ["a", "a", "a"])
+        self.assertEqual(self.peak, 2)
+        self.assertEqual(self.executor._chat_slots, {})
+
+    async def test_queue_limit_rejects_instead_of_stalling(self):
+        """Verify tasks beyond max_queue fail fast with ExecutorBusy and are counted."""
+        tasks = [asyncio.create_task(self.executor.run(self._job, i, chat_id=i)) for i in range(6)]
+        await self._settle()
+        with self.assertRaises(ExecutorBusy):
+            await self.executor.run(self._job, chat_id=99)
+        stats = self.executor.stats()
+        self.assertEqual((stats["active"], stats["waiting"], stats["max_waiting"], stats["rejected"]), (2, 4, 4, 1))
+        self.release.set()
+        self.assertEqual(sorted(await asyncio.gather(*tasks)), list(range(6)))
+        self.assertEqual(self.executor.stats()["completed"], 6)
+
+    async def test_chat_flood_is_capped_per_chat_not_globally(self):
+        """Verify a chat posting 20 links is rejected on its own backlog while another chat still gets a slot."""
+        executor = BoundedExecutor("flood", max_workers=2, per_chat=1, max_queue=4, per_chat_queue=3)
+        try:
+            flood = [asyncio.create_task(executor.run(self._job, "a", chat_id=1)) for _ in range(20)]
+            await self._settle()
+            stats = executor.stats()
+            self.assertEqual((stats["active"], stats["waiting"], stats["chat_waiting"], stats["rejected"]), (1, 0, 3, 16))
+
+            other = asyncio.create_task(executor.run(self._job, "b", chat_id=2))
+            await self._settle()
+            self.assertEqual(executor.stats()["active"], 2)
+            self.release.set()
+            self.assertEqual(await other, "b")
+            results = await asyncio.gather(*flood, return_exceptions=True)
+            self.assertEqual(sum(isinstance(r, ExecutorBusy) for r in results), 16)
+            self.assertEqual(results.count("a"), 4)
+        finally:
+            executor.shutdown()
+
+    async def test_cancelled_waiter_frees_its_slot(self):
+        """Verify cancelling a queued task restores queue depth and per-chat bookkeeping."""
+        busy = [asyncio.create_task(self.executor.run(self._job, chat_id=i)) for i in range(2)]
+        await self._settle()
+        waiter = asyncio.create_task(self.executor.run(self._job, chat_id=7))
+        await self._settle()
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+        self.assertEqual(self.executor.stats()["waiting"], 0)
+        self.assertNotIn(7, self.executor._chat_slots)
+        self.release.set()
+        await asyncio.gather(*busy)
+
+    async def test_timed_out_run_keeps_slot_until_thread_finishes(self):
+        """Verify a run cancelled by wait_for holds active, the pool slot and the chat slot until its thread ends."""
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(self.executor.run(self._job, chat_id=1), 0.05)
+        await self._settle()
+
+        self.assertEqual(self.executor.stats()["active"], 1)
+        self.assertEqual(self.executor._slots._value, 1)
+        self.assertIn(1, self.executor._chat_slots)
+
+        # Поки потік зайнятий, друга задача отримує лише вільний потік, а третя чекає в event loop
+        second = asyncio.create_task(self.executor.run(self._job, chat_id=2))
+        third = asyncio.create_task(self.executor.run(self._job, chat_id=3))
+        await self._settle()
+        self.assertEqual((self.executor.stats()["active"], self.executor.stats()["waiting"]), (2, 1))
+        self.assertEqual(self.peak, 2)
+
+        self.release.set()
+        await asyncio.gather(second, third)
+        await self._settle()
+        self.assertEqual(self.executor.stats()["active"], 0)
+        self.assertEqual(self.executor._slots._value, 2)
+        self.assertEqual(self.executor._chat_slots, {})
+
+if __name__ == "__main__":
+    unittest.main()
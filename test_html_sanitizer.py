@@ -0,0 +1,146 @@
+import unittest
+import os
+import random
+from unittest.mock import patch
+
+os.environ["BOT_TOKEN"] = "123456:TEST_TOKEN"
+os.environ["ENCRYPTION_KEY"] = "8Z6wY6uP04B4uE6_7V8M3aQ1bC2dE3fG4hI5jK6lM7o="
+
+import bot.utils.html_sanitizer as sanitizer_module
+from bot.utils.html_sanitizer import clean_html, IncrementalSanitizer
+from bot.utils.stream_renderer import StreamBuffer
+
+SAMPLES = [
+    "## Заголовок\nТекст з **жирним** і ще **одним**.\n\n\n\nКінець",
+    "<html><head><meta charset='utf-8'></head><body><p>Привіт</p><ul><li>один</li><li>два</li></ul></body></html>",
+    "```html\n<div>блок</div>\n```\n<h2>Розділ</h2>\nтекст<br>далі<br/>ще",
+    "Рядок з решіткою в кінці #\nнаступний рядок\n#\nЗаголовок після переносу",
+    "<html\nlang='uk'\n>\n<script\ntype='x'>alert(1)</script>\nТекст",
+    "   \n\n  Початок з пробілами **x**  \n\n\n\n\n   ",
+    "C# та F# — мови.\n### Список\n<ol><li>a</li></ol>\n\n\n<p>абзац</p>\n",
+    "<b>вже HTML</b> і <code>код</code>\n<pre>pre</pre>\n<a href='https://x'>лінк</a>",
+    "",
+    "\n\n\n",
+    "a <link to nowhere\nі далі текст\n> закрито",
+]
+
+# Золотий корпус: очікуваний результат отримано попередньою реалізацією clean_html (ланцюжок re.sub/replace)
+GOLDEN = [
+    ('Привіт! Ось відповідь.',
+     'Привіт! Ось відповідь.'),
+    ('## Як приготувати борщ\n\n1. **Буряк** — натерти.\n2. **Капуста** — нашаткувати.\n\n\n\nСмачного!',
+     '<b>Як приготувати борщ</b>\n\n1. <b>Буряк</b> — натерти.\n2. <b>Капуста</b> — нашаткувати.\n\nСмачного!'),
+    ('# Заголовок\n### Підзаголовок\nТекст під ним',
+     '<b>Заголовок</b>\n<b>Підзаголовок</b>\nТекст під ним'),
+    ('**Важливо:** перевірте налаштування.\nІ ще **раз**.',
+     '<b>Важливо:</b> перевірте налаштування.\nІ ще <b>раз</b>.'),
+    ('Мова C# та F# підтримуються. Хештег #україна теж.',
+     'Мова C<b>та F# підтримуються. Хештег #україна теж.</b>'),
+    ('Непарні зірочки: 2 ** 3 = 8',
+     'Непарні зірочки: 2 ** 3 = 8'),
+    ('***Жирний курсив*** і ****порожній****',
+     '<b>*Жирний курсив</b>* і <b></b>порожній<b></b>'),
+    ('<html><head><title>x</title></head><body><p>Абзац один</p><p>Абзац два</p></body></html>',
+     '<title>x</title>Абзац один\nАбзац два'),
+    ('<!DOCTYPE html>\n<html lang="uk">\n<head>\n<meta charset="utf-8">\n<style>b{color:red}</style>\n</head>\n<body>\n<h1>Привіт</h1>\n</body>\n</html>',
+     '<!DOCTYPE html>\n\nb{color:red}\n\n<b>Привіт</b>'),
+    ('<ul><li>Перший</li><li>Другий</li></ul>\n<ol><li>Раз</li></ol>',
+     '• Перший\n• Другий\n\n• Раз'),
+    ('<div>Блок</div><div>Ще блок</div>',
+     'Блок\nЩе блок'),
+    ('Рядок<br>Другий<br/>Третій',
+     'Рядок\nДругий\nТретій'),
+    ('<h2>Розділ</h2>Текст\n<h3>Незакритий заголовок\n</h3>',
+     '<b>Розділ</b>\nТекст\n<h3>Незакритий заголовок\n</h3>'),
+    ('<h2>Розділ з <p>абзацом</p></h2>',
+     '<h2>Розділ з абзацом\n</h2>'),
+    ('```html\n<b>Код</b>\n```\nі ще ```python\nprint(1)\n```',
+     '<b>Код</b>\n\nі ще python\nprint(1)'),
+    ('<b>жирний</b> <i>курсив</i> <code>код</code> <pre>блок</pre> <a href="https://example.com">посилання</a>',
+     '<b>жирний</b> <i>курсив</i> <code>код</code> <pre>блок</pre> <a href="https://example.com">посилання</a>'),
+    ('<header>Шапка</header>\n<HTML>Великими</HTML>\n<P>не чіпаємо</P>',
+     'Шапка</header>\nВеликими\n<P>не чіпаємо</P>'),
+    ('\n\n   Відступи на початку і в кінці   \n\n\n',
+     'Відступи на початку і в кінці'),
+    ('Перший абзац\n\n\n\n\n\nДругий абзац\n\n\nТретій',
+     'Перший абзац\n\nДругий абзац\n\nТретій'),
+    ('#\nЗаголовок після решітки без тексту',
+     '<b>Заголовок після решітки без тексту</b>'),
+    ('#######Сім решіток',
+     '<b>#Сім решіток</b>'),
+    ("<script>alert('x')</script>Текст після скрипта",
+     "alert('x')Текст після скрипта"),
+    ('<link rel="stylesheet" href="x.css"><p>Текст</p>',
+     'Текст'),
+    ('Рядок з CRLF\r\n## Заголовок CRLF\r\nКінець\r\n',
+     'Рядок з CRLF\r\n<b>Заголовок CRLF\r</b>\nКінець'),
+    ('**Список:**\n<ul>\n<li>**один**</li>\n<li>два # три</li>\n</ul>',
+     '<b>Список:</b>\n\n• <b>один</b>\n\n• два <b>три\n</b>'),
+    ('[gpt-5.6-luna] ## Відповідь\nГотово.',
+     '[gpt-5.6-luna] <b>Відповідь</b>\nГотово.'),
+    ('',
+     ''),
+]
+
+def chunked(text, rnd):
+    pos = 0
+    while pos < len(text):
+        size = rnd.randint(1, 7)
+        yield text[pos:pos + size]
+        pos += size
+
+class TestCleanHtml(unittest.TestCase):
+    def test_golden_corpus(self):
+        """Verify the precompiled sanitizer reproduces the previous implementation on the golden corpus."""
+        for source, expected in GOLDEN:
+            with self.subTest(source=source[:40]):
+                self.assertEqual(clean_html(source), expected)
+
+class TestIncrementalSanitizer(unittest.TestCase):
+    def test_matches_clean_html_for_any_chunking(self):
+        """Verify feeding text in random chunks yields exactly clean_html of the whole text."""
+        rnd = random.Random(7)
+        for batch in (0, 16, sanitizer_module.MIN_BATCH_CHARS):
+            with patch.object(sanitizer_module, "MIN_BATCH_CHARS", batch):
+                for sample in SAMPLES:
+                    expected = clean_html(sample)
+                    for _ in range(30):
+                        sanitizer = IncrementalSanitizer()
+                        for chunk in chunked(sample, rnd):
+                            sanitizer.feed(chunk)
+                        self.assertEqual(sanitizer.finish(), expected, repr(sample))
+
+    @patch.object(sanitizer_module, "MIN_BATCH_CHARS", 0)
+    def test_complete_lines_are_processed_on_arrival(self):
+        """Verify only the unfinished tail is left for finish()."""
+        sanitizer = IncrementalSanitizer()
+        sanitizer.feed("**a**\n**b")
+        self.assertEqual(sanitizer._out, ["<b>a</b>"])
+        self.assertEqual(sanitizer._pending, ["**b"])
+        sanitizer.feed("**")
+        self.assertEqual(sanitizer.finish(), "<b>a</b>\n<b>b</b>")
+
+    @patch.object(sanitizer_module, "MIN_BATCH_CHARS", 0)
+    def test_heading_hash_holds_line_back(self):
+        """Verify a line ending in '#' waits for the next line, as the heading rule spans the newline."""
+        sanitizer = IncrementalSanitizer()
+        sanitizer.feed("text\n#\n")
+        self.assertEqual(sanitizer._out, ["text"])
+        sanitizer.feed("Title\n")
+        self.assertEqual(sanitizer.finish(), clean_html("text\n#\nTitle\n"))
+
+class TestStreamBuffer(unittest.TestCase):
+    def test_accumulates_and_sanitizes(self):
+        """Verify the buffer joins chunks lazily and returns clean_html output without a second pass."""
+        buffer = StreamBuffer("[model] ", sanitize=True)
+        for chunk in ["## Hi", "\n**bo", "ld** text", "\n\n\n\nend"]:
+            buffer.append(chunk)
+        raw = "[model] ## Hi\n**bold** text\n\n\n\nend"
+        self.assertEqual(len(buffer), len(raw))
+        self.assertEqual(buffer.text(), raw)
+        buffer.append("!")
+        self.assertEqual(str(buffer), raw + "!")
+        self.assertEqual(buffer.sanitized(), clean_html(raw + "!"))
+
+if __name__ == '__main__':
+    unittest.main()
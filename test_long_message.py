@@ -0,0 +1,120 @@
+import unittest
+import os
+import re
+from unittest.mock import AsyncMock, MagicMock
+
+os.environ["BOT_TOKEN"] = "123456:TEST_TOKEN"
+os.environ["ENCRYPTION_KEY"] = "8Z6wY6uP04B4uE6_7V8M3aQ1bC2dE3fG4hI5jK6lM7o="
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter
+from bot.utils.html_sanitizer import split_html, strip_html
+from bot.utils.helpers import send_long_message
+
+TAG = re.compile(r'<(/?)([a-zA-Z][\w-]*)[^<>]*>')
+
+def assert_balanced(test, part):
+    """Кожен закриваючий тег відповідає останньому відкритому, і в кінці нічого не лишилось відкритим."""
+    stack = []
+    for closing, name in TAG.findall(part):
+        if closing:
+            test.assertTrue(stack and stack[-1] == name, f"unbalanced </{name}> in {part[:60]!r}")
+            stack.pop()
+        else:
+            stack.append(name)
+    test.assertEqual(stack, [], part[-60:])
+
+class TestSplitHtml(unittest.TestCase):
+    def test_open_tags_are_carried_across_parts(self):
+        """Verify a bold span crossing the limit is closed and reopened, and each part fits the limit."""
+        body = "\n".join(f"рядок {i} " + "слово " * 10 for i in range(300))
+        text = f"Вступ\n<b>{body}</b>\nКінець <i>курсив</i>"
+        parts = split_html(text, limit=4000)
+
+        self.assertGreater(len(parts), 1)
+        for part in parts:
+            self.assertLessEqual(len(part), 4000)
+            assert_balanced(self, part)
+        self.assertTrue(parts[1].startswith("<b>"))
+        visible = "".join(TAG.sub("", part) for part in parts)
+        self.assertEqual(visible.split(), TAG.sub("", text).split())
+
+    def test_long_code_block_is_split_into_valid_blocks(self):
+        """Verify a transcription wrapped in <code> stays a code block in every part."""
+        text = "<code>" + "слово " * 1500 + "</code>"
+        parts = split_html(text, limit=4000)
+        self.assertEqual(len(parts), 3)
+        for part in parts:
+            self.assertTrue(part.startswith("<code>") and part.endswith("</code>"))
+
+    def test_pre_block_keeps_indentation_across_parts(self):
+        """Verify continuation parts of a <pre> block keep leading indentation; only the separator newline is dropped."""
+        lines = [f"    line_{i} = {i}" for i in range(60)]
+        text = "<pre>" + "\n".join(lines) + "</pre>"
+        parts = split_html(text, limit=300)
+
+        self.assertGreater(len(parts), 1)
+        for part in parts:
+            self.assertTrue(part.startswith("<pre>    line_") and part.endswith("</pre>"))
+        body = "\n".join(part[len("<pre>"):-len("</pre>")] for part in parts)
+        self.assertEqual(body.split("\n"), lines)
+
+    def test_stray_markup_is_escaped(self):
+        """Verify raw <, > and & and unsupported tags become entities while Telegram tags survive."""
+        parts = split_html('a < b && c &amp; &nbsp; <unknown> <b>ok</b> <a href="https://x">l</a> 2>1')
+        self.assertEqual(parts, [
+            'a &lt; b &amp;&amp; c &amp; &amp;nbsp; &lt;unknown&gt; <b>ok</b> <a href="https://x">l</a> 2&gt;1'
+        ])
+
+    def test_misnested_and_unclosed_tags_are_repaired(self):
+        """Verify mis-nested, stray closing and unclosed tags produce a balanced part."""
+        self.assertEqual(split_html("<b>x<i>y</b>z</i></pre><code>w"), ["<b>x<i>y</i></b>z<code>w</code>"])
+
+    def test_never_cuts_inside_entity(self):
+        """Verify a hard cut without spaces does not split an escaped entity."""
+        parts = split_html("x" * 9 + "<" * 10, limit=12)
+        for part in parts:
+            self.assertIsNone(re.search(r'&[a-z]*$', part))
+        self.assertEqual("".join(strip_html(part) for part in parts), "x" * 9 + "<" * 10)
+
+class TestSendLongMessage(unittest.IsolatedAsyncioTestCase):
+    def _target(self):
+        target = MagicMock(spec=["send_message"])
+        target.send_message = AsyncMock()
+        return target
+
+    async def test_long_html_answer_goes_out_without_fallbacks(self):
+        """Verify a long bold answer is sent in the minimal number of HTML requests."""
+        target = self._target()
+        text = "<b>" + "\n".join("рядок " * 20 for _ in range(100)) + "</b>"
+        await send_long_message(target, text, clean=False)
+
+        calls = target.send_message.await_args_list
+        self.assertEqual(len(calls), len(split_html(text)))
+        self.assertEqual(len(calls), -(-len(text) // 4000))
+        for call in calls:
+            self.assertEqual(call.kwargs["parse_mode"], ParseMode.HTML)
+            assert_balanced(self, call.kwargs["text"])
+
+    async def test_rejected_part_falls_back_to_plain_text(self):
+        """Verify a BadRequest resends only that part, stripped of markup."""
+        target = self._target()
+        target.send_message.side_effect = [BadRequest("Can't parse entities"), None]
+        await send_long_message(target, "<b>жирний</b> &amp; текст", clean=False)
+
+        fallback = target.send_message.await_args_list[1].kwargs
+        self.assertIsNone(fallback["parse_mode"])
+        self.assertEqual(fallback["text"], "жирний & текст")
+
+    async def test_flood_wait_retries_same_part(self):
+        """Verify RetryAfter waits and retries with HTML instead of degrading to plain text."""
+        target = self._target()
+        target.send_message.side_effect = [RetryAfter(0), None]
+        await send_long_message(target, "<b>ok</b>", clean=False)
+
+        calls = target.send_message.await_args_list
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(calls[1].kwargs["parse_mode"], ParseMode.HTML)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import unittest
+import os
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+os.environ["BOT_TOKEN"] = "123456:TEST_TOKEN"
+os.environ["ENCRYPTION_KEY"] = "8Z6wY6uP04B4uE6_7V8M3aQ1bC2dE3fG4hI5jK6lM7o="
+
+from bot.utils.media_cache import MediaCache, media_cache, normalize_url, extract_file_ref, send_cached_media
+from bot.handlers.text import handle_text
+
+class TestNormalizeUrl(unittest.TestCase):
+    def test_equivalent_links_share_key(self):
+        """Verify tracking params, www, host aliases and youtu.be short links collapse to one key."""
+        self.assertEqual(
+            normalize_url("https://www.instagram.com/reel/Cx1/?igshid=abc&utm_source=ig"),
+            normalize_url("http://instagram.com/reel/Cx1")
+        )
+        self.assertEqual(normalize_url("https://x.com/u/status/1?s=20"), normalize_url("https://twitter.com/u/status/1"))
+        self.assertEqual(
+            normalize_url("https://youtu.be/dQw4w9WgXcQ?si=x"),
+            normalize_url("https://www.youtube.com/watch?v=dQw4w9WgXcQ&feature=share")
+        )
+
+    def test_content_params_are_kept(self):
+        """Verify different videos never share a key."""
+        self.assertNotEqual(normalize_url("https://youtube.com/watch?v=a"), normalize_url("https://youtube.com/watch?v=b"))
+        self.assertNotEqual(normalize_url("https://vm.tiktok.com/ZM1/"), normalize_url("https://vm.tiktok.com/ZM2/"))
+
+class TestMediaCache(unittest.TestCase):
+    def test_ttl_expiry(self):
+        """Verify expired entries are dropped and counted as misses."""
+        cache = MediaCache(ttl_seconds=10, max_size=10)
+        with patch("bot.utils.media_cache.time.monotonic", return_value=100.0):
+            cache.add("https://x.com/a/status/1", "video", "F1")
+        with patch("bot.utils.media_cache.time.monotonic", return_value=105.0):
+            self.assertEqual(cache.get("https://twitter.com/a/status/1"), [("video", "F1")])
+        with patch("bot.utils.media_cache.time.monotonic", return_value=111.0):
+            self.assertIsNone(cache.get("https://x.com/a/status/1"))
+        self.assertEqual((cache.hits, cache.misses, cache.stats()["size"]), (1, 1, 0))
+
+    def test_lru_eviction(self):
+        """Verify the least recently used link is evicted when the cache is full."""
+        cache = MediaCache(ttl_seconds=60, max_size=2)
+        cache.add("https://youtube.com/watch?v=1", "video", "F1")
+        cache.add("https://youtube.com/watch?v=2", "video", "F2")
+        cache.get("https://youtube.com/watch?v=1")
+        cache.add("https://youtube.com/watch?v=3", "video", "F3")
+        self.assertIsNone(cache.get("https://youtube.com/watch?v=2"))
+        self.assertIsNotNone(cache.get("https://youtube.com/watch?v=1"))
+        self.assertEqual(cache.evicted, 1)
+
+    def test_album_is_published_only_when_complete(self):
+        """Verify files of one task are not served until all arrive, and a new task replaces the entry."""
+        cache = MediaCache(ttl_seconds=60, max_size=10)
+        cache.add("https://instagram.com/p/1", "photo", "P1", source=7, total=2)
+        self.assertIsNone(cache.get("https://instagram.com/p/1"))
+        cache.add("https://instagram.com/p/1", "video", "V1", source=7, total=2)
+        self.assertEqual(cache.get("https://instagram.com/p/1"), [("photo", "P1"), ("video", "V1")])
+        cache.add("https://instagram.com/p/1", "video", "V2", source=8)
+        self.assertEqual(cache.get("https://instagram.com/p/1"), [("video", "V2")])
+
+    def test_extract_file_ref_prefers_largest_photo(self):
+        """Verify the file reference of the largest photo size is used."""
+        msg = SimpleNamespace(video=None, animation=None, photo=[SimpleNamespace(file_id="small"), SimpleNamespace(file_id="big")])
+        self.assertEqual(extract_file_ref(msg), ("photo", "big"))
+        self.assertIsNone(extract_file_ref(SimpleNamespace(text="hi")))
+
+class TestCachedDelivery(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        media_cache.clear()
+
+    def tearDown(self):
+        media_cache.clear()
+
+    def _update(self, text):
+        update = MagicMock()
+        update.message.text = text
+        update.message.message_id = 55
+        update.message.reply_to_message = None
+        update.effective_chat.id = 123
+        update.effective_chat.type = "private"
+        update.effective_user.id = 123
+        return update
+
+    async def test_repeated_link_skips_ytdlp_and_userbot(self):
+        """Verify a cached link is re-sent by file_id without downloading or enqueueing."""
+        media_cache.add("https://youtu.be/abc", "video", "FILE_YT")
+        media_cache.add("https://vm.tiktok.com/ZMabc/", "video", "FILE_TT")
+        context = MagicMock()
+        context.bot.send_video = AsyncMock()
+
+        with patch("bot.handlers.text.get_user_model_settings", AsyncMock(return_value={"video_repost": True})), \
+             patch("bot.handlers.text.download_media_direct", AsyncMock()) as download, \
+             patch("bot.handlers.text.enqueue_download", AsyncMock()) as enqueue:
+            await handle_text(self._update("look https://www.youtube.com/watch?v=abc&feature=share"), context)
+            await handle_text(self._update("https://vm.tiktok.com/ZMabc/?is_from_webapp=1"), context)
+
+        download.assert_not_called()
+        enqueue.assert_not_called()
+        sent = [c.args for c in context.bot.send_video.call_args_list]
+        self.assertEqual(sent, [(123, "FILE_YT"), (123, "FILE_TT")])
+
+    async def test_album_is_replayed_as_media_group(self):
+        """Verify a cached album goes out as one media group, and 11 files as two groups without a single tail."""
+        bot = MagicMock()
+        bot.send_media_group = AsyncMock()
+        bot.send_photo = AsyncMock()
+        media_cache.add("https://instagram.com/p/1", "photo", "P1", source=1, total=2)
+        media_cache.add("https://instagram.com/p/1", "video", "V1", source=1, total=2)
+        self.assertTrue(await send_cached_media(bot, 1, "https://instagram.com/p/1", reply_to_message_id=5))
+        album = bot.send_media_group.await_args.args[1]
+        self.assertEqual([m.media for m in album], ["P1", "V1"])
+        bot.send_photo.assert_not_called()
+
+        bot.send_media_group.reset_mock()
+        for i in range(11):
+            media_cache.add("https://instagram.com/p/2", "photo", f"P{i}", source=2, total=11)
+        self.assertTrue(await send_cached_media(bot, 1, "https://instagram.com/p/2"))
+        self.assertEqual([len(c.args[1]) for c in bot.send_media_group.await_args_list], [6, 5])
+
+    async def test_partial_send_does_not_fall_through_to_download(self):
+        """Verify a failure after the first group is reported as delivered, so the album is not sent twice."""
+        bot = MagicMock()
+        bot.send_media_group = AsyncMock(side_effect=[None, Exception("wrong file identifier")])
+        for i in range(12):
+            media_cache.add("https://instagram.com/p/3", "photo", f"P{i}", source=3, total=12)
+        self.assertTrue(await send_cached_media(bot, 1, "https://instagram.com/p/3"))
+        self.assertIsNone(media_cache.get("https://instagram.com/p/3"))
+
+    async def test_rejected_file_id_falls_back_and_invalidates(self):
+        """Verify a stale file_id drops the entry so the normal download path runs."""
+        media_cache.add("https://youtube.com/watch?v=abc", "video", "STALE")
+        bot = MagicMock()
+        bot.send_video = AsyncMock(side_effect=Exception("wrong file identifier"))
+        self.assertFalse(await send_cached_media(bot, 1, "https://youtube.com/watch?v=abc"))
+        self.assertIsNone(media_cache.get("https://youtube.com/watch?v=abc"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,6 +9,7 @@ from bot.ai.openrouter_provider import OpenRouterProvider
 from bot.ai.openai_provider import OpenAIProvider
 from bot.ai.google_provider import GoogleProvider
 from bot.utils.helpers import get_ai_provider
+from bot.utils.provider_pool import ProviderPool, provider_pool
 from config import AVAILABLE_MODELS, DEFAULT_SETTINGS
 
 class TestOpenRouterIntegration(unittest.IsolatedAsyncioTestCase):
@@ -114,5 +115,67 @@ class TestOpenRouterIntegration(unittest.IsolatedAsyncioTestCase):
             provider = await get_ai_provider(1002, for_transcription=True)
             self.assertIsInstance(provider, OpenAIProvider)
 
+    async def test_get_ai_provider_reuses_pooled_client(self):
+        """Verify repeated requests reuse one provider instance without touching the DB."""
+        provider_pool.clear()
+        with patch("bot.utils.helpers.AsyncSessionLocal", self.SessionLocal), \
+             patch("bot.utils.helpers.SYSTEM_OPENROUTER_KEY", "sk-or-system-key"):
+
+            async with self.SessionLocal() as session:
+                session.add(User(id=1003, settings={"model": "qwen/qwen3.7-flash"}))
+                await session.commit()
+
+            first = await get_ai_provider(1003)
+            with patch("bot.utils.helpers.AsyncSessionLocal", side_effect=AssertionError("DB must not be hit")):
+                second = await get_ai_provider(1003)
+            self.assertIs(first, second)
+
+    async def test_get_ai_provider_key_change_invalidates(self):
+        """Verify adding a user key after invalidate_user switches to a new pooled client."""
+        provider_pool.clear()
+        with patch("bot.utils.helpers.AsyncSessionLocal", self.SessionLocal), \
+             patch("bot.utils.helpers.SYSTEM_OPENROUTER_KEY", "sk-or-system-key"):
+
+            async with self.SessionLocal() as session:
+                session.add(User(id=1004, settings={"model": "qwen/qwen3.7-flash"}))
+                await session.commit()
+
+            system_provider = await get_ai_provider(1004)
+
+            async with self.SessionLocal() as session:
+                session.add(APIKey(user_id=1004, provider="openrouter", encrypted_key=key_manager.encrypt("sk-or-user-key"), is_active=True))
+                await session.commit()
+            provider_pool.invalidate_user(1004)
+
+            user_provider = await get_ai_provider(1004)
+            self.assertIsNot(system_provider, user_provider)
+            self.assertEqual(user_provider.api_key, "sk-or-user-key")
+
+    def test_provider_pool_bounded_and_idle_eviction(self):
+        """Verify pool size bound and idle eviction."""
+        pool = ProviderPool(max_size=2, idle_seconds=10, resolve_ttl_seconds=10)
+        with patch("bot.utils.provider_pool.time.monotonic", return_value=0.0):
+            pool.acquire("openai", "k1", None, MagicMock)
+            pool.acquire("openai", "k2", None, MagicMock)
+            pool.acquire("openai", "k3", None, MagicMock)
+        self.assertEqual(pool.stats()["size"], 2)
+        with patch("bot.utils.provider_pool.time.monotonic", return_value=20.0):
+            pool.acquire("openai", "k4", None, MagicMock)
+        self.assertEqual(pool.stats()["size"], 1)
+
+    def test_resolved_keys_are_bounded_and_expire(self):
+        """Verify cached decrypted keys are capped by max_size and dropped once expired, without a repeat call."""
+        pool = ProviderPool(max_size=2, idle_seconds=100, resolve_ttl_seconds=10)
+        with patch("bot.utils.provider_pool.time.monotonic", return_value=0.0):
+            for user_id in (1, 2, 3):
+                pool.set_resolved(user_id, False, ("openai", f"sk-{user_id}", None))
+        self.assertEqual(pool.stats()["resolved"], 2)
+        with patch("bot.utils.provider_pool.time.monotonic", return_value=5.0):
+            self.assertIsNone(pool.get_resolved(1, False))
+            pool.set_resolved(4, False, ("openai", "sk-4", None))
+        with patch("bot.utils.provider_pool.time.monotonic", return_value=12.0):
+            pool.acquire("openai", "k1", None, MagicMock)
+        self.assertEqual(list(pool._resolved), [(4, False)])
+
 if __name__ == "__main__":
     unittest.main()
@@ -11,7 +11,7 @@ from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sess
 from sqlalchemy import select, and_
 from bot.database.models import Base, User, DailyTranscriptionUsage
 from bot.utils.search import extract_source_links, format_sources_html
-from bot.utils.limits import get_daily_transcription_used_seconds, check_transcription_limit, record_transcription_usage
+from bot.utils.limits import get_daily_transcription_used_seconds, check_transcription_limit, record_transcription_usage, quota_counter, DailyQuotaCounter
 from bot.ai.openai_provider import OpenAIProvider
 from bot.ai.google_provider import GoogleProvider
 from config import DAILY_TRANSCRIPTION_LIMIT_SECONDS
@@ -42,8 +42,10 @@ class TestPhase3SourcesAndLimits(unittest.IsolatedAsyncioTestCase):
         async with self.engine.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
         self.SessionLocal = async_sessionmaker(self.engine, expire_on_commit=False, class_=AsyncSession)
+        quota_counter.reset()
 
     async def asyncTearDown(self):
+        quota_counter.reset()
         await self.engine.dispose()
 
     # --- 1. Source Link Extraction and Formatting Tests ---
@@ -288,10 +290,9 @@ class TestPhase3SourcesAndLimits(unittest.IsolatedAsyncioTestCase):
             self.assertTrue(allowed)
 
     async def test_daily_limit_unique_constraint_and_concurrent_recovery(self):
-        """Verify unique constraint on (user_id, usage_date) and recovery from concurrent insert conflict."""
+        """Verify unique constraint on (user_id, usage_date) and that concurrent records merge into one row."""
         from sqlalchemy.exc import IntegrityError
         from sqlalchemy import UniqueConstraint
-        from contextlib import asynccontextmanager
 
         # 1. Verify model metadata has unique constraint on user_id and usage_date
         unique_constraints = [
@@ -325,27 +326,100 @@ class TestPhase3SourcesAndLimits(unittest.IsolatedAsyncioTestCase):
                 with self.assertRaises(IntegrityError):
                     await session.commit()
 
-            # 3. Force the actual IntegrityError recovery branch in record_transcription_usage.
-            recovered_usage = MagicMock(seconds_used=100)
-            session = MagicMock()
-            session.execute = AsyncMock(side_effect=[
-                MagicMock(scalar_one_or_none=MagicMock(return_value=None)),
-                MagicMock(scalar_one_or_none=MagicMock(return_value=recovered_usage)),
-            ])
-            session.commit = AsyncMock(side_effect=[IntegrityError("insert", {}, Exception("duplicate")), None])
-            session.rollback = AsyncMock()
-
-            @asynccontextmanager
-            async def failed_insert_session():
-                yield session
-
-            with patch("bot.utils.limits.AsyncSessionLocal", return_value=failed_insert_session()):
-                await record_transcription_usage(user_id, 300)
-
-            self.assertEqual(recovered_usage.seconds_used, 400)
-            self.assertEqual(session.execute.await_count, 2)
-            self.assertEqual(session.commit.await_count, 2)
-            session.rollback.assert_awaited_once()
+            # 3. Concurrent record_transcription_usage calls converge on the same row via UPSERT
+            import asyncio
+            await asyncio.gather(*(record_transcription_usage(user_id, 300) for _ in range(3)))
+            self.assertEqual(await get_daily_transcription_used_seconds(user_id), 1000)
+
+    async def test_parallel_reservations_never_overshoot(self):
+        """Verify 50 concurrent reservations on a file DB admit exactly the cap and a release refunds it."""
+        import asyncio
+        import tempfile
+        from bot.utils.limits import reserve_transcription_quota, release_transcription_quota, commit_transcription_quota
+
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'quota.db')}", echo=False)
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            try:
+                with patch("bot.utils.limits.AsyncSessionLocal", SessionLocal):
+                    user_id = 5001
+                    per_call = 100
+                    results = await asyncio.gather(*(reserve_transcription_quota(user_id, per_call) for _ in range(50)))
+
+                    granted = [r for r, _ in results if r is not None]
+                    refused = [msg for r, msg in results if r is None]
+                    self.assertEqual(len(granted), DAILY_TRANSCRIPTION_LIMIT_SECONDS // per_call)
+                    self.assertTrue(all("ліміт" in msg.lower() for msg in refused))
+                    self.assertEqual(await get_daily_transcription_used_seconds(user_id), DAILY_TRANSCRIPTION_LIMIT_SECONDS)
+
+                    # Failed transcription refunds; release after commit and double release are no-ops
+                    await release_transcription_quota(granted[0])
+                    await release_transcription_quota(granted[0])
+                    await commit_transcription_quota(granted[1])
+                    await release_transcription_quota(granted[1])
+                    self.assertEqual(await get_daily_transcription_used_seconds(user_id), DAILY_TRANSCRIPTION_LIMIT_SECONDS - per_call)
+
+                    again, msg = await reserve_transcription_quota(user_id, per_call)
+                    self.assertIsNotNone(again)
+                    exhausted, msg = await reserve_transcription_quota(user_id, 0)
+                    self.assertIsNone(exhausted)
+                    self.assertIn("вичерпано", msg)
+
+                    self.assertEqual(await quota_counter.flush(), 1)
+                    async with SessionLocal() as session:
+                        stored = (await session.execute(select(DailyTranscriptionUsage.seconds_used))).scalar_one()
+                    self.assertEqual(stored, DAILY_TRANSCRIPTION_LIMIT_SECONDS)
+            finally:
+                await engine.dispose()
+
+    async def test_quota_counter_hydrates_once_and_survives_restart(self):
+        """Verify checks are served from memory after one hydration and a restarted process reconciles from the DB."""
+        from sqlalchemy import event
+        with patch("bot.utils.limits.AsyncSessionLocal", self.SessionLocal):
+            user_id = 6001
+            await record_transcription_usage(user_id, 600)
+            self.assertEqual(quota_counter.stats()["hydrations"], 1)
+
+            statements = []
+            def _capture(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+            event.listen(self.engine.sync_engine, "before_cursor_execute", _capture)
+            try:
+                for _ in range(20):
+                    allowed, _ = await check_transcription_limit(user_id, duration_seconds=60)
+                    self.assertTrue(allowed)
+            finally:
+                event.remove(self.engine.sync_engine, "before_cursor_execute", _capture)
+            self.assertEqual(statements, [])
+
+            await record_transcription_usage(user_id, 300)
+            self.assertEqual(await quota_counter.flush(), 1)
+
+            # "Рестарт": новий лічильник бачить усе скинуте раніше
+            restarted = DailyQuotaCounter()
+            self.assertEqual(await restarted.get_used(user_id), 900)
+
+    async def test_quota_counter_resets_at_utc_midnight(self):
+        """Verify the counter starts a new day at UTC midnight and still persists the previous day's deltas."""
+        day1 = datetime(2026, 3, 1, tzinfo=timezone.utc).date()
+        day2 = datetime(2026, 3, 2, tzinfo=timezone.utc).date()
+        counter = DailyQuotaCounter()
+        with patch("bot.utils.limits.AsyncSessionLocal", self.SessionLocal):
+            with patch.object(DailyQuotaCounter, "_today", return_value=day1):
+                usage_date, used = await counter.try_add(7001, DAILY_TRANSCRIPTION_LIMIT_SECONDS, DAILY_TRANSCRIPTION_LIMIT_SECONDS)
+                self.assertEqual(usage_date, day1)
+                refused, _ = await counter.try_add(7001, 1, DAILY_TRANSCRIPTION_LIMIT_SECONDS)
+                self.assertIsNone(refused)
+
+            with patch.object(DailyQuotaCounter, "_today", return_value=day2):
+                self.assertEqual(await counter.get_used(7001), 0)
+                self.assertEqual(await counter.flush(), 1)
+
+        async with self.SessionLocal() as session:
+            rows = (await session.execute(select(DailyTranscriptionUsage.usage_date, DailyTranscriptionUsage.seconds_used))).all()
+        self.assertEqual(rows, [(day1, DAILY_TRANSCRIPTION_LIMIT_SECONDS)])
 
 if __name__ == "__main__":
     unittest.main()
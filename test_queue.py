@@ -11,9 +11,13 @@ os.environ["ENCRYPTION_KEY"] = "8Z6wY6uP04B4uE6_7V8M3aQ1bC2dE3fG4hI5jK6lM7o="
 os.environ["ADMIN_IDS"] = "111,222"
 
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy import delete
-from bot.database.models import Base, DownloadQueue, User
-from bot.utils.queue_manager import get_queue_stats, clear_pending_tasks, clear_all_tasks
+from sqlalchemy import delete, select
+from bot.database.models import Base, DownloadQueue, DownloadQueueDaily, User
+from bot.utils.queue_manager import (
+    get_queue_stats, clear_pending_tasks, clear_all_tasks,
+    claim_next_task, finish_task, release_task, dead_letter_expired_tasks, archive_finished_tasks,
+    route_unassigned_tasks
+)
 from bot.handlers.commands import queue_cmd
 from bot.handlers.settings import queue_menu, queue_clear_pending, queue_clear_all
 
@@ -180,5 +184,253 @@ class TestQueueManager(unittest.IsolatedAsyncioTestCase):
         stats = await get_queue_stats()
         self.assertEqual(stats["total"], 0)
 
+class TestQueueLeases(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(self.tmp_dir.name, 'lease.db')}", echo=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.SessionLocal = async_sessionmaker(self.engine, expire_on_commit=False, class_=AsyncSession)
+        self.patcher = patch("bot.utils.queue_manager.AsyncSessionLocal", self.SessionLocal)
+        self.patcher.start()
+
+    async def asyncTearDown(self):
+        self.patcher.stop()
+        await self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    async def _add(self, count: int):
+        async with self.SessionLocal() as session:
+            session.add_all([DownloadQueue(user_id=1, link=f"http://example.com/{i}", status="pending") for i in range(count)])
+            await session.commit()
+
+    async def _expire_leases(self):
+        from datetime import datetime, timedelta, timezone
+        from sqlalchemy import update
+        async with self.SessionLocal() as session:
+            await session.execute(update(DownloadQueue).values(lease_until=datetime.now(timezone.utc) - timedelta(seconds=1)))
+            await session.commit()
+
+    async def test_concurrent_claims_are_exclusive(self):
+        """Verify parallel consumers never receive the same task and claim in FIFO order."""
+        await self._add(5)
+        claims = await asyncio.gather(*(claim_next_task(f"w{i}") for i in range(12)))
+        claimed = [t for t in claims if t is not None]
+        self.assertEqual(sorted(t.id for t in claimed), [1, 2, 3, 4, 5])
+        self.assertTrue(all(t.status == "processing" and t.attempts == 1 and t.lease_until for t in claimed))
+        self.assertIsNone(await claim_next_task("late"))
+
+    async def test_claim_takes_only_tasks_of_worker_donor(self):
+        """Verify a monkettbot worker gets its task even when older SaveAsBot tasks are waiting."""
+        async with self.SessionLocal() as session:
+            session.add_all([
+                DownloadQueue(user_id=1, link="https://youtu.be/1", status="pending", donor="SaveAsBot"),
+                DownloadQueue(user_id=1, link="https://youtu.be/2", status="pending", donor="SaveAsBot"),
+                DownloadQueue(user_id=1, link="https://x.com/a/status/1", status="pending", donor="monkettbot"),
+            ])
+            await session.commit()
+        task = await claim_next_task("m0", donor="monkettbot")
+        self.assertEqual(task.link, "https://x.com/a/status/1")
+        self.assertIsNone(await claim_next_task("m1", donor="monkettbot"))
+        self.assertEqual((await claim_next_task("s0", donor="SaveAsBot")).link, "https://youtu.be/1")
+
+    async def test_unrouted_tasks_get_donor(self):
+        """Verify active tasks queued without a donor are routed by link, finished ones are left alone."""
+        async with self.SessionLocal() as session:
+            session.add_all([
+                DownloadQueue(user_id=1, link="https://twitter.com/a/status/1", status="pending"),
+                DownloadQueue(user_id=1, link="https://youtu.be/1", status="processing"),
+                DownloadQueue(user_id=1, link="https://youtu.be/2", status="done"),
+            ])
+            await session.commit()
+        self.assertEqual(await route_unassigned_tasks(), 2)
+        async with self.SessionLocal() as session:
+            donors = (await session.execute(select(DownloadQueue.donor).order_by(DownloadQueue.id))).scalars().all()
+        self.assertEqual(donors, ["monkettbot", "SaveAsBot", None])
+        self.assertIsNotNone(await claim_next_task("m0", donor="monkettbot"))
+
+    async def test_expired_lease_is_reclaimed_and_fenced(self):
+        """Verify a crashed consumer's task is re-claimed and its stale finish is rejected."""
+        await self._add(1)
+        first = await claim_next_task("crashed", lease_seconds=60)
+        self.assertIsNone(await claim_next_task("other"))
+
+        await self._expire_leases()
+        second = await claim_next_task("other")
+        self.assertEqual((second.id, second.attempts, second.claimed_by), (first.id, 2, "other"))
+
+        self.assertFalse(await finish_task(first.id, "crashed", "done"))
+        self.assertTrue(await finish_task(second.id, "other", "done"))
+        self.assertEqual((await get_queue_stats())["done"], 1)
+
+    async def test_dead_letter_after_max_attempts_and_release_keeps_attempts(self):
+        """Verify attempts exhaust into 'dead' while a FloodWait release does not consume an attempt."""
+        await self._add(1)
+        task = await claim_next_task("w", max_attempts=2)
+        self.assertTrue(await release_task(task.id, "w"))
+        task = await claim_next_task("w", max_attempts=2)
+        self.assertEqual(task.attempts, 1)
+
+        await self._expire_leases()
+        task = await claim_next_task("w", max_attempts=2)
+        self.assertEqual(task.attempts, 2)
+
+        await self._expire_leases()
+        self.assertIsNone(await claim_next_task("w", max_attempts=2))
+        self.assertEqual(await dead_letter_expired_tasks(max_attempts=2), 1)
+        stats = await get_queue_stats()
+        self.assertEqual((stats["dead"], stats["processing"]), (1, 0))
+
+    async def test_init_db_adds_lease_columns_to_old_table(self):
+        """Verify the schema migration adds new nullable/defaulted columns to a pre-lease download_queue."""
+        from sqlalchemy import text, inspect
+        from bot.database import session as session_module
+        async with self.engine.begin() as conn:
+            await conn.execute(text("DROP TABLE download_queue"))
+            await conn.execute(text(
+                "CREATE TABLE download_queue (id INTEGER PRIMARY KEY, user_id BIGINT, message_id INTEGER, "
+                "link VARCHAR, status VARCHAR, created_at DATETIME)"
+            ))
+            await conn.execute(text("INSERT INTO download_queue (user_id, link, status) VALUES (1, 'http://old', 'pending')"))
+
+        with patch.object(session_module, "engine", self.engine):
+            await session_module.init_db()
+
+        async with self.engine.connect() as conn:
+            columns = await conn.run_sync(lambda c: {col["name"] for col in inspect(c).get_columns("download_queue")})
+        self.assertTrue({"attempts", "claimed_by", "claimed_at", "lease_until"} <= columns)
+        self.assertTrue({"donor", "error", "finished_at", "result_message_ids"} <= columns)
+        task = await claim_next_task("w")
+        self.assertEqual((task.link, task.attempts), ("http://old", 1))
+
+    async def test_finish_stores_structured_result(self):
+        """Verify the result goes to dedicated columns and the link stays untouched."""
+        await self._add(2)
+        ok = await claim_next_task("w")
+        failed = await claim_next_task("w")
+        self.assertTrue(await finish_task(ok.id, "w", "done", donor="SaveAsBot", result_message_ids=[10, 11]))
+        self.assertTrue(await finish_task(failed.id, "w", "failed_by_donor", donor="monkettbot", error="Private: a:b###c"))
+
+        async with self.SessionLocal() as session:
+            ok = await session.get(DownloadQueue, ok.id)
+            failed = await session.get(DownloadQueue, failed.id)
+        self.assertEqual((ok.donor, ok.result_message_ids, ok.error), ("SaveAsBot", [10, 11], None))
+        self.assertEqual((failed.link, failed.error), ("http://example.com/1", "Private: a:b###c"))
+        self.assertIsNotNone(failed.finished_at)
+
+    async def test_turnaround_percentiles_per_donor(self):
+        """Verify get_queue_stats reports nearest-rank p50/p95 of enqueue -> finish per donor."""
+        from datetime import datetime, timedelta
+        base = datetime(2026, 1, 1)
+        async with self.SessionLocal() as session:
+            session.add_all([
+                DownloadQueue(user_id=1, link="l", status="done", donor="SaveAsBot",
+                              created_at=base, finished_at=base + timedelta(seconds=s))
+                for s in range(1, 21)
+            ] + [
+                DownloadQueue(user_id=1, link="l", status="timeout", donor="monkettbot",
+                              created_at=base, finished_at=base + timedelta(seconds=30)),
+                DownloadQueue(user_id=1, link="l", status="pending")
+            ])
+            await session.commit()
+
+        turnaround = (await get_queue_stats())["turnaround"]
+        self.assertEqual(turnaround["SaveAsBot"], {"count": 20, "p50": 10.0, "p95": 19.0})
+        self.assertEqual(turnaround["monkettbot"], {"count": 1, "p50": 30.0, "p95": 30.0})
+
+    async def test_migration_splits_legacy_error_links(self):
+        """Verify old USERBOT_ERROR-encoded links move into donor/error once, when the error column is added."""
+        from sqlalchemy import text
+        from bot.database import session as session_module
+        legacy = "USERBOT_ERROR:SaveAsBot:Video is private###https://x.com/a/status/1"
+        async with self.engine.begin() as conn:
+            await conn.execute(text("DROP TABLE download_queue"))
+            await conn.execute(text(
+                "CREATE TABLE download_queue (id INTEGER PRIMARY KEY, user_id BIGINT, message_id INTEGER, "
+                "link VARCHAR, status VARCHAR, created_at DATETIME)"
+            ))
+            await conn.execute(text(
+                "INSERT INTO download_queue (user_id, link, status) VALUES (1, :link, 'failed_by_donor')"
+            ), {"link": legacy})
+        with patch.object(session_module, "engine", self.engine):
+            await session_module.init_db()
+
+        async with self.SessionLocal() as session:
+            task = await session.get(DownloadQueue, 1)
+        self.assertEqual((task.link, task.donor, task.error), ("https://x.com/a/status/1", "SaveAsBot", "Video is private"))
+
+        # Колонка вже є — наступні старти не сканують link повторно
+        async with self.engine.begin() as conn:
+            await conn.execute(text("UPDATE download_queue SET link = :link WHERE id = 1"), {"link": legacy})
+        with patch.object(session_module, "engine", self.engine):
+            await session_module.init_db()
+        async with self.SessionLocal() as session:
+            task = await session.get(DownloadQueue, 1)
+        self.assertEqual(task.link, legacy)
+
+    async def test_archive_rolls_up_old_finished_tasks(self):
+        """Verify old terminal rows become daily counters per status/donor while active and fresh rows stay."""
+        from datetime import datetime, timedelta, timezone
+        now = datetime.now(timezone.utc)
+        day = now - timedelta(days=3)
+        async with self.SessionLocal() as session:
+            session.add_all(
+                [DownloadQueue(user_id=1, link="l", status="done", donor="SaveAsBot",
+                               created_at=day, finished_at=day + timedelta(seconds=10)) for _ in range(3)]
+                + [DownloadQueue(user_id=1, link="l", status="failed_by_donor", donor="monkettbot",
+                                 created_at=day, finished_at=day),
+                   DownloadQueue(user_id=1, link="l", status="done", donor="SaveAsBot", finished_at=now),
+                   DownloadQueue(user_id=1, link="l", status="pending", created_at=day)]
+            )
+            await session.commit()
+
+        result = await archive_finished_tasks(older_than_hours=24, batch_size=2)
+        self.assertEqual(result["archived"], 4)
+
+        async with self.SessionLocal() as session:
+            remaining = (await session.execute(select(DownloadQueue.status).order_by(DownloadQueue.id))).scalars().all()
+            daily = {
+                (r.day, r.status, r.donor): (r.count, r.turnaround_seconds, r.turnaround_count)
+                for r in (await session.execute(select(DownloadQueueDaily))).scalars().all()
+            }
+        self.assertEqual(remaining, ["done", "pending"])
+        self.assertEqual(daily, {
+            (day.date(), "done", "SaveAsBot"): (3, 30.0, 3),
+            (day.date(), "failed_by_donor", "monkettbot"): (1, 0.0, 1),
+        })
+        stats = await get_queue_stats()
+        self.assertEqual((stats["total"], stats["archived"]), (2, 4))
+
+        # Повторний запуск нічого не дублює; нові старі рядки додаються до існуючих лічильників
+        self.assertEqual((await archive_finished_tasks(older_than_hours=24))["archived"], 0)
+        async with self.SessionLocal() as session:
+            session.add(DownloadQueue(user_id=1, link="l", status="done", donor="SaveAsBot", finished_at=day))
+            await session.commit()
+        await archive_finished_tasks(older_than_hours=24)
+        self.assertEqual((await get_queue_stats())["archived"], 5)
+
+    async def test_claim_query_does_not_scan_history(self):
+        """Verify the claim statement is served by indexes, not a full scan of download_queue."""
+        from sqlalchemy import event
+        async with self.SessionLocal() as session:
+            session.add_all([DownloadQueue(user_id=1, link="l", status="done") for _ in range(200)])
+            await session.commit()
+
+        statements = []
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().startswith("UPDATE download_queue"):
+                statements.append((statement, parameters))
+        event.listen(self.engine.sync_engine, "before_cursor_execute", capture)
+        try:
+            await claim_next_task("w")
+        finally:
+            event.remove(self.engine.sync_engine, "before_cursor_execute", capture)
+
+        statement, parameters = statements[0]
+        async with self.engine.connect() as conn:
+            plan = (await conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)).all()
+        details = [row[-1] for row in plan]
+        self.assertFalse([d for d in details if d.startswith("SCAN download_queue")], details)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import asyncio
+import os
+import socket
+import tempfile
+import time
+from unittest.mock import patch
+
+os.environ["BOT_TOKEN"] = "123456:TEST_TOKEN"
+os.environ["ENCRYPTION_KEY"] = "8Z6wY6uP04B4uE6_7V8M3aQ1bC2dE3fG4hI5jK6lM7o="
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from bot.database.models import Base, DownloadQueue
+from bot.utils.queue_notify import QueueNotifier
+from bot.utils.queue_manager import enqueue_download
+
+def _free_udp_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class TestQueueNotifier(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        port = _free_udp_port()
+        self.consumer = QueueNotifier("127.0.0.1", port)
+        self.producer = QueueNotifier("127.0.0.1", port)
+        self.assertTrue(await self.consumer.start_listener())
+
+    async def asyncTearDown(self):
+        self.consumer.close()
+        self.producer.close()
+
+    async def test_wakeup_latency_is_milliseconds(self):
+        """Verify a notify from another notifier wakes the waiting consumer well under the old 2s poll."""
+        started = time.perf_counter()
+        self.producer.notify()
+        self.assertTrue(await self.consumer.wait(5))
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertEqual(self.consumer.received, 1)
+
+    async def test_idle_wait_falls_back_after_timeout(self):
+        """Verify an idle consumer only returns on the fallback timeout."""
+        self.assertFalse(await self.consumer.wait(0.05, since=self.consumer.mark()))
+
+    async def test_notify_before_wait_is_not_lost(self):
+        """Verify a notification arriving between mark() and wait() is still observed."""
+        seen = self.consumer.mark()
+        self.producer.notify()
+        await asyncio.sleep(0.2)
+        self.assertTrue(await self.consumer.wait(0.01, since=seen))
+
+    async def test_one_worker_does_not_swallow_another_wakeup(self):
+        """Verify a wakeup seen by one worker's next loop still wakes a worker that marked before it arrived."""
+        seen_a = self.consumer.mark()           # воркер A: перевіряє чергу
+        self.producer.notify()
+        await asyncio.sleep(0.2)
+        seen_b = self.consumer.mark()           # воркер B: новий цикл уже після сповіщення
+        self.assertFalse(await self.consumer.wait(0.05, since=seen_b))
+        started = time.perf_counter()
+        self.assertTrue(await self.consumer.wait(5, since=seen_a))
+        self.assertLess(time.perf_counter() - started, 0.05)
+
+    async def test_disabled_notifier_is_noop(self):
+        """Verify port 0 disables both sending and listening."""
+        disabled = QueueNotifier("127.0.0.1", 0)
+        disabled.notify()
+        self.assertFalse(await disabled.start_listener())
+        self.assertEqual(disabled.sent, 0)
+
+    async def test_enqueue_download_persists_and_notifies(self):
+        """Verify enqueue_download commits the task, routed to its donor, before ringing the userbot."""
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'q.db')}", echo=False)
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            SessionLocal = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+            try:
+                with patch("bot.utils.queue_manager.AsyncSessionLocal", SessionLocal), \
+                     patch("bot.utils.queue_manager.queue_notifier", self.producer):
+                    task_id = await enqueue_download(-100, 42, "https://www.tiktok.com/@x/video/1")
+                    self.assertTrue(await self.consumer.wait(5))
+
+                async with SessionLocal() as session:
+                    task = (await session.execute(select(DownloadQueue))).scalar_one()
+                self.assertEqual((task.id, task.status, task.message_id), (task_id, "pending", 42))
+                self.assertEqual(task.donor, "SaveAsBot")
+            finally:
+                await engine.dispose()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+import os
+import tempfile
+from unittest.mock import AsyncMock, MagicMock, patch
+
+os.environ["BOT_TOKEN"] = "123456:TEST_TOKEN"
+os.environ["ENCRYPTION_KEY"] = "8Z6wY6uP04B4uE6_7V8M3aQ1bC2dE3fG4hI5jK6lM7o="
+os.environ["ADMIN_IDS"] = "111,222"
+
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
+from bot.database.models import Base, User, APIKey
+from bot.utils.settings_cache import SettingsCache, settings_cache
+from bot.handlers.common import get_user_model_settings, update_user_language
+from bot.handlers.settings import update_setting, delete_key
+
+class TestSettingsCacheUnit(unittest.TestCase):
+    def test_hit_miss_counters_and_copy(self):
+        """Verify hit/miss counters and that callers get an isolated copy."""
+        cache = SettingsCache(ttl_seconds=60, max_size=10)
+        self.assertIsNone(cache.get(1))
+        cache.set(1, {"model": "a"})
+        value = cache.get(1)
+        self.assertEqual(value, {"model": "a"})
+        value["model"] = "mutated"
+        self.assertEqual(cache.get(1), {"model": "a"})
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_nested_values_are_not_shared(self):
+        """Verify mutating a nested list from get() or the dict passed to set() does not leak into the cache."""
+        cache = SettingsCache(ttl_seconds=60, max_size=10)
+        original = {"transcription_keywords": ["API"]}
+        cache.set(1, original)
+        original["transcription_keywords"].append("set-side")
+
+        value = cache.get(1)
+        value["transcription_keywords"].append("SQLite")
+        self.assertEqual(cache.get(1), {"transcription_keywords": ["API"]})
+
+    def test_ttl_expiry(self):
+        """Verify entries expire after TTL."""
+        cache = SettingsCache(ttl_seconds=10, max_size=10)
+        with patch("bot.utils.settings_cache.time.monotonic", return_value=100.0):
+            cache.set(1, {"x": 1})
+        with patch("bot.utils.settings_cache.time.monotonic", return_value=105.0):
+            self.assertIsNotNone(cache.get(1))
+        with patch("bot.utils.settings_cache.time.monotonic", return_value=111.0):
+            self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.stats()["size"], 0)
+
+    def test_lru_eviction(self):
+        """Verify least recently used entry is evicted when max_size is exceeded."""
+        cache = SettingsCache(ttl_seconds=60, max_size=2)
+        cache.set(1, {})
+        cache.set(2, {})
+        cache.get(1)
+        cache.set(3, {})
+        self.assertIsNotNone(cache.get(1))
+        self.assertIsNone(cache.get(2))
+        self.assertIsNotNone(cache.get(3))
+
+class TestSettingsCacheIntegration(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.temp_db = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        self.temp_db.close()
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{self.temp_db.name}", echo=False)
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.SessionLocal = async_sessionmaker(self.engine, expire_on_commit=False, class_=AsyncSession)
+
+        self.patchers = [
+            patch("bot.handlers.common.AsyncSessionLocal", self.SessionLocal),
+            patch("bot.handlers.settings.AsyncSessionLocal", self.SessionLocal),
+        ]
+        for p in self.patchers:
+            p.start()
+        settings_cache.clear()
+
+    async def asyncTearDown(self):
+        for p in self.patchers:
+            p.stop()
+        await self.engine.dispose()
+        if os.path.exists(self.temp_db.name):
+            try:
+                os.remove(self.temp_db.name)
+            except:
+                pass
+
+    async def test_second_call_served_from_cache(self):
+        """Verify repeated lookups do not open a DB session."""
+        async with self.SessionLocal() as session:
+            session.add(User(id=-100500, settings={"model": "gpt-4o-mini", "language": "en"}))
+            await session.commit()
+
+        first = await get_user_model_settings(-100500)
+        self.assertEqual(first["language"], "en")
+
+        with patch("bot.handlers.common.AsyncSessionLocal", side_effect=AssertionError("DB must not be hit")):
+            second = await get_user_model_settings(-100500)
+        self.assertEqual(second, first)
+
+    async def test_update_setting_and_language_invalidate(self):
+        """Verify update_setting and update_user_language drop the cached entry."""
+        async with self.SessionLocal() as session:
+            session.add(User(id=-100501, settings={"model": "gpt-4o-mini", "language": "uk"}))
+            await session.commit()
+
+        await get_user_model_settings(-100501)
+        await update_setting(-100501, "model", "gpt-4o")
+        self.assertEqual((await get_user_model_settings(-100501))["model"], "gpt-4o")
+
+        await update_user_language(-100501, "en")
+        self.assertEqual((await get_user_model_settings(-100501))["language"], "en")
+
+    async def test_key_delete_invalidates_allow_search(self):
+        """Verify deleting an API key invalidates the cached allow_search flag."""
+        async with self.SessionLocal() as session:
+            session.add(User(id=333, settings={"allow_search": False}))
+            await session.flush()
+            session.add(APIKey(user_id=333, provider="openai", encrypted_key="x", is_active=True))
+            await session.commit()
+
+        self.assertTrue((await get_user_model_settings(333))["allow_search"])
+
+        update = MagicMock()
+        update.effective_user.id = 333
+        update.effective_chat.type = "private"
+        update.callback_query.data = "del_key_openai"
+        update.callback_query.answer = AsyncMock()
+        update.callback_query.edit_message_text = AsyncMock()
+        await delete_key(update, MagicMock())
+
+        self.assertFalse((await get_user_model_settings(333))["allow_search"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import os
+import tempfile
+from unittest.mock import patch
+
+os.environ["BOT_TOKEN"] = "123456:TEST_TOKEN"
+os.environ["ENCRYPTION_KEY"] = "8Z6wY6uP04B4uE6_7V8M3aQ1bC2dE3fG4hI5jK6lM7o="
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+from bot.database import session as session_module
+from bot.database.session import SQLITE_PRAGMA_PROFILES, resolve_pragma_profile, attach_sqlite_pragmas, run_sqlite_maintenance
+
+class TestSQLitePragmaProfile(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "profile.db")
+        self.engine = create_async_engine(f"sqlite+aiosqlite:///{self.db_path}", echo=False)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+        self.tmp_dir.cleanup()
+
+    def test_unknown_profile_falls_back_to_balanced(self):
+        """Verify an unknown profile name resolves to the balanced profile."""
+        self.assertIs(resolve_pragma_profile("turbo"), SQLITE_PRAGMA_PROFILES["balanced"])
+        self.assertIs(resolve_pragma_profile("safe"), SQLITE_PRAGMA_PROFILES["safe"])
+
+    async def test_pragmas_applied_to_every_pooled_connection(self):
+        """Verify the connect hook configures each new pooled connection, not just the first one."""
+        profile = SQLITE_PRAGMA_PROFILES["performance"]
+        attach_sqlite_pragmas(self.engine, profile)
+
+        async with self.engine.connect() as first, self.engine.connect() as second:
+            for conn in (first, second):
+                self.assertEqual((await conn.execute(text("PRAGMA journal_mode"))).scalar(), "wal")
+                self.assertEqual((await conn.execute(text("PRAGMA busy_timeout"))).scalar(), profile["busy_timeout"])
+                self.assertEqual((await conn.execute(text("PRAGMA cache_size"))).scalar(), profile["cache_size"])
+                self.assertEqual((await conn.execute(text("PRAGMA temp_store"))).scalar(), 2)  # MEMORY
+                self.assertEqual((await conn.execute(text("PRAGMA synchronous"))).scalar(), 1)  # NORMAL
+
+    async def test_maintenance_truncates_wal(self):
+        """Verify periodic maintenance checkpoints the WAL and records its result."""
+        attach_sqlite_pragmas(self.engine, SQLITE_PRAGMA_PROFILES["balanced"])
+        async with self.engine.begin() as conn:
+            await conn.execute(text("CREATE TABLE t (x INTEGER)"))
+            for i in range(50):
+                await conn.execute(text("INSERT INTO t VALUES (:x)"), {"x": i})
+
+        with patch.object(session_module, "engine", self.engine):
+            result = await run_sqlite_maintenance()
+
+        self.assertEqual(result["busy"], 0)
+        self.assertIs(session_module.last_maintenance, result)
+        self.assertEqual(os.path.getsize(self.db_path + "-wal"), 0)
+
+if __name__ == "__main__":
+    unittest.main()
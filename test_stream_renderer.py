@@ -0,0 +1,137 @@
+import unittest
+import asyncio
+import os
+import time
+
+os.environ["BOT_TOKEN"] = "123456:TEST_TOKEN"
+os.environ["ENCRYPTION_KEY"] = "8Z6wY6uP04B4uE6_7V8M3aQ1bC2dE3fG4hI5jK6lM7o="
+
+from telegram.error import RetryAfter
+from bot.utils.stream_renderer import ChatEditLimiter, RendererStats, StreamRenderer
+
+class FakeMessage:
+    """Повідомлення, що записує правки; flood_first — перша правка отримує RetryAfter."""
+
+    def __init__(self, chat_id=1, latency=0.005, flood_first=None):
+        self.chat_id = chat_id
+        self.latency = latency
+        self.flood_first = flood_first
+        self.calls = []
+        self.edits = []
+
+    async def edit_text(self, text, **kwargs):
+        self.calls.append(time.monotonic())
+        await asyncio.sleep(self.latency)
+        if self.flood_first is not None:
+            seconds, self.flood_first = self.flood_first, None
+            raise RetryAfter(seconds)
+        self.edits.append((time.monotonic(), text))
+
+async def fast_model(chunks=300, size=8, delay=0.003):
+    for _ in range(chunks):
+        await asyncio.sleep(delay)
+        yield "x" * size
+
+async def legacy_stream(message, chunks):
+    """Стара політика: правка кожні 80 символів, послідовно в циклі генерації."""
+    full, last = "", 0
+    async for chunk in chunks:
+        full += chunk
+        if len(full) - last > 80:
+            try:
+                await message.edit_text(full + " ▌")
+                last = len(full)
+            except Exception:
+                pass
+    return full
+
+class TestStreamRenderer(unittest.IsolatedAsyncioTestCase):
+    def _renderer(self, message, limiter=None, interval=0.1):
+        limiter = limiter or ChatEditLimiter(private_per_minute=6000, group_per_minute=6000)
+        return StreamRenderer(message, limiter=limiter, min_interval=interval, stats=RendererStats())
+
+    async def test_fewer_edits_same_first_paint(self):
+        """Verify a fast stream is coalesced into far fewer edits without a later first paint."""
+        legacy_msg = FakeMessage()
+        start = time.monotonic()
+        await legacy_stream(legacy_msg, fast_model())
+        legacy_first = legacy_msg.edits[0][0] - start
+
+        msg = FakeMessage()
+        renderer = self._renderer(msg)
+        start = time.monotonic()
+        full = ""
+        async for chunk in fast_model():
+            full += chunk
+            renderer.update(full)
+        stream_end = time.monotonic()
+        await renderer.finish()
+        first = msg.edits[0][0] - start
+
+        self.assertGreaterEqual(len(legacy_msg.edits), 25)
+        self.assertLess(len(msg.edits), len(legacy_msg.edits) / 2)
+        self.assertLessEqual(first, legacy_first + 0.01)
+        self.assertEqual(renderer.edits, len(msg.edits))
+        self.assertGreater(renderer.updates, renderer.edits)
+        # Останній проміжний стан відстає від генерації не більше ніж на інтервал
+        self.assertLess(stream_end - msg.edits[-1][0], 0.1 + 0.05)
+        gaps = [b[0] - a[0] for a, b in zip(msg.edits, msg.edits[1:])]
+        self.assertGreaterEqual(min(gaps), 0.1 - 0.01)
+
+    async def test_flood_wait_pauses_chat_and_backs_off(self):
+        """Verify RetryAfter blocks further edits for its duration and doubles the cadence."""
+        msg = FakeMessage(flood_first=1)
+        renderer = self._renderer(msg)
+        renderer.update("a")
+        await asyncio.sleep(0.02)
+        self.assertEqual(renderer.flood_waits, 1)
+        self.assertAlmostEqual(renderer.interval, 0.2)
+
+        renderer.update("ab")
+        await asyncio.sleep(0.5)
+        self.assertEqual(len(msg.calls), 1)
+        await asyncio.sleep(0.6)
+        self.assertEqual(len(msg.calls), 2)
+        self.assertGreaterEqual(msg.calls[1] - msg.calls[0], 1.0)
+        self.assertEqual(msg.edits[-1][1], "ab ▌")
+        await renderer.finish()
+
+    async def test_concurrent_streams_share_group_budget(self):
+        """Verify two streams in one group together stay within the chat's edit budget."""
+        limiter = ChatEditLimiter(private_per_minute=6000, group_per_minute=600, burst=3)
+        first, second = FakeMessage(chat_id=-100), FakeMessage(chat_id=-100)
+
+        async def run_stream(message):
+            renderer = self._renderer(message, limiter=limiter, interval=0.01)
+            full = ""
+            async for chunk in fast_model(chunks=100, delay=0.01):
+                full += chunk
+                renderer.update(full)
+            await renderer.finish()
+
+        start = time.monotonic()
+        await asyncio.gather(run_stream(first), run_stream(second))
+        elapsed = time.monotonic() - start
+        total = len(first.calls) + len(second.calls)
+        # 10 правок/с на чат + burst, а не по 100 на кожен стрім
+        self.assertLessEqual(total, 3 + int(elapsed * 10) + 1)
+        self.assertGreaterEqual(min(len(first.calls), len(second.calls)), 1)
+
+    async def test_finish_stops_pending_edits(self):
+        """Verify no intermediate edit lands after finish() and the stream is counted."""
+        msg = FakeMessage()
+        stats = RendererStats()
+        renderer = StreamRenderer(msg, limiter=ChatEditLimiter(6000, 6000), min_interval=0.2, stats=stats)
+        renderer.update("a")
+        await asyncio.sleep(0.02)
+        renderer.update("ab")
+        await renderer.finish()
+        renderer.update("abc")
+        await asyncio.sleep(0.3)
+
+        self.assertEqual([text for _, text in msg.edits], ["a ▌"])
+        self.assertEqual(stats.stats()["responses"], 1)
+        self.assertEqual(stats.stats()["coalesced"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
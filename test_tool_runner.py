@@ -0,0 +1,118 @@
+import unittest
+import asyncio
+import os
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+os.environ["BOT_TOKEN"] = "123456:TEST_TOKEN"
+os.environ["ENCRYPTION_KEY"] = "8Z6wY6uP04B4uE6_7V8M3aQ1bC2dE3fG4hI5jK6lM7o="
+
+from bot.ai.tool_runner import ToolRunStats, run_tool_calls
+from bot.ai.openai_provider import OpenAIProvider
+
+def call(name, delay, value=None):
+    return {"id": f"call_{name}_{value}", "name": name, "delay": delay, "value": value}
+
+class Recorder:
+    """Виконавець інструментів: спить call["delay"] і записує початок/кінець кожного виклику."""
+
+    def __init__(self):
+        self.events = []
+
+    async def __call__(self, tc):
+        self.events.append(("start", tc["value"]))
+        await asyncio.sleep(tc["delay"])
+        self.events.append(("end", tc["value"]))
+        if tc["value"] == "boom":
+            raise ValueError("boom")
+        return tc["value"]
+
+def on_error(tc, error):
+    return f"ERROR: {error}"
+
+class TestRunToolCalls(unittest.IsolatedAsyncioTestCase):
+    async def test_independent_calls_run_concurrently_in_order(self):
+        """Verify three 0.2s searches take about 0.2s and results keep the model's order."""
+        stats = ToolRunStats()
+        calls = [call("web_search", 0.2, "a"), call("web_search", 0.05, "b"), call("calculate_date", 0.1, "c")]
+        start = time.perf_counter()
+        results = await run_tool_calls(calls, Recorder(), on_error, timeout=5, stats=stats)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(results, ["a", "b", "c"])
+        self.assertLess(elapsed, 0.3)
+        s = stats.stats()
+        self.assertEqual((s["calls"], s["batches"], s["parallel_batches"]), (3, 1, 1))
+        self.assertGreater(s["saved_ms"], 100)
+
+    async def test_reminder_tools_stay_sequential(self):
+        """Verify state-changing tools do not overlap and run in the model's order, alongside a search."""
+        recorder = Recorder()
+        calls = [call("delete_reminder", 0.05, "d"), call("web_search", 0.1, "s"), call("schedule_reminder", 0.01, "r")]
+        results = await run_tool_calls(calls, recorder, on_error, timeout=5, stats=ToolRunStats())
+
+        self.assertEqual(results, ["d", "s", "r"])
+        reminder_events = [e for e in recorder.events if e[1] in ("d", "r")]
+        self.assertEqual(reminder_events, [("start", "d"), ("end", "d"), ("start", "r"), ("end", "r")])
+        self.assertLess(recorder.events.index(("start", "s")), recorder.events.index(("end", "d")))
+
+    async def test_timeout_and_error_do_not_break_other_calls(self):
+        """Verify a slow call times out and a failing one errors, while the rest still return."""
+        stats = ToolRunStats()
+        calls = [call("web_search", 1.0, "slow"), call("web_search", 0.01, "boom"), call("calculate_date", 0.01, "ok")]
+        start = time.perf_counter()
+        results = await run_tool_calls(calls, Recorder(), on_error, timeout=0.1, stats=stats)
+
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual(results, ["ERROR: timeout after 0.1s", "ERROR: boom", "ok"])
+        self.assertEqual((stats.timeouts, stats.errors), (1, 1))
+
+class TestProviderToolLoop(unittest.IsolatedAsyncioTestCase):
+    def _tool_chunk(self, index, name, arguments):
+        fn = MagicMock()
+        fn.name = name
+        fn.arguments = arguments
+        tc = MagicMock(index=index, id=f"call_{index}", function=fn)
+        chunk = MagicMock()
+        chunk.choices = [MagicMock(delta=MagicMock(tool_calls=[tc], content=None))]
+        return chunk
+
+    async def test_openai_searches_of_one_turn_run_concurrently(self):
+        """Verify OpenAIProvider runs two searches of one turn together and appends tool messages in order."""
+        provider = OpenAIProvider(api_key="test-key")
+        final = MagicMock()
+        final.choices = [MagicMock(delta=MagicMock(tool_calls=None, content="Готово"))]
+
+        async def stream(chunks):
+            for chunk in chunks:
+                yield chunk
+
+        sent_messages = []
+
+        async def create(**kwargs):
+            sent_messages.append([dict(m) for m in kwargs["messages"]])
+            if len(sent_messages) == 1:
+                return stream([self._tool_chunk(0, "web_search", '{"query": "a"}'),
+                               self._tool_chunk(1, "web_search", '{"query": "b"}')])
+            return stream([final])
+
+        async def slow_search(query):
+            await asyncio.sleep(0.2)
+            return f"LINK: https://{query}.example\nDETAILS: {query}"
+
+        provider.client.chat.completions.create = create
+        with patch("bot.ai.openai_provider.perform_search", AsyncMock(side_effect=slow_search)):
+            start = time.perf_counter()
+            chunks = [c async for c in provider.generate_stream([{"role": "user", "content": "q"}], {"allow_search": True})]
+            elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 0.35)
+        self.assertEqual(chunks.count("\n🔎 <i>Шукаю...</i>\n"), 1)
+        self.assertIn("Готово", chunks)
+        tool_messages = [m for m in sent_messages[1] if m["role"] == "tool"]
+        self.assertEqual([m["tool_call_id"] for m in tool_messages], ["call_0", "call_1"])
+        self.assertIn("https://a.example", tool_messages[0]["content"])
+        self.assertIn("https://b.example", tool_messages[1]["content"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import os
+import tempfile
+import tracemalloc
+
+os.environ["BOT_TOKEN"] = "123456:TEST_TOKEN"
+os.environ["ENCRYPTION_KEY"] = "8Z6wY6uP04B4uE6_7V8M3aQ1bC2dE3fG4hI5jK6lM7o="
+
+import httpx
+from telegram.request import RequestData
+from telegram.request._requestparameter import RequestParameter
+from bot.utils.media import staged_upload
+
+FILE_SIZE = 24 * 1024 * 1024
+
+class TestStagedUpload(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "clip.mp4")
+        with open(self.path, "wb") as f:
+            for _ in range(FILE_SIZE // (1024 * 1024)):
+                f.write(os.urandom(1024 * 1024))
+
+    async def asyncTearDown(self):
+        self.tmp.cleanup()
+
+    async def test_multipart_body_is_streamed_with_constant_memory(self):
+        """Verify the PTB -> httpx multipart body is produced in small chunks without loading the file."""
+        tracemalloc.start()
+        try:
+            async with staged_upload(self.path) as upload:
+                data = RequestData([RequestParameter.from_input("video", upload)])
+                request = httpx.Request("POST", "https://api.telegram.org/botX/sendVideo", files=data.multipart_data)
+                total, largest = 0, 0
+                async for chunk in request.stream:
+                    total += len(chunk)
+                    largest = max(largest, len(chunk))
+                _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertGreater(total, FILE_SIZE)
+        self.assertLessEqual(largest, 64 * 1024)
+        self.assertLess(peak, 4 * 1024 * 1024)
+
+    async def test_file_is_closed_and_removed_even_on_error(self):
+        """Verify the handle is closed and the temp file removed when sending fails."""
+        with self.assertRaises(RuntimeError):
+            async with staged_upload(self.path) as upload:
+                handle = upload.input_file_content
+                raise RuntimeError("send failed")
+        self.assertTrue(handle.closed)
+        self.assertFalse(os.path.exists(self.path))
+
+    async def test_keep_file_when_requested(self):
+        """Verify remove=False only closes the handle."""
+        async with staged_upload(self.path, remove=False) as upload:
+            handle = upload.input_file_content
+        self.assertTrue(handle.closed)
+        self.assertTrue(os.path.exists(self.path))
+
+if __name__ == "__main__":
+    unittest.main()
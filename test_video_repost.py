@@ -15,6 +15,7 @@ from bot.handlers.common import get_user_model_settings
 from bot.handlers.settings import toggle_video_repost
 from bot.handlers.commands import video_cmd
 from bot.handlers.text import handle_text
+from bot.utils.settings_cache import settings_cache
 
 class TestVideoRepost(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self):
@@ -32,11 +33,13 @@ class TestVideoRepost(unittest.IsolatedAsyncioTestCase):
             patch("bot.handlers.commands.AsyncSessionLocal", self.SessionLocal),
             patch("bot.handlers.text.AsyncSessionLocal", self.SessionLocal),
             patch("bot.utils.helpers.AsyncSessionLocal", self.SessionLocal),
+            patch("bot.utils.queue_manager.AsyncSessionLocal", self.SessionLocal),
             patch("bot.handlers.commands.ADMIN_IDS", [111, 222]),
             patch("bot.handlers.settings.ADMIN_IDS", [111, 222]),
         ]
         for p in self.patchers:
             p.start()
+        settings_cache.clear()
 
     async def asyncTearDown(self):
         for p in self.patchers:
@@ -298,9 +301,11 @@ class TestVideoRepost(unittest.IsolatedAsyncioTestCase):
             u = await session.get(User, -100666)
             u.settings = {"video_repost": True}
             await session.commit()
+        # Пряма зміна в БД в обхід хендлерів — кеш треба скинути вручну
+        settings_cache.invalidate(-100666)
 
         await handle_text(update, context)
-        mock_direct_dl.assert_called_once_with("https://twitter.com/user/status/123456789")
+        mock_direct_dl.assert_called_once_with("https://twitter.com/user/status/123456789", chat_id=-100666)
 
 if __name__ == "__main__":
     unittest.main()
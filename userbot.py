@@ -1,12 +1,22 @@
 import asyncio
 import logging
 import os
+import socket
 import sys
 from pyrogram import Client, filters
 from pyrogram.errors import FloodWait
-from sqlalchemy.future import select
-from bot.database.session import AsyncSessionLocal
-from bot.database.models import DownloadQueue
+from bot.utils.queue_manager import (
+    claim_next_task, finish_task, release_task, dead_letter_expired_tasks, route_unassigned_tasks
+)
+from bot.utils.queue_notify import queue_notifier
+from bot.utils.donor_pool import (
+    DonorChannel, WorkerStats, parse_donor_concurrency, BOT_SAVEAS, BOT_MONKETT
+)
+from config import (
+    QUEUE_FALLBACK_POLL_SECONDS, USERBOT_DONOR_CONCURRENCY,
+    USERBOT_DONOR_MIN_INTERVAL_SECONDS, USERBOT_REPORT_INTERVAL_SECONDS, USERBOT_DONOR_TIMEOUT_SECONDS,
+    USERBOT_DONOR_SETTLE_SECONDS
+)
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -15,9 +25,7 @@ API_HASH = os.getenv("API_HASH")
 SESSION_NAME = "my_userbot"
 MAIN_BOT_USERNAME = os.getenv("MAIN_BOT_USERNAME")
 
-# Константи ботів
-BOT_SAVEAS = "SaveAsBot"
-BOT_MONKETT = "monkettbot"
+# Константи ботів (BOT_SAVEAS/BOT_MONKETT та маршрутизація посилань — у donor_pool)
 DONOR_BOTS = [BOT_SAVEAS] # ЛИШАЄМО ТІЛЬКИ ОДНОГО. Fallback буде через yt-dlp.
 
 # Логування в stdout
@@ -31,165 +39,221 @@ logger = logging.getLogger("Userbot")
 if os.path.exists("userbot.py"):
     os.chdir(os.path.dirname(os.path.abspath("userbot.py")))
 
-app = Client(SESSION_NAME, api_id=API_ID, api_hash=API_HASH, no_updates=True)
-
-def get_target_bot(link: str) -> str:
-    """Визначає, кому відправити: SaveAsBot чи Monkettbot"""
-    link = link.lower()
-    if any(d in link for d in ["twitter.com", "x.com", "9gag.com", "bsky.app"]):
-        return BOT_MONKETT
-    return BOT_SAVEAS
-
-async def process_queue():
-    logger.info(f"🚀 [Userbot] Queue Processor STARTED.")
-    logger.info(f"📬 [Userbot] Forwarding to: @{MAIN_BOT_USERNAME}")
-
-    if not MAIN_BOT_USERNAME:
-        logger.error("❌ [Userbot] MAIN_BOT_USERNAME not set in .env!")
-        return
-
-    tick = 0
-
+# Update'и увімкнені: відповіді донорів приходять push-ом (хендлер фільтрує лише чати донорів)
+app = Client(SESSION_NAME, api_id=API_ID, api_hash=API_HASH)
+
+# Ідентифікатор процесу для оренди завдань (кілька процесів можуть працювати з однією чергою)
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+MEDIA_ATTRS = ("video", "document", "photo", "animation", "audio", "voice", "video_note")
+ERR_KEYWORDS = ["error", "помилка", "не вдалося", "subscribe", "не получилось", "queue"]
+
+def is_media(msg) -> bool:
+    return any(getattr(msg, attr, None) for attr in MEDIA_ATTRS)
+
+def classify_donor_message(msg):
+    """Результат для future запиту: ([media], None) — успіх, ([], text) — помилка донора, None — проміжне повідомлення."""
+    if is_media(msg):
+        return [msg], None
+    if msg.text and any(x in msg.text.lower() for x in ERR_KEYWORDS):
+        return [], msg.text
+    return None
+
+# Паралельність та темп для кожного донора: у кожного донора стільки воркерів, скільки слотів
+DONOR_CONCURRENCY = parse_donor_concurrency(USERBOT_DONOR_CONCURRENCY, {BOT_SAVEAS: 1, BOT_MONKETT: 1})
+donors = {
+    name: DonorChannel(name, concurrency, USERBOT_DONOR_MIN_INTERVAL_SECONDS, classify=classify_donor_message)
+    for name, concurrency in DONOR_CONCURRENCY.items()
+}
+
+def parse_flood_seconds(err_str: str) -> int:
+    import re
+    m = re.search(r"FLOOD_WAIT_?(\d+)", err_str) or re.search(r"wait of (\d+) seconds", err_str, re.IGNORECASE)
+    return int(m.group(1)) if m else 10
+
+@app.on_message(filters.create(lambda _, __, m: bool(m.chat and m.chat.username in donors)) & filters.incoming)
+async def on_donor_message(client, message):
+    """Push-шлях: відповідь донора одразу резолвить future відповідного запиту."""
+    donors[message.chat.username].deliver(message)
+
+async def await_donor_response(donor: DonorChannel, sent_msg, task_id: int):
+    """
+    Чекає відповіді донора саме на наш запит. Повертає (media_messages, error_text).
+    Після першого результату добираємо решту файлів запиту (вікно USERBOT_DONOR_SETTLE_SECONDS),
+    альбоми — цілком через get_media_group (донор надсилає їх одним sendMediaGroup).
+    """
+    future = donor.expect(sent_msg.id, task_id)
+    try:
+        await asyncio.wait_for(future, USERBOT_DONOR_TIMEOUT_SECONDS)
+        results = await donor.collect(sent_msg.id, USERBOT_DONOR_SETTLE_SECONDS)
+    except asyncio.TimeoutError:
+        # Страховка від втрачених update'ів: один прохід по історії замість циклу опитування
+        results = []
+        async for msg in app.get_chat_history(donor.name, limit=8 * donor.effective_concurrency):
+            # Як і push-шлях (filters.incoming): наші запити від інших воркерів не зсувають FIFO-атрибуцію
+            if msg.outgoing:
+                continue
+            if msg.id > sent_msg.id and donor.attribute(msg) == sent_msg.id:
+                result = classify_donor_message(msg)
+                if result is not None:
+                    results.append(result)
+
+    found = {m.id: m for media, _ in results for m in media}
+    for group_id in {m.media_group_id for m in found.values() if m.media_group_id}:
+        logger.info(f"   -> Album detected, fetching media group...")
+        first = next(m for m in found.values() if m.media_group_id == group_id)
+        for m in await app.get_media_group(donor.name, first.id):
+            found.setdefault(m.id, m)
+
+    found_messages = sorted(found.values(), key=lambda m: m.id)
+    error_text = None if found_messages else next((err for _, err in results if err), None)
+    return found_messages, error_text
+
+async def handle_task(task, worker_id: str, donor: DonorChannel):
+    """Обробляє завдання донора; слот донора вже зайнятий воркером (worker_loop)."""
+    target_bot = donor.name
+    logger.info(f"📥 [Userbot] {worker_id} TAKING TASK #{task.id} (attempt {task.attempts}) -> {task.link}")
+
+    final_status = "timeout"
+    error_message = None
+
+    try:
+        # 1. Unblock & Send (з урахуванням темпу донора та FloodWait-паузи)
+        await donor.before_send()
+        try: await app.unblock_user(target_bot)
+        except: pass
+
+        sent_msg = await app.send_message(target_bot, task.link)
+
+        # 2. Wait for the donor's answer to THIS request (push через on_donor_message)
+        try:
+            found_messages, error_message = await await_donor_response(donor, sent_msg, task.id)
+        finally:
+            donor.unregister(sent_msg.id)
+
+        if found_messages:
+            final_status = "done"
+        elif error_message:
+            final_status = "failed_by_donor" # Новий статус для обробки main.py
+            logger.warning(f"❌ [Userbot] Helper bot error response: {error_message[:50]}...")
+
+        # 3. Forwarding (only on media success)
+        result_ids = []
+        if found_messages:
+            logger.info(f"✅ [Userbot] Success. Forwarding {len(found_messages)} files...")
+
+            for msg in sorted(found_messages, key=lambda x: x.id):
+                try:
+                    # Кількість файлів у підписі: бот кешує альбом, лише отримавши його цілим
+                    copied = await msg.copy(
+                        MAIN_BOT_USERNAME,
+                        caption=f"task_id:{task.id}:{len(found_messages)}"
+                    )
+                    result_ids.append(copied.id)
+                except Exception as fwd_err:
+                    logger.error(f"      -> ❌ Forward Failed: {fwd_err}")
+
+        # 4. Update Status (Finalizing): результат іде в окремі колонки, link лишається оригінальним
+        finished = await finish_task(
+            task.id, worker_id, final_status, donor=target_bot,
+            error=error_message[:1000] if error_message else None,
+            result_message_ids=result_ids or None
+        )
+        if finished:
+            logger.info(f"💾 [Userbot] Task {task.id} FINAL status: {final_status}")
+        else:
+            logger.warning(f"⚠️ [Userbot] Lease for task {task.id} was lost; result not stored.")
+
+    except FloodWait as fw:
+        wait_time = int(fw.value) if hasattr(fw, 'value') else 10
+        logger.warning(f"⚠️ [Userbot] Telegram FloodWait: {wait_time}s required for @{target_bot}.")
+        donor.flood_wait(wait_time + 1)
+        await release_task(task.id, worker_id)
+
+    except Exception as e:
+        err_str = str(e)
+        if "FLOOD_WAIT" in err_str or "wait of " in err_str.lower():
+            wait_s = parse_flood_seconds(err_str)
+            logger.warning(f"⚠️ [Userbot] Detected FloodWait {wait_s}s in generic error for @{target_bot}.")
+            donor.flood_wait(wait_s + 1)
+            await release_task(task.id, worker_id)
+        else:
+            logger.error(f"❌ [Userbot] CRITICAL TASK ERROR: {e}")
+            await finish_task(task.id, worker_id, "error", donor=target_bot, error=err_str[:1000])
+
+async def worker_loop(stats: WorkerStats, donor: DonorChannel):
+    """
+    Воркер обслуговує одного донора: спершу займає його слот і чекає кінця FloodWait-паузи,
+    лише потім бере завдання цього донора. Взяте завдання не чекає слота з уже запущеною орендою,
+    а зайнятий донор не блокує завдання інших донорів.
+    """
+    worker_id = f"{PROCESS_ID}:{stats.name}"
     while True:
         try:
+            # Покоління "дзвінка" до читання черги: сповіщення, що прийде під час claim, не загубиться
+            seen = queue_notifier.mark()
             task = None
-            async with AsyncSessionLocal() as session:
+            async with donor.slot():
+                await donor.wait_pause()
                 try:
-                    result = await session.execute(
-                        select(DownloadQueue).where(DownloadQueue.status == "pending").limit(1)
-                    )
-                    task = result.scalar_one_or_none()
-
-                    if task:
-                        task.status = "processing"
-                        await session.commit()
-                        await session.refresh(task)
-                    else:
-                        await session.commit()
-
+                    task = await claim_next_task(worker_id, donor=donor.name)
                 except Exception as db_e:
-                    logger.error(f"❌ [Userbot] DB Read Error: {db_e}")
+                    logger.error(f"❌ [Userbot] {stats.name} DB Claim Error: {db_e}")
                     await asyncio.sleep(1)
                     continue
 
-            tick += 1
-            if tick % 15 == 0 and not task:
-                logger.info(f"💓 [Userbot] Alive. Checking queue... (No tasks)")
+                if task:
+                    stats.begin()
+                    try:
+                        await handle_task(task, worker_id, donor)
+                    finally:
+                        stats.end()
+            if not task:
+                # Порожня черга: спимо до сповіщення від бота, опитування — лише як рідкий fallback
+                await queue_notifier.wait(QUEUE_FALLBACK_POLL_SECONDS, since=seen)
 
-            if task:
-                target_bot = get_target_bot(task.link)
-                logger.info(f"📥 [Userbot] TAKING TASK #{task.id} -> {task.link}")
+        except Exception as e:
+            logger.error(f"❌ [Userbot] {stats.name} GLOBAL LOOP ERROR: {e}")
+            await asyncio.sleep(5)
 
-                final_status = "timeout"
-                error_message = None
+async def report_loop(workers):
+    """Періодичний звіт: зайнятість воркерів, стан донорів, прибирання dead-letter."""
+    while True:
+        await asyncio.sleep(USERBOT_REPORT_INTERVAL_SECONDS)
+        try:
+            await dead_letter_expired_tasks()
+        except Exception as e:
+            logger.error(f"❌ [Userbot] Dead-letter sweep failed: {e}")
+        util = ", ".join(f"{w.name}={w.utilization():.0%}/{w.tasks}" for w in workers)
+        donor_info = ", ".join(
+            f"@{d.name} {d.stats()['inflight']}/{d.effective_concurrency} sent={d.sent} flood={d.flood_waits}"
+            for d in donors.values()
+        )
+        logger.info(f"💓 [Userbot] Workers: {util} | Donors: {donor_info}")
 
-                try:
-                    # 1. Unblock & Send
-                    try: await app.unblock_user(target_bot)
-                    except: pass
-
-                    sent_msg = await app.send_message(target_bot, task.link)
-
-                    response_found = False
-                    found_messages = []
-
-                    # 2. Wait Loop
-                    for i in range(15): # 30 sec max
-                        await asyncio.sleep(2)
-
-                        history = []
-                        async for msg in app.get_chat_history(target_bot, limit=8):
-                            history.append(msg)
-
-                        new_messages = [m for m in history if m.id > sent_msg.id]
-
-                        # A. Check Media (Success)
-                        media_msgs = [
-                            m for m in new_messages
-                            if m.video or m.document or m.photo or m.animation or m.audio or m.voice or m.video_note
-                        ]
-
-                        if media_msgs:
-                            logger.info(f"   -> Media detected! Gathering batch...")
-                            await asyncio.sleep(2)
-
-                            final_history = []
-                            async for msg in app.get_chat_history(target_bot, limit=10):
-                                if msg.id > sent_msg.id and (msg.video or msg.document or msg.photo or msg.animation or msg.audio or msg.voice or msg.video_note):
-                                        final_history.append(msg)
-
-                            found_messages = final_history
-                            final_status = "done"
-                            break
-
-                        # B. Check Error Text (Failure/Queue)
-                        err_keywords = ["error", "помилка", "не вдалося", "subscribe", "не получилось", "queue"]
-                        err_msgs = [m for m in new_messages if m.text and any(x in m.text.lower() for x in err_keywords)]
-                        if err_msgs:
-                            error_message = err_msgs[0].text
-                            final_status = "failed_by_donor" # Новий статус для обробки main.py
-                            logger.warning(f"❌ [Userbot] Helper bot error response: {error_message[:50]}...")
-                            break
-
-                    # 3. Forwarding (only on media success)
-                    if found_messages:
-                        logger.info(f"✅ [Userbot] Success. Forwarding {len(found_messages)} files...")
-
-                        for msg in sorted(found_messages, key=lambda x: x.id):
-                            try:
-                                await msg.copy(
-                                    MAIN_BOT_USERNAME,
-                                    caption=f"task_id:{task.id}"
-                                )
-                                response_found = True
-                            except Exception as fwd_err:
-                                logger.error(f"      -> ❌ Forward Failed: {fwd_err}")
-
-                    # 4. Update Status (Finalizing)
-                    async with AsyncSessionLocal() as session:
-                        current_task = await session.get(DownloadQueue, task.id)
-                        if current_task:
-                            current_task.status = final_status
-                            # Додаємо помилку до посилання, щоб Main Bot міг її показати
-                            if error_message:
-                                current_task.link = f"USERBOT_ERROR:{target_bot}:{error_message[:200]}###{task.link}"
-                            await session.commit()
-                            logger.info(f"💾 [Userbot] Task {task.id} FINAL status: {current_task.status}")
-
-                except FloodWait as fw:
-                    wait_time = int(fw.value) if hasattr(fw, 'value') else 10
-                    logger.warning(f"⚠️ [Userbot] Telegram FloodWait: {wait_time}s required. Pausing queue...")
-                    async with AsyncSessionLocal() as session:
-                        t = await session.get(DownloadQueue, task.id)
-                        if t:
-                            t.status = "pending"
-                            await session.commit()
-                    await asyncio.sleep(wait_time + 1)
-
-                except Exception as e:
-                    err_str = str(e)
-                    if "FLOOD_WAIT" in err_str or "wait of " in err_str.lower():
-                        import re
-                        m = re.search(r"FLOOD_WAIT_?(\d+)", err_str) or re.search(r"wait of (\d+) seconds", err_str, re.IGNORECASE)
-                        wait_s = int(m.group(1)) if m else 10
-                        logger.warning(f"⚠️ [Userbot] Detected FloodWait {wait_s}s in generic error. Pausing queue...")
-                        async with AsyncSessionLocal() as session:
-                            t = await session.get(DownloadQueue, task.id)
-                            if t:
-                                t.status = "pending"
-                                await session.commit()
-                        await asyncio.sleep(wait_s + 1)
-                    else:
-                        logger.error(f"❌ [Userbot] CRITICAL TASK ERROR: {e}")
-                        async with AsyncSessionLocal() as session:
-                            t = await session.get(DownloadQueue, task.id)
-                            if t: t.status = "error"; await session.commit()
-            else:
-                await asyncio.sleep(2)
+async def process_queue():
+    logger.info(f"🚀 [Userbot] Queue Processor STARTED.")
+    logger.info(f"📬 [Userbot] Forwarding to: @{MAIN_BOT_USERNAME}")
 
-        except Exception as e:
-            logger.error(f"❌ [Userbot] GLOBAL LOOP ERROR: {e}")
-            await asyncio.sleep(5)
+    if not MAIN_BOT_USERNAME:
+        logger.error("❌ [Userbot] MAIN_BOT_USERNAME not set in .env!")
+        return
+
+    await queue_notifier.start_listener()
+    # Завдання, що "застрягли" після падіння і вичерпали спроби, одразу йдуть у dead-letter
+    await dead_letter_expired_tasks()
+    # Завдання, поставлені до маршрутизації при enqueue, отримують донора (інакше їх ніхто не візьме)
+    await route_unassigned_tasks()
+
+    workers = [
+        (WorkerStats(f"{name}-{i}"), donor)
+        for name, donor in donors.items() for i in range(donor.concurrency)
+    ]
+    logger.info(f"👷 [Userbot] {len(workers)} workers, donors: " + ", ".join(f"@{n}x{c}" for n, c in DONOR_CONCURRENCY.items()))
+    await asyncio.gather(
+        report_loop([stats for stats, _ in workers]),
+        *(worker_loop(stats, donor) for stats, donor in workers)
+    )
 
 @app.on_message(filters.me & filters.command("ping"))
 async def ping(client, message):